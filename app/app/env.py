@@ -0,0 +1,55 @@
+"""Typed access to environment variables for the settings modules.
+
+Malformed values raise ImproperlyConfigured at startup instead of
+surfacing later as a confusing runtime error.
+"""
+import json
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('0', 'false', 'no', 'off', '')
+
+
+def env_str(name, default=None):
+    return os.environ.get(name, default)
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    if value.strip().lower() in TRUE_VALUES:
+        return True
+    if value.strip().lower() in FALSE_VALUES:
+        return False
+    raise ImproperlyConfigured('%s must be a boolean, got %r' % (name, value))
+
+
+def env_int(name, default=None):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ImproperlyConfigured('%s must be an integer, got %r' % (name, value))
+
+
+def env_list(name, default=()):
+    """Comma separated list, e.g. DJANGO_ALLOWED_HOSTS=api.example.com,localhost"""
+    value = os.environ.get(name)
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def env_json(name, default=None):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        return json.loads(value)
+    except ValueError:
+        raise ImproperlyConfigured('%s must be valid JSON, got %r' % (name, value))
@@ -1,5 +1,7 @@
 import os
 
+from .env import env_bool, env_int, env_json, env_list, env_str
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -7,12 +9,13 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # See https://docs.djangoproject.com/en/2.1/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'iaw)iuf)w$hve@+gpuiltd@$z@&%wlqe*@4&obrj7kwjf(58sj'
+SECRET_KEY = env_str('DJANGO_SECRET_KEY', 'iaw)iuf)w$hve@+gpuiltd@$z@&%wlqe*@4&obrj7kwjf(58sj')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# With DEBUG on, Django also keeps every executed query in memory per request.
+DEBUG = env_bool('DJANGO_DEBUG', False)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS', ['localhost', '127.0.0.1'])
 
 # Application definition
 
@@ -33,18 +36,22 @@ INSTALLED_APPS = [
     'core',
     'users',
     'recipe',
+    'jobs',
     'gunicorn',
 
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.AdmissionControlMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.StatementTimeoutMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -67,6 +74,27 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'app.wsgi.application'
 
+# Timeouts in milliseconds for the queries of web requests; 0 is unlimited.
+# They are connection options only where DB_WEB_TIMEOUTS is on, which
+# gunicorn.conf.py sets for the web workers, so migrations, commands and
+# jobs keep the server defaults. DB_STATEMENT_TIMEOUTS overrides the
+# statement timeout per URL name, e.g. {"recipe:recipe-list": 2000}, see
+# core.middleware.StatementTimeoutMiddleware.
+DB_STATEMENT_TIMEOUT = env_int('DB_STATEMENT_TIMEOUT', 10000)
+DB_IDLE_IN_TRANSACTION_TIMEOUT = env_int('DB_IDLE_IN_TRANSACTION_TIMEOUT', 30000)
+DB_STATEMENT_TIMEOUTS = env_json('DB_STATEMENT_TIMEOUTS', {
+    'recipe:recipe-list': 3000,
+    'recipe:recipe-stats': 5000,
+    'recipe:tag-suggest': 1000,
+    'recipe:ingredient-suggest': 1000,
+})
+DB_WEB_TIMEOUTS = env_bool('DB_WEB_TIMEOUTS', False)
+DB_OPTIONS = {'connect_timeout': env_int('DB_CONNECT_TIMEOUT', 5)}
+if DB_WEB_TIMEOUTS:
+    DB_OPTIONS['options'] = '-c statement_timeout=%d -c idle_in_transaction_session_timeout=%d' % (
+        DB_STATEMENT_TIMEOUT, DB_IDLE_IN_TRANSACTION_TIMEOUT
+    )
+
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 DATABASES = {
@@ -77,13 +105,68 @@ DATABASES = {
 
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'HOST': os.environ.get('DB_HOST'),
-        'PORT': os.environ.get('DB_PORT'),
-        'NAME': os.environ.get('DB_NAME'),
-        'USER': os.environ.get('DB_USER'),
-        'PASSWORD': os.environ.get('DB_PASSWORD'),
+        'HOST': env_str('DB_HOST'),
+        'PORT': env_str('DB_PORT'),
+        'NAME': env_str('DB_NAME'),
+        'USER': env_str('DB_USER'),
+        'PASSWORD': env_str('DB_PASSWORD'),
+        'CONN_MAX_AGE': env_int('DB_CONN_MAX_AGE', 60),
+        'OPTIONS': DB_OPTIONS,
     }
 }
+
+# Extra databases holding user data, e.g. {"shard1": {"HOST": "db-shard1"}};
+# unset keys are taken from default. See core.shards and core.routers.
+for alias, overrides in env_json('DB_SHARDS', {}).items():
+    DATABASES[alias] = dict(DATABASES['default'], **overrides)
+DATABASE_ROUTERS = ['core.routers.ShardRouter']
+# Append only: the position of a shard sets its primary key range.
+DATABASE_SHARDS = list(DATABASES)
+DATABASE_SHARDS_FOR_NEW_USERS = env_list('DB_SHARDS_FOR_NEW_USERS', DATABASE_SHARDS)
+DATABASE_SHARD_ID_SPAN = 10 ** 8
+
+CACHES = {
+    'default': {
+        'BACKEND': env_str('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': env_str('CACHE_LOCATION', ''),
+    }
+}
+
+# Logging, see core.logs
+# Records are JSON encoded and written to stdout by a background thread.
+LOG_LEVEL = env_str('LOG_LEVEL', 'INFO')
+# Fraction of the records below WARNING kept per logger, e.g. {'recipe.views': 0.01}
+LOG_SAMPLING_RATES = env_json('LOG_SAMPLING_RATES', {})
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'core.logs.JSONFormatter'},
+    },
+    'filters': {
+        'sampling': {'()': 'core.logs.SamplingFilter', 'rates': LOG_SAMPLING_RATES},
+    },
+    'handlers': {
+        'queue': {
+            'class': 'core.logs.BackgroundQueueHandler',
+            'formatter': 'json',
+            'filters': ['sampling'],
+            'stream': 'ext://sys.stdout',
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': 'WARNING'},
+    'loggers': {
+        'django': {'handlers': ['queue'], 'level': 'INFO', 'propagate': False},
+        # 4xx responses are already in the access log, only keep server errors.
+        'django.request': {'handlers': ['queue'], 'level': 'ERROR', 'propagate': False},
+        'core': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+        'recipe': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+        'users': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+        'jobs': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -120,6 +203,114 @@ MEDIA_URL = "/media/"
 MEDIA_ROOT = "/vo//web/media"
 STATIC_ROOT = "/vo//web/static"
 
+# Media serving, see core.media
+# Uploaded recipe images are uuid named and never rewritten, so they can be cached forever.
+MEDIA_IMMUTABLE_PREFIXES = ('uploads/',)
+MEDIA_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+MEDIA_MAX_AGE = 60 * 60
+MEDIA_BLOCK_SIZE = 64 * 1024
+# Delegate the file transfer to the front proxy, e.g. '/protected-media/' for nginx
+MEDIA_ACCEL_REDIRECT_PREFIX = env_str('MEDIA_ACCEL_REDIRECT_PREFIX')
+# Header name for Apache/lighttpd style delegation, e.g. 'X-Sendfile'
+MEDIA_SENDFILE_HEADER = env_str('MEDIA_SENDFILE_HEADER')
+
+# Recipe image uploads, see recipe.upload_handlers
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = 5 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+RECIPE_IMAGE_HEADER_PROBE_SIZE = 64 * 1024
+
+# Recipe detail response cache, see recipe.cache
+RECIPE_CACHE_ALIAS = 'default'
+RECIPE_CACHE_LOCAL_SIZE = 2048
+RECIPE_CACHE_TIMEOUT = 60 * 10
+
+# Most recipes fetched by one `?ids=` multi-get, see recipe.views
+RECIPE_MULTI_GET_MAX_IDS = 100
+
+# Similar recipes by shared tags and ingredients, see recipe.similar
+RECIPE_SIMILAR_LIMIT = 10
+RECIPE_SIMILAR_MAX_LIMIT = 50
+# Users whose similarity index is kept in memory, per process
+RECIPE_SIMILAR_INDEX_USERS = 64
+
+# Recipes cookable from a pantry of ingredients, see recipe.pantry
+RECIPE_COOKABLE_LIMIT = 50
+RECIPE_COOKABLE_MAX_LIMIT = 200
+RECIPE_COOKABLE_MAX_MISSING = 5
+# Users whose ingredient bitsets are kept in memory, per process
+RECIPE_PANTRY_INDEX_USERS = 64
+
+# Longest a read waits for the identical one already running before it
+# computes its own response, see recipe.views.CoalescedReadsMixin
+RECIPE_COALESCE_TIMEOUT = 2.0
+
+# Tag/ingredient name autocomplete, see recipe.suggest
+RECIPE_SUGGEST_LIMIT = 10
+RECIPE_SUGGEST_MAX_LIMIT = 50
+RECIPE_SUGGEST_CACHE_SIZE = 4096
+
+# Response compression, see core.compression. HTML is left out: admin
+# pages carry CSRF tokens, which compression would expose to BREACH.
+COMPRESSION_MIN_SIZE = env_int('COMPRESSION_MIN_SIZE', 1024)
+COMPRESSION_GZIP_LEVEL = env_int('COMPRESSION_GZIP_LEVEL', 6)
+COMPRESSION_BROTLI_QUALITY = env_int('COMPRESSION_BROTLI_QUALITY', 4)
+COMPRESSION_CONTENT_TYPES = ('application/json', 'application/msgpack')
+
+# JSON or MessagePack, see core.formats
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'core.formats.MessagePackRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'core.formats.MessagePackParser',
+    ),
+}
+
+# Admission control, see core.middleware.AdmissionControlMiddleware. Limits
+# are per worker process: size them to the threads (or greenlets) of a worker.
+ADMISSION_MAX_IN_FLIGHT = env_int('ADMISSION_MAX_IN_FLIGHT', 8)
+ADMISSION_MAX_IN_FLIGHT_PER_USER = env_int('ADMISSION_MAX_IN_FLIGHT_PER_USER', 2)
+# Priority classes, served first to last, with the longest a request may
+# queue in seconds before it is shed.
+ADMISSION_CLASSES = (
+    ('read', 0.5),
+    ('write', 1.0),
+    ('bulk', 3.0),
+)
+ADMISSION_ROUTE_CLASSES = {
+    'recipe:recipe-upload-image': 'bulk',
+    'recipe:recipe-stats': 'bulk',
+    'batch': 'bulk',
+    # Never queued: needed to see what is going on under load.
+    'metrics': None,
+    'media': None,
+}
+ADMISSION_EXEMPT_NAMESPACES = ('admin',)
+
+# Batch endpoint, see core.batch
+BATCH_MAX_OPERATIONS = 20
+BATCH_ALLOWED_PREFIXES = ('/api/recipe/', '/api/user/')
+
+# Admin changelists show the planner's row estimate above this many rows, see core.admin
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+
+# Background jobs, see jobs.queue
+JOBS_WORKER_PROCESSES = env_int('JOBS_WORKER_PROCESSES', 2)
+JOBS_POLL_INTERVAL = 1
+JOBS_MAX_ATTEMPTS = 5
+# A running job not finished within this many seconds is handed to another worker
+JOBS_VISIBILITY_TIMEOUT = 60 * 5
+JOBS_RETRY_BACKOFF = 5
+JOBS_RETRY_BACKOFF_MAX = 60 * 60
+
+# Rows deleted per statement when purging a deleted account, see users.purge
+USER_PURGE_BATCH_SIZE = 1000
+
 # STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 AUTH_USER_MODEL = 'core.User'
 
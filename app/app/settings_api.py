@@ -0,0 +1,47 @@
+"""API-only settings profile for the gunicorn web workers.
+
+The API authenticates with tokens and renders JSON, so the admin,
+sessions, messages, staticfiles and CSRF machinery are dropped to cut
+import time and per request middleware. Serve the admin from a separate
+process using the full `app.settings` profile.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK
+
+API_UNUSED_APPS = (
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'gunicorn',
+)
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in API_UNUSED_APPS]
+
+API_UNUSED_MIDDLEWARE = (
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+)
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in API_UNUSED_MIDDLEWARE]
+
+ROOT_URLCONF = 'app.urls_api'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {'context_processors': []},
+    },
+]
+
+REST_FRAMEWORK = dict(
+    REST_FRAMEWORK,
+    DEFAULT_AUTHENTICATION_CLASSES=('rest_framework.authentication.TokenAuthentication',),
+    DEFAULT_RENDERER_CLASSES=tuple(
+        renderer for renderer in REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']
+        if renderer != 'rest_framework.renderers.BrowsableAPIRenderer'
+    ),
+)
@@ -0,0 +1,15 @@
+"""Settings profile with two SQLite shards, for the sharding tests:
+
+    python manage.py test --settings app.settings_shards_test
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(BASE_DIR, 'db.sqlite3')},
+    'shard1': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(BASE_DIR, 'db_shard1.sqlite3')},
+}
+DATABASE_SHARDS = list(DATABASES)
+DATABASE_SHARDS_FOR_NEW_USERS = DATABASE_SHARDS
@@ -0,0 +1,14 @@
+"""API URL configuration, without the admin; used by `app.settings_api`"""
+from core import media
+from core.batch import BatchView
+from core.views import MetricsView
+from django.conf import settings
+from django.urls import path, include, re_path
+
+urlpatterns = [
+    path('api/user/', include('users.urls')),
+    path('api/recipe/', include('recipe.urls')),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
+    path('api/batch/', BatchView.as_view(), name='batch'),
+    re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), media.serve, name='media'),
+]
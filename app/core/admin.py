@@ -1,8 +1,15 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.widgets import ManyToManyRawIdWidget
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models.functions import Lower
+from django.utils.functional import cached_property
 from django.utils.translation import gettext as _
 
 from .models import User, Tag, Ingredient, Recipe
+from .shards import shard_of_user, using_shard
 
 
 class UserAdmin(BaseUserAdmin):
@@ -22,7 +29,174 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class EstimatedCountPaginator(Paginator):
+    """Use the planner's row estimate instead of COUNT(*) for large unfiltered tables"""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        db = queryset.db
+        if not queryset.query.where and connections[db].vendor == 'postgresql':
+            with connections[db].cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                               [connections[db].ops.quote_name(queryset.model._meta.db_table)])
+                row = cursor.fetchone()
+            if row and row[0] > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return int(row[0])
+        return super().count
+
+
+class UserFilter(admin.SimpleListFilter):
+    """Filter by owner id without listing every user in the sidebar"""
+    title = _('user')
+    parameter_name = 'user_id'
+
+    def lookups(self, request, model_admin):
+        user_id = self.value()
+        if not user_id or not user_id.isdigit():
+            return ()
+        user = User.objects.filter(pk=user_id).only('email').first()
+        return ((user_id, user.email if user else user_id),)
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.using(shard_of_user(self.value())).filter(user_id=self.value())
+        return queryset
+
+
+class ShardFilter(admin.SimpleListFilter):
+    """Browse the rows of one database shard, hidden without sharding.
+
+    Rows on different shards cannot be listed together, so there is no
+    "All" choice: the first shard is shown until another one is picked.
+    Picking a user, or searching by email, shows that user's shard.
+    """
+    title = _('shard')
+    parameter_name = 'shard'
+
+    def __init__(self, request, params, model, model_admin):
+        # Runs before UserFilter, which still finds its parameter in params.
+        self.owner_selected = bool(params.get(UserFilter.parameter_name)) or '@' in request.GET.get('q', '')
+        super().__init__(request, params, model, model_admin)
+
+    def lookups(self, request, model_admin):
+        if len(settings.DATABASE_SHARDS) == 1:
+            return ()
+        return [(alias, alias) for alias in settings.DATABASE_SHARDS]
+
+    def value(self):
+        value = super().value()
+        if value is None and not self.owner_selected and len(settings.DATABASE_SHARDS) > 1:
+            return settings.DATABASE_SHARDS[0]
+        return value
+
+    def choices(self, changelist):
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': self.value() == alias,
+                'query_string': changelist.get_query_string({self.parameter_name: alias}, []),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        if self.value() in settings.DATABASE_SHARDS:
+            return queryset.using(self.value())
+        return queryset
+
+
+class UserScopedManyToManyRawIdWidget(ManyToManyRawIdWidget):
+    """Raw id widget whose lookup popup only lists the objects of one user"""
+
+    def __init__(self, rel, admin_site, user_id, **kwargs):
+        super().__init__(rel, admin_site, **kwargs)
+        self.user_id = user_id
+
+    def url_parameters(self):
+        params = super().url_parameters()
+        params[UserFilter.parameter_name] = self.user_id
+        return params
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings that stay fast with millions of rows"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ('user',)
+    # The owner filter goes last so it can move the query to the owner's shard.
+    list_filter = (ShardFilter, UserFilter)
+    raw_id_fields = ('user',)
+    search_field = 'name'
+
+    def get_list_select_related(self, request):
+        # Users only exist on default, a join on another shard finds no rows.
+        return self.list_select_related if len(settings.DATABASE_SHARDS) == 1 else ()
+
+    def get_object(self, request, object_id, from_field=None):
+        """Look the object up on every shard; primary key ranges do not overlap"""
+        for alias in settings.DATABASE_SHARDS:
+            with using_shard(alias):
+                obj = super().get_object(request, object_id, from_field)
+            if obj is not None:
+                return obj
+        return None
+
+    def get_search_results(self, request, queryset, search_term):
+        """Search by owner email, or by name prefix.
+
+        An email narrows the rows to one user on their shard. A prefix is
+        matched across all users through the pattern indexes of migration
+        0008, which lead with the searched column.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if '@' in search_term:
+            user = User.objects.filter(email=search_term).only('shard').first()
+            if user is None:
+                return queryset.none(), False
+            return queryset.using(user.shard).filter(user_id=user.pk), False
+        return self.search_prefix(queryset, search_term), False
+
+    def search_prefix(self, queryset, prefix):
+        # Matches the LOWER(name) text_pattern_ops index.
+        return queryset.annotate(search_name=Lower(self.search_field)).filter(search_name__startswith=prefix.lower())
+
+    def get_search_fields(self, request):
+        # Non empty so the changelist shows the search box.
+        return (self.search_field,)
+
+
+@admin.register(Tag, Ingredient)
+class UserNamedAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'user')
+
+
+@admin.register(Recipe)
+class RecipeAdmin(LargeTableAdmin):
+    list_display = ('id', 'title', 'user', 'time_minutes', 'price')
+    raw_id_fields = ('user', 'tags', 'ingredients')
+    search_field = 'title'
+
+    def search_prefix(self, queryset, prefix):
+        # Matches the title varchar_pattern_ops index, so the prefix is case sensitive.
+        return queryset.filter(title__startswith=prefix)
+
+    def get_form(self, request, obj=None, **kwargs):
+        request.admin_recipe_user_id = obj.user_id if obj else None
+        request.admin_recipe_shard = obj._state.db if obj else None
+        return super().get_form(request, obj, **kwargs)
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        user_id = getattr(request, 'admin_recipe_user_id', None)
+        if user_id is not None:
+            kwargs['using'] = request.admin_recipe_shard
+            kwargs['queryset'] = db_field.remote_field.model.objects.using(kwargs['using']).filter(user_id=user_id)
+        form_field = super().formfield_for_manytomany(db_field, request, **kwargs)
+        if user_id is not None:
+            form_field.widget = UserScopedManyToManyRawIdWidget(
+                db_field.remote_field, self.admin_site, user_id, using=kwargs.get('using')
+            )
+        return form_field
+
+
 admin.site.register(User, UserAdmin)
-admin.site.register(Tag)
-admin.site.register(Ingredient)
-admin.site.register(Recipe)
@@ -0,0 +1,148 @@
+import bisect
+import itertools
+import math
+import threading
+import time
+from collections import Counter
+
+
+class Rejected(Exception):
+    """A request was not admitted; `status` is 503 when overloaded, 429 for a busy user"""
+
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    __slots__ = ('user', 'priority', 'seq', 'admitted')
+
+    def __init__(self, user, priority, seq):
+        self.user = user
+        self.priority = priority
+        self.seq = seq
+        self.admitted = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """Bound the requests a worker process runs at once, overall and per user.
+
+    Requests over the limits wait in one queue ordered by priority class,
+    then arrival. A request is shed right away when its predicted wait is
+    over its class's latency target, and when it has waited that long.
+    A user with `per_user` requests running and as many queued is told
+    to back off. Waiters blocked only by their own user's limit do not
+    hold up anyone else.
+    """
+
+    def __init__(self, limit, per_user, classes):
+        self.limit = limit
+        self.per_user = per_user
+        # {name: (priority, max wait in seconds)}, lower priority runs first.
+        self.classes = {name: (priority, max_wait) for priority, (name, max_wait) in enumerate(classes)}
+        self.cond = threading.Condition()
+        self.seq = itertools.count()
+        self.waiters = []
+        self.in_flight = 0
+        self.running = Counter()
+        self.queued = Counter()
+        self.service_time = 0.0
+        self.admitted = Counter()
+        self.shed = Counter()
+
+    def retry_after(self, wait):
+        return max(1, math.ceil(wait))
+
+    def predicted_wait(self, ahead):
+        return (ahead + 1) * self.service_time / self.limit
+
+    def dispatch(self):
+        """Admit queued requests, in order, while there is room; call with the lock held"""
+        admitted = False
+        index = 0
+        while index < len(self.waiters) and self.in_flight < self.limit:
+            ticket = self.waiters[index]
+            if self.running[ticket.user] < self.per_user:
+                del self.waiters[index]
+                self.start(ticket)
+                admitted = True
+            else:
+                index += 1
+        if admitted:
+            self.cond.notify_all()
+
+    def start(self, ticket):
+        ticket.admitted = True
+        self.in_flight += 1
+        self.running[ticket.user] += 1
+
+    def acquire(self, user, name):
+        """Wait for a slot and return the ticket to release, or raise Rejected"""
+        priority, max_wait = self.classes[name]
+        with self.cond:
+            ticket = Ticket(user, priority, next(self.seq))
+            bisect.insort(self.waiters, ticket)
+            self.dispatch()
+            if not ticket.admitted:
+                self.check_queue(ticket, name, max_wait)
+                self.wait(ticket, name, max_wait)
+            self.admitted[name] += 1
+            return ticket
+
+    def check_queue(self, ticket, name, max_wait):
+        rejected = None
+        if self.running[ticket.user] >= self.per_user and self.queued[ticket.user] >= self.per_user:
+            rejected = Rejected(429, 'Too many concurrent requests for this user.', self.retry_after(self.service_time))
+        else:
+            wait = self.predicted_wait(self.waiters.index(ticket))
+            if wait > max_wait:
+                rejected = Rejected(503, 'Server is busy, try again shortly.', self.retry_after(wait))
+        if rejected is not None:
+            self.waiters.remove(ticket)
+            self.shed[name] += 1
+            raise rejected
+
+    def wait(self, ticket, name, max_wait):
+        self.queued[ticket.user] += 1
+        deadline = time.monotonic() + max_wait
+        try:
+            while not ticket.admitted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.waiters.remove(ticket)
+                    self.shed[name] += 1
+                    raise Rejected(503, 'Server is busy, try again shortly.', self.retry_after(max_wait))
+                self.cond.wait(remaining)
+        finally:
+            self.queued[ticket.user] -= 1
+            if not self.queued[ticket.user]:
+                del self.queued[ticket.user]
+
+    def release(self, ticket, duration):
+        with self.cond:
+            self.in_flight -= 1
+            self.running[ticket.user] -= 1
+            if not self.running[ticket.user]:
+                del self.running[ticket.user]
+            # Moving average of the time a request holds its slot.
+            self.service_time += 0.1 * (duration - self.service_time)
+            self.dispatch()
+
+    def stats(self):
+        with self.cond:
+            depth = Counter()
+            for ticket in self.waiters:
+                depth[ticket.priority] += 1
+            return {
+                'in_flight': self.in_flight,
+                'limit': self.limit,
+                'queued': {name: depth[priority] for name, (priority, max_wait) in self.classes.items()},
+                'admitted': dict(self.admitted),
+                'shed': dict(self.shed),
+                'service_time_ms': round(self.service_time * 1000, 1),
+            }
@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CoreConfig(AppConfig):
-    name = "app.core"
+    name = 'core'
+
+    def ready(self):
+        from .shards import reserve_id_ranges
+
+        post_migrate.connect(reserve_id_ranges, sender=self)
@@ -0,0 +1,194 @@
+import io
+import json
+import re
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import Resolver404, resolve
+from rest_framework import authentication, permissions, serializers, status
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+REFERENCE = re.compile(r'\{\{\s*([\w-]+)((?:\.[\w-]+)*)\s*\}\}')
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class UnresolvedReference(Exception):
+    pass
+
+
+class OperationSerializer(serializers.Serializer):
+    id = serializers.RegexField(r'^[\w-]+$', required=False, max_length=64)
+    method = serializers.ChoiceField(choices=METHODS)
+    path = serializers.CharField(max_length=2000)
+    body = serializers.JSONField(required=False)
+    files = serializers.DictField(child=serializers.CharField(), required=False)
+
+    def validate_path(self, path):
+        if not path.startswith(settings.BATCH_ALLOWED_PREFIXES):
+            raise serializers.ValidationError('Only paths under %s can be batched.' % ', '.join(settings.BATCH_ALLOWED_PREFIXES))
+        return path
+
+
+class BatchSerializer(serializers.Serializer):
+    atomic = serializers.BooleanField(default=False)
+    operations = OperationSerializer(many=True)
+
+    def validate_operations(self, operations):
+        if not operations or len(operations) > settings.BATCH_MAX_OPERATIONS:
+            raise serializers.ValidationError('Expected 1 to %d operations.' % settings.BATCH_MAX_OPERATIONS)
+        names = [op['id'] for op in operations if 'id' in op]
+        if len(names) != len(set(names)):
+            raise serializers.ValidationError('Operation ids must be unique.')
+        return operations
+
+
+def lookup(results, name, path):
+    """Value at `path` (".id", ".tags.0") of the body returned by operation `name`"""
+    if name not in results:
+        raise UnresolvedReference('{{%s%s}} refers to no earlier successful operation' % (name, path))
+    value = results[name]
+    for key in filter(None, path.split('.')):
+        try:
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise UnresolvedReference('{{%s%s}} is not in the result of %s' % (name, path, name))
+    return value
+
+
+def substitute(value, results):
+    """Replace {{operation.field}} references; a string that is only a reference keeps the value's type"""
+    if isinstance(value, dict):
+        return {key: substitute(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [substitute(item, results) for item in value]
+    if isinstance(value, str):
+        match = REFERENCE.fullmatch(value.strip())
+        if match:
+            return lookup(results, *match.groups())
+        return REFERENCE.sub(lambda m: str(lookup(results, *m.groups())), value)
+    return value
+
+
+class BatchView(APIView):
+    """Run an ordered list of API requests in one round-trip.
+
+    Sub-requests are authenticated as the batch caller and can refer to
+    values returned by earlier operations with `{{id.field}}`. With
+    `atomic`, all operations share one transaction and the first failure
+    rolls every change back.
+    """
+    authentication_classes = (authentication.TokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+    parser_classes = (JSONParser, MultiPartParser)
+
+    def post(self, request):
+        data = request.data
+        if 'operations' in data and isinstance(data['operations'], str):
+            # Multipart batch: operations as JSON next to the uploaded files.
+            try:
+                data = {'atomic': data.get('atomic', False), 'operations': json.loads(data['operations'])}
+            except ValueError:
+                return Response({'operations': ['Expected a JSON encoded list.']}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = BatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        atomic = serializer.validated_data['atomic']
+        operations = serializer.validated_data['operations']
+
+        if atomic:
+            # Accounts live on default, recipes on the user's shard; both
+            # commit together unless the process dies in between.
+            databases = sorted({DEFAULT_DB_ALIAS, request.user.shard})
+            with ExitStack() as stack:
+                for alias in databases:
+                    stack.enter_context(transaction.atomic(using=alias))
+                results, failed = self.run(request, operations, stop_on_error=True)
+                if failed:
+                    for alias in databases:
+                        transaction.set_rollback(True, using=alias)
+        else:
+            results, failed = self.run(request, operations, stop_on_error=False)
+        return Response({'committed': not (atomic and failed), 'results': results})
+
+    def run(self, request, operations, stop_on_error):
+        bodies = {}
+        results = []
+        failed = False
+        for operation in operations:
+            try:
+                path = substitute(operation['path'], bodies)
+                body = substitute(operation.get('body'), bodies)
+            except UnresolvedReference as exc:
+                result = {'status': status.HTTP_424_FAILED_DEPENDENCY, 'body': {'detail': str(exc)}}
+            else:
+                result = self.perform(request, operation['method'], path, body, operation.get('files'))
+            if 'id' in operation:
+                result['id'] = operation['id']
+                if result['status'] < 400:
+                    bodies[operation['id']] = result['body']
+            results.append(result)
+            if result['status'] >= 400:
+                failed = True
+                if stop_on_error:
+                    break
+        return results, failed
+
+    def perform(self, request, method, path, body, files):
+        url = urlsplit(path)
+        if not url.path.startswith(settings.BATCH_ALLOWED_PREFIXES):
+            return {'status': status.HTTP_400_BAD_REQUEST, 'body': {'detail': 'Path not allowed in a batch.'}}
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            return {'status': status.HTTP_404_NOT_FOUND, 'body': {'detail': 'Not found.'}}
+
+        subrequest = self.build_request(request, method, url, body, files)
+        if subrequest is None:
+            return {'status': status.HTTP_400_BAD_REQUEST, 'body': {'detail': 'Unknown file in operation.'}}
+        response = match.func(subrequest, *match.args, **match.kwargs)
+        return {'status': response.status_code, 'body': getattr(response, 'data', None)}
+
+    def build_request(self, request, method, url, body, files):
+        """WSGI request for one operation, authenticated as the batch caller"""
+        if files:
+            fields = dict(body or {})
+            for field, name in files.items():
+                if name not in request.FILES:
+                    return None
+                upload = request.FILES[name]
+                upload.seek(0)
+                fields[field] = upload
+            content, content_type = encode_multipart(BOUNDARY, fields), MULTIPART_CONTENT
+        elif body is not None and method != 'GET':
+            content, content_type = json.dumps(body).encode('utf-8'), 'application/json'
+        else:
+            content, content_type = b'', ''
+
+        environ = {
+            key: value for key, value in request._request.META.items()
+            if not key.startswith(('CONTENT_', 'HTTP_CONTENT_', 'wsgi.')) and key != 'HTTP_ACCEPT'
+        }
+        environ.update({
+            'REQUEST_METHOD': method,
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(content)),
+            'HTTP_ACCEPT': 'application/json',
+            'wsgi.input': io.BytesIO(content),
+            'wsgi.url_scheme': request._request.scheme,
+            'wsgi.errors': request._request.META.get('wsgi.errors'),
+            'wsgi.multithread': request._request.META.get('wsgi.multithread', True),
+            'wsgi.multiprocess': request._request.META.get('wsgi.multiprocess', True),
+            'wsgi.version': (1, 0),
+            'wsgi.run_once': False,
+        })
+        subrequest = request._request.__class__(environ)
+        # Authenticate once: the sub-request is forced to the batch caller.
+        subrequest._force_auth_user = request.user
+        subrequest._force_auth_token = request.auth
+        return subrequest
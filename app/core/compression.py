@@ -0,0 +1,78 @@
+"""Response compression with brotli and gzip"""
+import gzip
+
+import brotli
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from rest_framework.response import Response
+
+
+def accepted_encodings(accept_encoding):
+    """Encodings the client accepts, from the Accept-Encoding header"""
+    encodings = set()
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+def negotiate(request):
+    """Preferred supported encoding for a request: br, then gzip, else None"""
+    encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    # mtime=0 keeps the output stable, so equal bodies compress equally.
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def compressible(response):
+    if response.streaming or response.has_header('Content-Encoding'):
+        return False
+    return response.get('Content-Type', '').split(';')[0].strip() in settings.COMPRESSION_CONTENT_TYPES
+
+
+def encode_body(body, encoding):
+    """Return (body, encoding), leaving bodies under the size threshold as they are"""
+    if encoding is None or len(body) < settings.COMPRESSION_MIN_SIZE:
+        return body, None
+    return compress(body, encoding), encoding
+
+
+def set_encoding(response, encoding):
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if encoding:
+        response['Content-Encoding'] = encoding
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            # The encoded body is a different representation.
+            response['ETag'] = 'W/' + etag
+
+
+class PrecompressedResponse(Response):
+    """Response sending a body rendered and encoded ahead of time.
+
+    `data` is kept so tests and callers can still inspect the payload.
+    """
+
+    def __init__(self, data, body, encoding, content_type):
+        super().__init__(data, content_type=content_type)
+        self.body = body
+        self.encoding = encoding
+
+    @property
+    def rendered_content(self):
+        self['Content-Type'] = self.content_type
+        set_encoding(self, self.encoding)
+        return self.body
@@ -0,0 +1,151 @@
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import weakref
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from . import metrics
+
+# Attributes every LogRecord has; anything else was passed through `extra`.
+RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including `extra` fields"""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS:
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exc_info'] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of the records below WARNING, per logger.
+
+    `rates` maps logger names to the fraction kept; the longest matching
+    dotted prefix wins and unlisted loggers are kept in full.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+
+    def rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return self.rates.get('', 1.0)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class BlockingStopListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room: stopping must not fail because the queue is full.
+        self.queue.put(self._sentinel)
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """Hand records to a background thread that formats and writes them.
+
+    The request thread only enqueues; when the bounded queue is full the
+    record is dropped and counted instead of blocking the worker.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self.listener = None
+        self.start()
+        open_handlers.add(self)
+
+    def start(self):
+        self.listener = BlockingStopListener(self.queue, self.target)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def restart(self):
+        if self.listener is not None:
+            self.queue = queue.Queue(self.maxsize)
+            self.start()
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the writer thread.
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Wait for the queued records to be written"""
+        if self.listener is not None:
+            self.stop()
+            self.start()
+        self.target.flush()
+
+    def close(self):
+        open_handlers.discard(self)
+        self.stop()
+        self.target.close()
+        super().close()
+
+
+# Handlers not closed yet; dictConfig closes the ones it replaces.
+open_handlers = weakref.WeakSet()
+
+
+def stats():
+    handlers = list(open_handlers)
+    return {
+        'queued': sum(handler.queue.qsize() for handler in handlers),
+        'dropped': sum(handler.dropped for handler in handlers),
+    }
+
+
+def restart_after_fork():
+    # The writer threads do not survive a fork (gunicorn --preload).
+    for handler in list(open_handlers):
+        handler.restart()
+
+
+metrics.register('logging', stats)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=restart_after_fork)
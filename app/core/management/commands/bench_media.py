@@ -0,0 +1,70 @@
+import os
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from core import media
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+
+class Command(BaseCommand):
+    """Measure media serving throughput for full and ranged requests"""
+    help = 'Benchmark core.media serving, in process or against a running server with --url'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1024 * 1024, help='Size in bytes of the generated file')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--range', default='bytes=0-65535', help='Range header used for the ranged run')
+        parser.add_argument('--url', help='Benchmark an already served media URL instead of the in process view')
+
+    def handle(self, *args, **options):
+        if options['url']:
+            fetch = self.http_fetcher(options['url'])
+            self.run(fetch, options)
+            return
+
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=settings.MEDIA_ROOT, suffix='.bin') as tmp:
+            tmp.write(os.urandom(options['size']))
+            tmp.flush()
+            fetch = self.view_fetcher(os.path.basename(tmp.name))
+            self.run(fetch, options)
+
+    def run(self, fetch, options):
+        for label, range_header in (('full', None), ('range', options['range'])):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                sizes = list(pool.map(lambda _: fetch(range_header), range(options['requests'])))
+            elapsed = time.perf_counter() - start
+            total = sum(sizes)
+            self.stdout.write(
+                '%-5s %6d requests in %.3fs: %8.1f req/s %8.1f MB/s' % (
+                    label, len(sizes), elapsed, len(sizes) / elapsed, total / elapsed / 1024 / 1024)
+            )
+
+    def view_fetcher(self, path):
+        factory = RequestFactory()
+
+        def fetch(range_header):
+            extra = {'HTTP_RANGE': range_header} if range_header else {}
+            response = media.serve(factory.get('/media/' + path, **extra), path)
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+            response.close()
+            return size
+
+        return fetch
+
+    def http_fetcher(self, url):
+        def fetch(range_header):
+            req = urllib.request.Request(url, headers={'Range': range_header} if range_header else {})
+            with urllib.request.urlopen(req) as resp:
+                return len(resp.read())
+
+        return fetch
@@ -0,0 +1,35 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.startup import cold_start
+
+
+class Command(BaseCommand):
+    """Benchmark cold start time of a web worker per settings profile"""
+    help = 'Time fresh interpreters loading the WSGI application and URLconf'
+
+    def add_arguments(self, parser):
+        parser.add_argument('settings_modules', nargs='*', default=['app.settings', 'app.settings_api'])
+        parser.add_argument('--runs', type=int, default=10)
+        parser.add_argument('--max-ms', type=float, help='Fail when the median Django start exceeds this many ms')
+
+    def handle(self, *args, **options):
+        self.stdout.write('%-20s %12s %12s %12s' % ('profile', 'process ms', 'django ms', 'django max'))
+        slow = []
+        for module in options['settings_modules']:
+            process_times = []
+            django_times = []
+            for _ in range(options['runs']):
+                start = time.perf_counter()
+                result = cold_start(module)
+                process_times.append(time.perf_counter() - start)
+                django_times.append(float(result.stdout.split()[-1]))
+            median = statistics.median(django_times) * 1000
+            self.stdout.write('%-20s %12.1f %12.1f %12.1f' % (
+                module, statistics.median(process_times) * 1000, median, max(django_times) * 1000))
+            if options['max_ms'] is not None and median > options['max_ms']:
+                slow.append(module)
+        if slow:
+            raise CommandError('Cold start above %.0f ms: %s' % (options['max_ms'], ', '.join(slow)))
@@ -0,0 +1,31 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from core.startup import cold_start, parse_importtime
+
+
+class Command(BaseCommand):
+    """Report where a cold start spends its import time"""
+    help = 'Profile module imports of a fresh worker start with python -X importtime'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settings-module', default='app.settings_api', help='Settings profile to start')
+        parser.add_argument('--top', type=int, default=20, help='Number of modules and packages listed')
+
+    def handle(self, *args, **options):
+        modules = list(parse_importtime(cold_start(options['settings_module'], importtime=True).stderr))
+        total = sum(self_us for name, self_us, cumulative_us, depth in modules)
+        packages = Counter()
+        for name, self_us, cumulative_us, depth in modules:
+            packages[name.partition('.')[0]] += self_us
+
+        self.stdout.write('%s: %d modules imported in %.1f ms' % (options['settings_module'], len(modules), total / 1000))
+        self.stdout.write('\nSlowest packages (self time of all their modules)')
+        for package, self_us in packages.most_common(options['top']):
+            self.stdout.write('  %8.1f ms  %5.1f%%  %s' % (self_us / 1000, 100 * self_us / total, package))
+
+        self.stdout.write('\nSlowest top level imports (cumulative)')
+        top_level = sorted((m for m in modules if m[3] == 0), key=lambda m: m[2], reverse=True)
+        for name, self_us, cumulative_us, depth in top_level[:options['top']]:
+            self.stdout.write('  %8.1f ms  %s' % (cumulative_us / 1000, name))
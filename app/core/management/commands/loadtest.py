@@ -0,0 +1,87 @@
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """Closed loop HTTP load test against a running server"""
+    help = 'Send concurrent requests to a URL over keep-alive connections and report throughput and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--token', help='API token sent as `Authorization: Token <token>`')
+        parser.add_argument('--warmup', type=int, default=50, help='Requests sent before measuring')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https') or not url.netloc:
+            raise CommandError('Expected an http(s) URL')
+        headers = {'Connection': 'keep-alive'}
+        if options['token']:
+            headers['Authorization'] = 'Token %s' % options['token']
+        target = (url.scheme, url.netloc, url.path + ('?' + url.query if url.query else ''), headers)
+
+        self.run(target, options['warmup'], options['concurrency'])
+        latencies, errors, reconnects, elapsed = self.run(target, options['requests'], options['concurrency'])
+
+        latencies.sort()
+        count = len(latencies)
+        if not count:
+            raise CommandError('All %d requests failed' % errors)
+        self.stdout.write('%d requests, concurrency %d, %.2fs' % (count + errors, options['concurrency'], elapsed))
+        self.stdout.write('throughput   %.1f req/s' % (count / elapsed))
+        for label, quantile in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            self.stdout.write('latency %s  %.1f ms' % (label, latencies[min(count - 1, int(count * quantile))] * 1000))
+        self.stdout.write('errors %d, reconnects %d' % (errors, reconnects))
+
+    def run(self, target, total, concurrency):
+        """Every thread keeps one connection open and sends requests back to back"""
+        scheme, netloc, path, headers = target
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        remaining = [total]
+        lock = threading.Lock()
+        latencies = []
+        counters = {'errors': 0, 'reconnects': 0}
+
+        def worker():
+            conn = connection_class(netloc, timeout=30)
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+                start = time.perf_counter()
+                try:
+                    conn.request('GET', path, headers=headers)
+                    resp = conn.getresponse()
+                    resp.read()
+                    ok = resp.status < 400
+                    reconnect = resp.will_close
+                except (OSError, http.client.HTTPException):
+                    ok = False
+                    reconnect = True
+                latency = time.perf_counter() - start
+                with lock:
+                    if ok:
+                        latencies.append(latency)
+                    else:
+                        counters['errors'] += 1
+                    if reconnect:
+                        counters['reconnects'] += 1
+                if reconnect:
+                    conn.close()
+                    conn = connection_class(netloc, timeout=30)
+            conn.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, counters['errors'], counters['reconnects'], time.perf_counter() - start
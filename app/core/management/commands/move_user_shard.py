@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import User
+from core.shard_moves import move_user, plan_rebalance
+from recipe.cache import bump_user_data_version
+
+
+class Command(BaseCommand):
+    """Move users' recipes, tags and ingredients between database shards"""
+    help = 'Move one user to a shard, or even out the number of users per shard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='User id or email')
+        parser.add_argument('--to', choices=settings.DATABASE_SHARDS, help='Destination shard of --user')
+        parser.add_argument('--rebalance', action='store_true', help='Move users from the fullest shards')
+        parser.add_argument('--limit', type=int, default=100, help='Most users moved by --rebalance')
+        parser.add_argument('--dry-run', action='store_true', help='Only print the moves --rebalance would make')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--grace', type=float, default=15,
+                            help='Seconds between refusing a user\'s writes and copying their rows')
+
+    def handle(self, *args, **options):
+        if options['rebalance'] == bool(options['user']):
+            raise CommandError('Pass either --user and --to, or --rebalance')
+        if options['rebalance']:
+            moves = plan_rebalance(options['limit'])
+            if not moves:
+                self.stdout.write('Shards are balanced')
+        else:
+            if not options['to']:
+                raise CommandError('--to is required with --user')
+            moves = [(self.get_user(options['user']), options['to'])]
+
+        for user, target in moves:
+            if options['dry_run']:
+                self.stdout.write('Would move %s from %s to %s' % (user.email, user.shard, target))
+                continue
+            source = user.shard
+            counts = move_user(user, target, options['batch_size'], options['grace'])
+            bump_user_data_version(user.pk)
+            self.stdout.write(self.style.SUCCESS('Moved %s from %s to %s: %s' % (
+                user.email, source, target, ', '.join('%d %s' % (n, name) for name, n in counts.items()) or 'nothing to move'
+            )))
+
+    def get_user(self, value):
+        lookup = {'pk': value} if value.isdigit() else {'email': value}
+        try:
+            return User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError('User not found: %s' % value)
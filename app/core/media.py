@@ -0,0 +1,149 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangedFile:
+    """File like object exposing only `length` bytes starting at `start`.
+
+    `fileno()` and `tell()` are kept so that WSGI servers with a sendfile
+    capable `wsgi.file_wrapper` (gunicorn) can still stream the slice
+    zero-copy, bounded by the response Content-Length.
+    """
+
+    def __init__(self, fileobj, start, length):
+        self.fileobj = fileobj
+        self.fileobj.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.fileobj.fileno()
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def close(self):
+        self.fileobj.close()
+
+
+def file_etag(st):
+    """Strong ETag built from inode, size and modification time"""
+    return quote_etag('%x-%x-%x' % (st.st_ino, st.st_size, st.st_mtime_ns))
+
+
+def cache_control_for(path):
+    """Long lived immutable caching for uuid named uploads, short otherwise"""
+    if path.startswith(tuple(settings.MEDIA_IMMUTABLE_PREFIXES)):
+        return 'public, max-age=%d, immutable' % settings.MEDIA_IMMUTABLE_MAX_AGE
+    return 'public, max-age=%d' % settings.MEDIA_MAX_AGE
+
+
+def parse_range(header, size):
+    """Return (start, end) inclusive for a single byte range, None to ignore
+    the header, or raise ValueError when the range can not be satisfied"""
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Multiple or malformed ranges, RFC 7233 allows serving the full file.
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError('Range not satisfiable')
+    return start, min(end, size - 1)
+
+
+@require_safe
+def serve(request, path):
+    """Serve a file from MEDIA_ROOT with validators, caching and ranges"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        st = os.stat(full_path)
+    except OSError:
+        raise Http404('"%s" does not exist' % path)
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404('"%s" does not exist' % path)
+
+    etag = file_etag(st)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(st.st_mtime),
+        'Cache-Control': cache_control_for(path),
+        'Accept-Ranges': 'bytes',
+    }
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if conditional is not None:
+        if isinstance(conditional, HttpResponseNotModified):
+            for header, value in headers.items():
+                conditional[header] = value
+        return conditional
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    if settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+        # Let nginx stream the file (including ranges) from an internal location.
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+    elif settings.MEDIA_SENDFILE_HEADER:
+        response = HttpResponse(content_type=content_type)
+        response[settings.MEDIA_SENDFILE_HEADER] = full_path
+    else:
+        response = file_response(request, full_path, st.st_size, etag, content_type)
+
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def file_response(request, full_path, size, etag, content_type):
+    """Build a full or partial FileResponse for the file on disk"""
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    byte_range = None
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+
+    fileobj = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(fileobj, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(RangedFile(fileobj, start, length), status=206, content_type=content_type)
+        response['Content-Length'] = length
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+    response.block_size = settings.MEDIA_BLOCK_SIZE
+    return response
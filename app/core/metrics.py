@@ -0,0 +1,17 @@
+import threading
+
+_providers = {}
+_lock = threading.Lock()
+
+
+def register(name, provider):
+    """Register a callable returning a dict of process local metrics"""
+    with _lock:
+        _providers[name] = provider
+
+
+def snapshot():
+    """Collect the current value of every registered metrics provider"""
+    with _lock:
+        providers = dict(_providers)
+    return {name: provider() for name, provider in sorted(providers.items())}
@@ -0,0 +1,173 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.http import JsonResponse
+
+from . import metrics
+from .admission import AdmissionController, Rejected
+from .compression import compressible, encode_body, negotiate, set_encoding
+
+logger = logging.getLogger(__name__)
+
+# SQLSTATE of a statement cancelled by statement_timeout.
+QUERY_CANCELED = '57014'
+
+
+class StatementTimeout:
+    """Execute wrapper giving the queries of a request its statement timeout.
+
+    The SET is sent with the first query on each PostgreSQL connection, in
+    the same round-trip, so requests that do not touch the database pay
+    nothing. A connection left with an override by an earlier request is
+    RESET the same way. With timeout None the connection default applies.
+    """
+
+    def __init__(self):
+        self.timeout = None
+        self.aliases = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        connection = context['connection']
+        # A named (server side) cursor wraps the query in DECLARE, which takes one statement.
+        if connection.alias in self.aliases or getattr(context['cursor'].cursor, 'name', None):
+            return execute(sql, params, many, context)
+        if self.timeout is not None:
+            connection.statement_timeout_changed = True
+            prefix = 'SET statement_timeout = %d; ' % int(self.timeout)
+        elif getattr(connection, 'statement_timeout_changed', False):
+            prefix = 'RESET statement_timeout; '
+        else:
+            prefix = ''
+        result = execute(prefix + sql, params, many, context)
+        self.aliases.add(connection.alias)
+        # A RESET inside a transaction is undone if it rolls back.
+        if prefix.startswith('RESET') and not connection.in_atomic_block:
+            connection.statement_timeout_changed = False
+        return result
+
+
+class StatementTimeoutMiddleware:
+    """Apply per endpoint PostgreSQL statement timeouts to web requests.
+
+    The web defaults, DB_STATEMENT_TIMEOUT and DB_IDLE_IN_TRANSACTION_TIMEOUT,
+    are connection options of the web workers, see settings. Endpoints
+    listed in DB_STATEMENT_TIMEOUTS by URL name get their own statement
+    timeout on every database the request queries, including the user's
+    shard and the operations of a batch. A cancelled query becomes a 503
+    instead of holding the worker until the database gives up.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.timeouts = settings.DB_STATEMENT_TIMEOUTS
+
+    def __call__(self, request):
+        request.statement_timeout = StatementTimeout()
+        with ExitStack() as stack:
+            for alias in settings.DATABASES:
+                connection = connections[alias]
+                if connection.vendor == 'postgresql':
+                    stack.enter_context(connection.execute_wrapper(request.statement_timeout))
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.statement_timeout.timeout = self.timeouts.get(request.resolver_match.view_name)
+        return None
+
+    def process_exception(self, request, exception):
+        cause = exception.__cause__
+        if isinstance(exception, OperationalError) and getattr(cause, 'pgcode', None) == QUERY_CANCELED:
+            statement_timeout = request.statement_timeout
+            logger.warning('Statement timeout', extra={
+                'path': request.path,
+                'timeout_ms': settings.DB_STATEMENT_TIMEOUT if statement_timeout.timeout is None else statement_timeout.timeout,
+                'databases': sorted(statement_timeout.aliases),
+            })
+            return JsonResponse({'detail': 'The query took too long, narrow the filters and retry.'}, status=503)
+        return None
+
+
+class CompressionMiddleware:
+    """Compress API responses with brotli or gzip, as the client accepts.
+
+    Bodies under COMPRESSION_MIN_SIZE are sent as they are. Responses that
+    already carry a Content-Encoding, such as precompressed cache hits,
+    pass through untouched.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not compressible(response):
+            return response
+        body, encoding = encode_body(response.content, negotiate(request))
+        if encoding:
+            response.content = body
+        set_encoding(response, encoding)
+        return response
+
+
+class AdmissionControlMiddleware:
+    """Per process concurrency limits, priority queueing and load shedding.
+
+    Every request gets a priority class from its URL name, see
+    ADMISSION_ROUTE_CLASSES; unlisted safe requests are `read`, the rest
+    `write`. Requests are limited per API token, or per client address
+    without one. A request that is not admitted gets a 503, or a 429 when
+    its own user is over the limit, with Retry-After. The limits only come
+    into play with threaded or gevent workers, which run several requests
+    per process.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.controller = AdmissionController(
+            settings.ADMISSION_MAX_IN_FLIGHT,
+            settings.ADMISSION_MAX_IN_FLIGHT_PER_USER,
+            settings.ADMISSION_CLASSES,
+        )
+        metrics.register('admission', self.controller.stats)
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            ticket = getattr(request, 'admission_ticket', None)
+            if ticket is not None:
+                self.controller.release(ticket, time.monotonic() - request.admission_started)
+
+    def route_class(self, request):
+        match = request.resolver_match
+        if set(match.namespaces) & set(settings.ADMISSION_EXEMPT_NAMESPACES):
+            return None
+        if match.view_name in settings.ADMISSION_ROUTE_CLASSES:
+            return settings.ADMISSION_ROUTE_CLASSES[match.view_name]
+        return 'read' if request.method in ('GET', 'HEAD', 'OPTIONS') else 'write'
+
+    def client_key(self, request):
+        # The raw header is enough to tell clients apart, without a query.
+        auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(auth) == 2 and auth[0].lower() == 'token':
+            return 'token:' + auth[1]
+        return 'addr:' + request.META.get('REMOTE_ADDR', '')
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        name = self.route_class(request)
+        if name is None:
+            return None
+        try:
+            request.admission_ticket = self.controller.acquire(self.client_key(request), name)
+        except Rejected as exc:
+            logger.warning('Request shed', extra={
+                'path': request.path, 'priority_class': name, 'status_code': exc.status,
+            })
+            response = JsonResponse({'detail': exc.reason}, status=exc.status)
+            response['Retry-After'] = str(exc.retry_after)
+            return response
+        request.admission_started = time.monotonic()
+        return None
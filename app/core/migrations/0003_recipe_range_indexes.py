@@ -0,0 +1,39 @@
+# Generated by Django 2.1.15 on 2026-10-19 13:00
+
+from django.db import migrations, models
+
+
+def create_title_prefix_index(apps, schema_editor):
+    """LIKE 'prefix%' only uses a btree index with pattern ops on PostgreSQL"""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX recipe_user_title_like_idx ON recipe (user_id, title varchar_pattern_ops)'
+        )
+
+
+def drop_title_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS recipe_user_title_like_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_auto_20210214_0309'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'time_minutes'], name='recipe_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'price'], name='recipe_user_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'title'], name='recipe_user_title_idx'),
+        ),
+        migrations.RunPython(create_title_prefix_index, drop_title_prefix_index),
+    ]
@@ -0,0 +1,75 @@
+from django.db import migrations, transaction
+from django.db.models import Count, Min
+from django.db.models.functions import Lower
+
+BATCH_SIZE = 500
+
+UNIQUE_INDEXES = (
+    ('tag_user_lower_name_uniq', 'Tag'),
+    ('ingredient_user_lower_name_uniq', 'Ingredients'),
+)
+
+
+def merge_duplicates(apps, model_name, field_name, db):
+    """Keep the oldest row of every (user, lower(name)) group and repoint links to it"""
+    model = apps.get_model('core', model_name)
+    field = apps.get_model('core', 'Recipe')._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = through._meta.get_field(field.m2m_field_name()).attname
+    target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+    names = model.objects.using(db).annotate(lower_name=Lower('name'))
+
+    while True:
+        groups = list(
+            names.values('user_id', 'lower_name').annotate(keep=Min('id'), rows=Count('id'))
+            .filter(rows__gt=1).order_by('keep')[:BATCH_SIZE]
+        )
+        if not groups:
+            return
+        with transaction.atomic(using=db):
+            for group in groups:
+                duplicates = list(
+                    names.filter(user_id=group['user_id'], lower_name=group['lower_name'])
+                    .exclude(id=group['keep']).values_list('id', flat=True)
+                )
+                # A recipe linked to several rows of the group keeps one link.
+                seen = set()
+                stale = []
+                links = through.objects.using(db).filter(**{'%s__in' % target: [group['keep']] + duplicates})
+                for pk, recipe_id in links.order_by(target).values_list('id', source):
+                    if recipe_id in seen:
+                        stale.append(pk)
+                    seen.add(recipe_id)
+                through.objects.using(db).filter(id__in=stale).delete()
+                through.objects.using(db).filter(**{'%s__in' % target: duplicates}).update(**{target: group['keep']})
+                model.objects.using(db).filter(id__in=duplicates).delete()
+
+
+def dedupe_and_index(apps, schema_editor):
+    db = schema_editor.connection.alias
+    merge_duplicates(apps, 'Tag', 'tags', db)
+    merge_duplicates(apps, 'Ingredient', 'ingredients', db)
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    for name, table in UNIQUE_INDEXES:
+        # A failed concurrent build leaves an INVALID index behind under the same name.
+        schema_editor.execute('DROP INDEX %sIF EXISTS %s' % (concurrently, name))
+        schema_editor.execute('CREATE UNIQUE INDEX %s%s ON "%s" (user_id, LOWER(name))' % (concurrently, name, table))
+
+
+def drop_indexes(apps, schema_editor):
+    for name, table in UNIQUE_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS %s' % name)
+
+
+class Migration(migrations.Migration):
+    # Dedupe batches commit on their own and the index is built without
+    # locking writes on PostgreSQL.
+    atomic = False
+
+    dependencies = [
+        ('core', '0004_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_and_index, drop_indexes),
+    ]
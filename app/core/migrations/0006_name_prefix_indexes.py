@@ -0,0 +1,35 @@
+from django.db import migrations
+
+PREFIX_INDEXES = (
+    ('tag_user_lower_name_prefix_idx', 'Tag'),
+    ('ingredient_user_lower_name_prefix_idx', 'Ingredients'),
+)
+
+
+def create_prefix_indexes(apps, schema_editor):
+    """Case insensitive prefix LIKE needs text_pattern_ops under non C collations"""
+    if schema_editor.connection.vendor == 'postgresql':
+        for name, table in PREFIX_INDEXES:
+            # A failed concurrent build leaves an INVALID index behind under the same name.
+            schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS %s' % name)
+            schema_editor.execute(
+                'CREATE INDEX CONCURRENTLY %s ON "%s" (user_id, LOWER(name) text_pattern_ops)' % (name, table)
+            )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name, table in PREFIX_INDEXES:
+            schema_editor.execute('DROP INDEX IF EXISTS %s' % name)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0005_unique_tag_ingredient_names'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 2.1.15 on 2026-10-19 13:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+UNIQUE_INDEXES = (
+    ('tag_user_lower_name_uniq', 'Tag'),
+    ('ingredient_user_lower_name_uniq', 'Ingredients'),
+)
+
+
+def restore_unique_indexes(apps, schema_editor):
+    # SQLite rebuilds the tables to drop the foreign keys, losing the
+    # expression indexes created by migration 0005.
+    if schema_editor.connection.vendor == 'sqlite':
+        for name, table in UNIQUE_INDEXES:
+            schema_editor.execute('CREATE UNIQUE INDEX IF NOT EXISTS %s ON "%s" (user_id, LOWER(name))' % (name, table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_name_prefix_indexes'),
+    ]
+
+    operations = [
+        # Runs last when migrating backwards.
+        migrations.RunPython(migrations.RunPython.noop, restore_unique_indexes),
+        migrations.AddField(
+            model_name='user',
+            name='shard',
+            field=models.CharField(db_index=True, default='default', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='shard_moving',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(restore_unique_indexes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# Admin prefix search runs across every user, so these lead with the
+# searched column rather than user_id.
+PREFIX_INDEXES = (
+    ('tag_lower_name_prefix_idx', 'Tag', 'LOWER(name) text_pattern_ops'),
+    ('ingredient_lower_name_prefix_idx', 'Ingredients', 'LOWER(name) text_pattern_ops'),
+    ('recipe_title_prefix_idx', 'recipe', 'title varchar_pattern_ops'),
+)
+
+
+def create_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name, table, expression in PREFIX_INDEXES:
+            # A failed concurrent build leaves an INVALID index behind under the same name.
+            schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS %s' % name)
+            schema_editor.execute('CREATE INDEX CONCURRENTLY %s ON "%s" (%s)' % (name, table, expression))
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name, table, expression in PREFIX_INDEXES:
+            schema_editor.execute('DROP INDEX IF EXISTS %s' % name)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0007_user_shards'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -1,19 +1,23 @@
 from django.conf import settings
 from django.contrib.auth.models import BaseUserManager, PermissionsMixin, AbstractBaseUser
-from django.db import models
+from django.db import connections, models, router, transaction, IntegrityError
+from django.db.models.functions import Lower
+from django.db.models.signals import post_save
+from core.shards import shard_for_new_user
+import logging
 import uuid
 import os
 
+logger = logging.getLogger(__name__)
+
 
 def recipe_image_file_path(instance, filename):
     """Generate file path for new recipes"""
-    print("[INFO]:-------------------------- recipe_image_file_path --------------")
-    print(f'FileName :{filename} , instance : {instance}')
     ext = filename.split('.')[-1]
-    filename = f'{uuid.uuid4()}.{ext}'
-    print(f'FileName :{filename} , ext : {ext}  UUID {uuid.uuid4()}')
+    path = os.path.join('uploads/recipe/', f'{uuid.uuid4()}.{ext}')
+    logger.debug('Recipe image upload path', extra={'upload_name': filename, 'path': path})
 
-    return os.path.join('uploads/recipe/', filename)
+    return path
 
 
 class UserManager(BaseUserManager):
@@ -22,6 +26,7 @@ class UserManager(BaseUserManager):
         if not email:
             raise ValueError('User must have an email address.')
 
+        extra_fields.setdefault('shard', shard_for_new_user(email))
         user = self.model(email=self.normalize_email(email), **extra_fields)
         user.set_password(password)
         user.save(self.db)
@@ -46,19 +51,74 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Database holding the user's recipes, tags and ingredients, see core.shards.
+    # Change it with the move_user_shard command only.
+    shard = models.CharField(max_length=100, default='default', editable=False, db_index=True)
+    shard_moving = models.BooleanField(default=False, editable=False)
 
     objects = UserManager()
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
 
+def supports_insert_returning(connection):
+    """Whether the database takes INSERT ... ON CONFLICT DO NOTHING RETURNING"""
+    if connection.vendor == 'sqlite':
+        # RETURNING arrived in SQLite 3.35.
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return connection.vendor == 'postgresql'
+
+
+class UserNamedManager(models.Manager):
+    """Manager for objects that are unique per user by case insensitive name"""
+
+    def get_by_name(self, user, name):
+        return self.annotate(lower_name=Lower('name')).get(user=user, lower_name=name.lower())
+
+    def upsert(self, user, name):
+        """Return (object, created), inserting the object unless it exists.
+
+        On PostgreSQL and SQLite 3.35+ this is one INSERT ... ON CONFLICT
+        DO NOTHING against the unique (user_id, LOWER(name)) index, so
+        concurrent creates of the same name cannot both insert.
+        """
+        db = router.db_for_write(self.model)
+        connection = connections[db]
+        if not supports_insert_returning(connection):
+            try:
+                with transaction.atomic(using=db):
+                    return self.using(db).create(user=user, name=name), True
+            except IntegrityError:
+                return self.db_manager(db).get_by_name(user, name), False
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO %s (user_id, name) VALUES (%%s, %%s) ON CONFLICT DO NOTHING RETURNING id'
+                % connection.ops.quote_name(self.model._meta.db_table),
+                [user.pk, name]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return self.db_manager(db).get_by_name(user, name), False
+
+        obj = self.model(pk=row[0], user=user, name=name)
+        obj._state.adding = False
+        obj._state.db = db
+        post_save.send(sender=self.model, instance=obj, created=True, update_fields=None, raw=False, using=db)
+        return obj, True
+
+
 class Tag(models.Model):
     """Tag should be use for a recipe"""
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # No database constraint: users live on the default database, tags on their shard.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False)
     name = models.CharField(max_length=255, blank=None)
 
+    objects = UserNamedManager()
+
     class Meta:
         db_table = "Tag"
+        # Unique on (user_id, LOWER(name)), created in migration 0005.
 
     def __str__(self):
         return self.name
@@ -66,11 +126,14 @@ class Tag(models.Model):
 
 class Ingredient(models.Model):
     """"""
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False)
     name = models.CharField(max_length=255, blank=False, null=False)
 
+    objects = UserNamedManager()
+
     class Meta:
         db_table = "Ingredients"
+        # Unique on (user_id, LOWER(name)), created in migration 0005.
 
     def __str__(self):
         return self.name
@@ -81,7 +144,7 @@ class Recipe(models.Model):
     time_minutes = models.IntegerField()
     price = models.DecimalField(max_digits=5, decimal_places=2, default=10.00)
     link = models.CharField(max_length=255, blank=True)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False)
 
     ingredients = models.ManyToManyField("Ingredient")
     tags = models.ManyToManyField("Tag")
@@ -93,3 +156,21 @@ class Recipe(models.Model):
 
     class Meta:
         db_table = "recipe"
+        indexes = [
+            models.Index(fields=['user', 'time_minutes'], name='recipe_user_time_idx'),
+            models.Index(fields=['user', 'price'], name='recipe_user_price_idx'),
+            models.Index(fields=['user', 'title'], name='recipe_user_title_idx'),
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """Rows of an import source already committed, for resumable imports"""
+    key = models.CharField(max_length=255, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "import_checkpoint"
+
+    def __str__(self):
+        return f'{self.key}: {self.position}'
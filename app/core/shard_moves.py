@@ -0,0 +1,128 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import User, Recipe, Tag, Ingredient
+
+# Rows are copied parents first and deleted children first.
+MODELS = (Tag, Ingredient, Recipe)
+
+
+def link_tables(model):
+    """(through model, column attname) of the m2m links pointing at `model`"""
+    links = []
+    for field_name in ('tags', 'ingredients'):
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        if model is Recipe:
+            links.append((through, through._meta.get_field(field.m2m_field_name()).attname))
+        elif model is field.remote_field.model:
+            links.append((through, through._meta.get_field(field.m2m_reverse_field_name()).attname))
+    return links
+
+
+def batches(model, db, user_id, batch_size):
+    """The user's rows on one database, in primary key order and bounded batches"""
+    last = 0
+    while True:
+        rows = list(model.objects.using(db).filter(user_id=user_id, pk__gt=last).order_by('pk')[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1].pk
+
+
+def copy_user_rows(source, target, user_id, batch_size):
+    """Copy a user's rows with their primary keys, and their links, between shards"""
+    counts = {}
+    for model in MODELS:
+        name = str(model._meta.verbose_name_plural)
+        counts[name] = 0
+        for rows in batches(model, source, user_id, batch_size):
+            model.objects.using(target).bulk_create(rows)
+            counts[name] += len(rows)
+            if model is Recipe:
+                ids = [row.pk for row in rows]
+                for through, column in link_tables(Recipe):
+                    links = through.objects.using(source).filter(**{'%s__in' % column: ids})
+                    through.objects.using(target).bulk_create([through(**{
+                        field.attname: getattr(link, field.attname)
+                        for field in through._meta.concrete_fields if not field.primary_key
+                    }) for link in links])
+    return counts
+
+
+def delete_user_rows(db, user_id, batch_size):
+    """Delete a user's rows and their links from one shard, a batch per transaction"""
+    for model in reversed(MODELS):
+        while True:
+            ids = list(
+                model.objects.using(db).filter(user_id=user_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic(using=db):
+                for through, column in link_tables(model):
+                    through.objects.using(db).filter(**{'%s__in' % column: ids})._raw_delete(db)
+                model.objects.using(db).filter(pk__in=ids)._raw_delete(db)
+
+
+def move_user(user, target, batch_size=1000, grace=0):
+    """Move all recipes, tags and ingredients of a user to another shard, online.
+
+    While the user is flagged as moving the API refuses their writes and
+    keeps serving reads from the old shard. `grace` seconds give writes
+    already past that check time to finish. The copy commits on the new
+    shard in one transaction before the user is switched over, then the
+    old rows are removed. Imports for the user must not run meanwhile.
+    """
+    source = user.shard
+    if target not in settings.DATABASE_SHARDS:
+        raise ValueError('Unknown shard %r' % target)
+    if source == target:
+        return {}
+
+    User.objects.filter(pk=user.pk).update(shard_moving=True)
+    try:
+        if grace:
+            time.sleep(grace)
+        with transaction.atomic(using=target):
+            # Leftovers of an interrupted move would clash on primary keys.
+            delete_user_rows(target, user.pk, batch_size)
+            counts = copy_user_rows(source, target, user.pk, batch_size)
+        User.objects.filter(pk=user.pk).update(shard=target, shard_moving=False)
+    except BaseException:
+        User.objects.filter(pk=user.pk).update(shard_moving=False)
+        raise
+    user.shard = target
+    user.shard_moving = False
+    delete_user_rows(source, user.pk, batch_size)
+    return counts
+
+
+def plan_rebalance(limit):
+    """Up to `limit` (user, target) moves evening out the number of users per shard.
+
+    Users leave the fullest shards for the emptiest shard still open for
+    new users, newest accounts first.
+    """
+    counts = {db: 0 for db in settings.DATABASE_SHARDS}
+    counts.update(User.objects.order_by().values_list('shard').annotate(Count('pk')))
+    targets = settings.DATABASE_SHARDS_FOR_NEW_USERS
+    planned = []
+    while len(planned) < limit:
+        source = max(counts, key=counts.get)
+        target = min(targets, key=counts.get)
+        if counts[source] - counts[target] <= 1:
+            break
+        user = User.objects.filter(shard=source, shard_moving=False).exclude(
+            pk__in=[user.pk for user, db in planned]
+        ).order_by('-pk').first()
+        if user is None:
+            break
+        planned.append((user, target))
+        counts[source] -= 1
+        counts[target] += 1
+    return planned
@@ -0,0 +1,92 @@
+import threading
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_local = threading.local()
+
+# Models whose rows live on the shard of their user, with their m2m link tables.
+SHARDED_MODELS = frozenset({'core.recipe', 'core.tag', 'core.ingredient'})
+
+
+def is_sharded(model):
+    meta = model._meta
+    if meta.auto_created:
+        meta = meta.auto_created._meta
+    return meta.label_lower in SHARDED_MODELS
+
+
+def current_shard():
+    return getattr(_local, 'shard', None)
+
+
+def activate(alias):
+    """Route user data queries of this thread to `alias`, returning the previous shard"""
+    previous = current_shard()
+    _local.shard = alias
+    return previous
+
+
+@contextmanager
+def using_shard(alias):
+    previous = activate(alias)
+    try:
+        yield alias
+    finally:
+        activate(previous)
+
+
+def shard_of_user(user_id):
+    from django.contrib.auth import get_user_model
+
+    shard = get_user_model()._default_manager.filter(pk=user_id).values_list('shard', flat=True).first()
+    return shard or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def using_user(user_id):
+    """Route user data queries to the shard of a user, for code outside a request"""
+    with using_shard(shard_of_user(user_id)) as alias:
+        yield alias
+
+
+def shard_for_new_user(email):
+    """Stable placement of a new account on one of the shards open for new users"""
+    shards = settings.DATABASE_SHARDS_FOR_NEW_USERS
+    return shards[zlib.crc32(email.strip().lower().encode('utf-8')) % len(shards)]
+
+
+def id_range_start(alias):
+    """First primary key of a shard, so rows keep their ids when moved between shards"""
+    return settings.DATABASE_SHARDS.index(alias) * settings.DATABASE_SHARD_ID_SPAN + 1
+
+
+def reserve_id_ranges(using=DEFAULT_DB_ALIAS, apps=None, **kwargs):
+    """post_migrate handler moving the id sequences of a shard to its own range"""
+    if using not in settings.DATABASE_SHARDS:
+        return
+    start = id_range_start(using)
+    if start == 1:
+        return
+    from core.models import Recipe, Tag, Ingredient
+
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model in (Recipe, Tag, Ingredient):
+            table = model._meta.db_table
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, false) "
+                    "WHERE (SELECT COALESCE(MAX(id), 0) FROM {}) < %s".format(connection.ops.quote_name(table)),
+                    [connection.ops.quote_name(table), start, start]
+                )
+            elif connection.vendor == 'sqlite':
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) SELECT %s, 0 '
+                    'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                    [table, table]
+                )
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s',
+                               [start - 1, table, start - 1])
@@ -0,0 +1,68 @@
+import threading
+
+
+class Flight:
+    __slots__ = ('done', 'result', 'followers')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Share one in-flight computation between concurrent callers with the same key.
+
+    The first caller of a key leads: it runs the computation and hands the
+    result to `complete`. Callers arriving meanwhile wait for that result,
+    and run the computation themselves when the leader fails (a None
+    result) or takes longer than their timeout. Results are not kept once
+    the flight completes, so this is not a cache.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.led = self.shared = self.timeouts = self.failures = 0
+
+    def join(self, key):
+        """(flight, leader) for the key; the caller runs the computation when leader is True"""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                self.led += 1
+                return flight, True
+            flight.followers += 1
+            return flight, False
+
+    def wait(self, flight, timeout):
+        """The leader's result, None when it failed or did not finish within timeout seconds"""
+        finished = flight.done.wait(timeout)
+        result = flight.result if finished else None
+        with self.lock:
+            if not finished:
+                self.timeouts += 1
+            elif result is None:
+                self.failures += 1
+            else:
+                self.shared += 1
+        return result
+
+    def complete(self, key, flight, result):
+        """Release the waiters of a flight with its result, None when it failed"""
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+        flight.result = result
+        flight.done.set()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'in_flight': len(self.flights),
+                'led': self.led,
+                'shared': self.shared,
+                'timeouts': self.timeouts,
+                'failures': self.failures,
+            }
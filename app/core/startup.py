@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+
+# What a web worker does before serving its first request.
+COLD_START = '''
+import time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(time.perf_counter() - start)
+'''
+
+
+def cold_start(settings_module, importtime=False):
+    """Run COLD_START in a fresh interpreter and return the finished process"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [settings.BASE_DIR, env.get('PYTHONPATH')]))
+    args = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', COLD_START]
+    return subprocess.run(args, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True, check=True)
+
+
+def parse_importtime(output):
+    """Yield (module, self_us, cumulative_us, depth) from `-X importtime` output"""
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        yield name.strip(), int(self_us), int(cumulative_us), depth
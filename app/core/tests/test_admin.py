@@ -1,3 +1,4 @@
+from core.models import Recipe, Tag
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -40,3 +41,39 @@ class AdminSiteTests(TestCase):
         resp = self.client.get(url)
 
         self.assertEqual(resp.status_code, 200)
+
+    def test_tag_changelist_search(self):
+        """Test tags are searched by name prefix or owner email"""
+        Tag.objects.create(user=self.user, name="Vegan")
+        Tag.objects.create(user=self.admin_user, name="Dessert")
+        url = reverse("admin:core_tag_changelist")
+
+        by_prefix = self.client.get(url, {"q": "veg"})
+        by_email = self.client.get(url, {"q": self.admin_user.email})
+
+        self.assertEqual([tag.name for tag in by_prefix.context["cl"].result_list], ["Vegan"])
+        self.assertEqual([tag.name for tag in by_email.context["cl"].result_list], ["Dessert"])
+
+    def test_recipe_changelist_user_filter(self):
+        """Test recipes are filtered by owner without a COUNT per user"""
+        Recipe.objects.create(user=self.user, title="Curry", time_minutes=5, price=1)
+        Recipe.objects.create(user=self.admin_user, title="Soup", time_minutes=5, price=1)
+        url = reverse("admin:core_recipe_changelist")
+
+        resp = self.client.get(url, {"user_id": self.user.id})
+
+        self.assertEqual([recipe.title for recipe in resp.context["cl"].result_list], ["Curry"])
+        self.assertContains(resp, self.user.email)
+
+    def test_recipe_change_page_scopes_tags_to_owner(self):
+        """Test the recipe form only accepts and looks up the owner's tags"""
+        recipe = Recipe.objects.create(user=self.user, title="Curry", time_minutes=5, price=1)
+        own = Tag.objects.create(user=self.user, name="Vegan")
+        Tag.objects.create(user=self.admin_user, name="Dessert")
+        url = reverse("admin:core_recipe_change", args=[recipe.id])
+
+        resp = self.client.get(url)
+
+        tags = resp.context["adminform"].form.fields["tags"]
+        self.assertEqual(list(tags.queryset), [own])
+        self.assertContains(resp, "user_id=%d" % self.user.id)
@@ -0,0 +1,134 @@
+import threading
+import time
+
+from core import metrics
+from core.admission import AdmissionController, Rejected
+from core.middleware import AdmissionControlMiddleware
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+CLASSES = (('read', 1.0), ('write', 1.0), ('bulk', 1.0))
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    """Test concurrency limits, priority order and shedding"""
+
+    def acquire_in_thread(self, controller, user, name, results):
+        def run():
+            try:
+                results.append((name, controller.acquire(user, name)))
+            except Rejected as exc:
+                results.append((name, exc))
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def wait_queued(self, controller, count):
+        deadline = time.monotonic() + 1
+        while len(controller.waiters) < count and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertEqual(len(controller.waiters), count)
+
+    def test_queued_requests_admitted_by_priority(self):
+        """Test a cheap read queued after a bulk request runs first"""
+        controller = AdmissionController(1, 5, CLASSES)
+        running = controller.acquire('a', 'write')
+        results = []
+        threads = [self.acquire_in_thread(controller, 'b', 'bulk', results)]
+        self.wait_queued(controller, 1)
+        threads.append(self.acquire_in_thread(controller, 'c', 'read', results))
+        self.wait_queued(controller, 2)
+
+        controller.release(running, 0.01)
+        threads[1].join()
+        controller.release(results[0][1], 0.01)
+        threads[0].join()
+
+        self.assertEqual([name for name, ticket in results], ['read', 'bulk'])
+        self.assertEqual(controller.in_flight, 1)
+
+    def test_per_user_limit(self):
+        """Test a busy user is refused while other users get through"""
+        controller = AdmissionController(4, 1, (('read', 0.1),))
+        controller.acquire('heavy', 'read')
+        results = []
+        thread = self.acquire_in_thread(controller, 'heavy', 'read', results)
+        self.wait_queued(controller, 1)
+
+        with self.assertRaises(Rejected) as context:
+            controller.acquire('heavy', 'read')
+        other = controller.acquire('light', 'read')
+        thread.join()
+
+        self.assertEqual(context.exception.status, 429)
+        self.assertTrue(other.admitted)
+        self.assertEqual(results[0][1].status, 503)
+
+    def test_shed_after_deadline(self):
+        """Test a request queued past its class target is shed"""
+        controller = AdmissionController(1, 5, (('read', 0.01),))
+        controller.acquire('a', 'read')
+
+        with self.assertRaises(Rejected) as context:
+            controller.acquire('b', 'read')
+
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(controller.stats()['shed'], {'read': 1})
+        self.assertEqual(controller.stats()['queued'], {'read': 0})
+
+    def test_shed_when_predicted_wait_too_long(self):
+        """Test a request is refused at once when the queue is too slow"""
+        controller = AdmissionController(1, 5, (('read', 0.5),))
+        controller.service_time = 2.0
+        controller.acquire('a', 'read')
+
+        started = time.monotonic()
+        with self.assertRaises(Rejected) as context:
+            controller.acquire('b', 'read')
+
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(context.exception.retry_after, 2)
+
+
+@override_settings(ADMISSION_MAX_IN_FLIGHT=1, ADMISSION_CLASSES=(('read', 0.01), ('write', 0.01), ('bulk', 0.01)))
+class AdmissionControlMiddlewareTests(SimpleTestCase):
+    """Test requests are admitted, shed and exempted by route"""
+
+    def setUp(self):
+        self.middleware = AdmissionControlMiddleware(lambda request: HttpResponse())
+        self.factory = RequestFactory()
+
+    def request(self, path, view_name, namespaces=()):
+        request = self.factory.get(path, HTTP_AUTHORIZATION='Token abc')
+        request.resolver_match = type('Match', (), {'view_name': view_name, 'namespaces': list(namespaces)})()
+        return request
+
+    def test_overloaded_request_is_shed(self):
+        """Test a request over the limit gets a 503 with Retry-After"""
+        self.middleware.controller.acquire('other', 'read')
+        request = self.request('/api/recipe/tags/', 'recipe:tag-list')
+
+        response = self.middleware.process_view(request, None, (), {})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(metrics.snapshot()['admission']['shed'], {'read': 1})
+
+    def test_slot_released_after_response(self):
+        """Test an admitted request frees its slot when done"""
+        request = self.request('/api/recipe/recipe/1/upload-image/', 'recipe:recipe-upload-image')
+
+        self.assertIsNone(self.middleware.process_view(request, None, (), {}))
+        self.assertEqual(self.middleware.controller.in_flight, 1)
+        self.middleware(request)
+
+        self.assertEqual(self.middleware.controller.in_flight, 0)
+        self.assertEqual(self.middleware.controller.stats()['admitted'], {'bulk': 1})
+
+    def test_exempt_routes(self):
+        """Test metrics and the admin are never queued"""
+        self.middleware.controller.acquire('other', 'read')
+
+        for request in (self.request('/api/metrics/', 'metrics'),
+                        self.request('/admin/', 'admin:index', ['admin'])):
+            self.assertIsNone(self.middleware.process_view(request, None, (), {}))
@@ -0,0 +1,94 @@
+import json
+import tempfile
+
+from core.models import Recipe, Tag
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+BATCH_URL = reverse("batch")
+
+
+class BatchApiTests(TestCase):
+    """Test running several API operations in one request"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("batch@test.com", "testpass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_login_required(self):
+        """Test the batch endpoint requires authentication"""
+        resp = APIClient().post(BATCH_URL, {"operations": []}, format="json")
+
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_operations_reference_earlier_results(self):
+        """Test later operations can use ids returned by earlier ones"""
+        resp = self.client.post(BATCH_URL, {"operations": [
+            {"id": "tag", "method": "POST", "path": "/api/recipe/tags/", "body": {"name": "Vegan"}},
+            {"id": "ingredient", "method": "POST", "path": "/api/recipe/ingredient/", "body": {"name": "Tofu"}},
+            {"id": "recipe", "method": "POST", "path": "/api/recipe/recipe/", "body": {
+                "title": "Tofu bowl", "time_minutes": 10, "price": "5.00",
+                "tags": ["{{tag.id}}"], "ingredients": ["{{ingredient.id}}"],
+            }},
+            {"method": "GET", "path": "/api/recipe/recipe/{{recipe.id}}/"},
+        ]}, format="json")
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([result["status"] for result in resp.data["results"]], [201, 201, 201, 200])
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(list(recipe.tags.values_list("name", flat=True)), ["Vegan"])
+        self.assertEqual(resp.data["results"][3]["body"]["ingredients"][0]["name"], "Tofu")
+
+    def test_atomic_batch_rolls_back_on_failure(self):
+        """Test a failing operation undoes the earlier ones of an atomic batch"""
+        resp = self.client.post(BATCH_URL, {"atomic": True, "operations": [
+            {"id": "tag", "method": "POST", "path": "/api/recipe/tags/", "body": {"name": "Vegan"}},
+            {"method": "POST", "path": "/api/recipe/recipe/", "body": {"title": "No time"}},
+            {"method": "GET", "path": "/api/recipe/tags/"},
+        ]}, format="json")
+
+        self.assertFalse(resp.data["committed"])
+        self.assertEqual([result["status"] for result in resp.data["results"]], [201, 400])
+        self.assertFalse(Tag.objects.exists())
+
+    def test_failed_dependency(self):
+        """Test references to failed operations are reported, not guessed"""
+        resp = self.client.post(BATCH_URL, {"operations": [
+            {"id": "recipe", "method": "POST", "path": "/api/recipe/recipe/", "body": {"title": "No time"}},
+            {"method": "GET", "path": "/api/recipe/recipe/{{recipe.id}}/"},
+            {"method": "GET", "path": "/api/recipe/tags/"},
+        ]}, format="json")
+
+        self.assertTrue(resp.data["committed"])
+        self.assertEqual([result["status"] for result in resp.data["results"]], [400, 424, 200])
+
+    def test_rejects_paths_outside_api(self):
+        """Test only the recipe and user APIs can be batched"""
+        for path in ("/admin/", "/api/batch/", "/api/metrics/"):
+            resp = self.client.post(BATCH_URL, {"operations": [{"method": "GET", "path": path}]}, format="json")
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, path)
+
+    def test_multipart_batch_uploads_image(self):
+        """Test a recipe can be created and given an image in one batch"""
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as ntf:
+            Image.new("RGB", (10, 10)).save(ntf, format="JPEG")
+            ntf.seek(0)
+            resp = self.client.post(BATCH_URL, {
+                "operations": json.dumps([
+                    {"id": "recipe", "method": "POST", "path": "/api/recipe/recipe/",
+                     "body": {"title": "Pie", "time_minutes": 30, "price": "3.00", "tags": [], "ingredients": []}},
+                    {"method": "POST", "path": "/api/recipe/recipe/{{recipe.id}}/upload-image/",
+                     "files": {"image": "photo"}},
+                ]),
+                "photo": ntf,
+            }, format="multipart")
+
+        self.assertEqual([result["status"] for result in resp.data["results"]], [201, 200])
+        recipe = Recipe.objects.get(user=self.user)
+        self.addCleanup(recipe.image.delete)
+        self.assertTrue(recipe.image.name.endswith(".jpg"))
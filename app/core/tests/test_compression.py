@@ -0,0 +1,58 @@
+import gzip
+
+import brotli
+import msgpack
+from core.models import Tag
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+TAGS_URL = reverse("recipe:tag-list")
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100)
+class CompressionTests(TestCase):
+    """Test compressed and MessagePack responses"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("wire@test.com", "testpass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for i in range(20):
+            Tag.objects.create(user=self.user, name="Tag %d" % i)
+
+    def test_gzip_json(self):
+        """Test large JSON responses are gzipped when accepted"""
+        resp = self.client.get(TAGS_URL, HTTP_ACCEPT_ENCODING="gzip, deflate")
+
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(resp.content).count(b'"name"'), 20)
+
+    def test_brotli_preferred(self):
+        """Test brotli wins when both encodings are accepted"""
+        resp = self.client.get(TAGS_URL, HTTP_ACCEPT_ENCODING="gzip, br")
+
+        self.assertEqual(resp["Content-Encoding"], "br")
+        self.assertIn(b"Tag 19", brotli.decompress(resp.content))
+
+    def test_small_or_unaccepted_responses_not_compressed(self):
+        """Test responses stay plain below the threshold or without Accept-Encoding"""
+        plain = self.client.get(TAGS_URL)
+        with override_settings(COMPRESSION_MIN_SIZE=10 ** 6):
+            small = self.client.get(TAGS_URL, HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertFalse(small.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", small["Vary"])
+
+    def test_msgpack_request_and_response(self):
+        """Test MessagePack bodies are parsed and rendered"""
+        resp = self.client.post(
+            TAGS_URL, msgpack.packb({"name": "Packed"}), content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+
+        self.assertEqual(resp["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(resp.content)["name"], "Packed")
+        self.assertTrue(Tag.objects.filter(user=self.user, name="Packed").exists())
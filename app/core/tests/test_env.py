@@ -0,0 +1,33 @@
+from unittest.mock import patch
+
+from app.env import env_bool, env_int, env_json, env_list
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+
+class EnvTests(SimpleTestCase):
+    """Test typed environment settings"""
+
+    def test_defaults_when_unset(self):
+        """Test defaults are returned for unset variables"""
+        with patch.dict('os.environ', {}, clear=True):
+            self.assertFalse(env_bool('DJANGO_DEBUG'))
+            self.assertEqual(env_int('DB_CONNECT_TIMEOUT', 5), 5)
+            self.assertEqual(env_list('DJANGO_ALLOWED_HOSTS', ['localhost']), ['localhost'])
+
+    def test_parse_values(self):
+        """Test values are converted to their type"""
+        env = {'DEBUG': 'yes', 'TIMEOUT': '250', 'HOSTS': 'a.com, b.com,', 'RATES': '{"recipe": 0.1}'}
+        with patch.dict('os.environ', env):
+            self.assertTrue(env_bool('DEBUG'))
+            self.assertEqual(env_int('TIMEOUT'), 250)
+            self.assertEqual(env_list('HOSTS'), ['a.com', 'b.com'])
+            self.assertEqual(env_json('RATES'), {'recipe': 0.1})
+
+    def test_invalid_values(self):
+        """Test malformed values fail loudly"""
+        with patch.dict('os.environ', {'DEBUG': 'maybe', 'TIMEOUT': '5s'}):
+            with self.assertRaises(ImproperlyConfigured):
+                env_bool('DEBUG')
+            with self.assertRaises(ImproperlyConfigured):
+                env_int('TIMEOUT')
@@ -0,0 +1,105 @@
+import io
+import json
+import logging
+import threading
+import time
+
+from core import logs
+from core.logs import JSONFormatter, SamplingFilter, BackgroundQueueHandler
+from django.test import SimpleTestCase
+
+
+def make_record(name='recipe.views', level=logging.DEBUG, msg='hello %s', args=('world',), **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class JSONFormatterTests(SimpleTestCase):
+    def test_format_includes_extra_fields(self):
+        """Test records are rendered as JSON with their extra fields"""
+        payload = json.loads(JSONFormatter().format(make_record(action='list')))
+
+        self.assertEqual(payload['message'], 'hello world')
+        self.assertEqual(payload['level'], 'DEBUG')
+        self.assertEqual(payload['logger'], 'recipe.views')
+        self.assertEqual(payload['action'], 'list')
+
+
+class SamplingFilterTests(SimpleTestCase):
+    def test_longest_prefix_rate(self):
+        """Test the most specific logger rate applies"""
+        sampling = SamplingFilter({'recipe': 1.0, 'recipe.views': 0.0})
+
+        self.assertFalse(sampling.filter(make_record('recipe.views')))
+        self.assertTrue(sampling.filter(make_record('recipe.serializers')))
+        self.assertTrue(sampling.filter(make_record('core.models')))
+
+    def test_warnings_never_sampled(self):
+        """Test warnings and errors are always kept"""
+        sampling = SamplingFilter({'': 0.0})
+
+        self.assertTrue(sampling.filter(make_record(level=logging.WARNING)))
+        self.assertFalse(sampling.filter(make_record(level=logging.INFO)))
+
+
+class BackgroundQueueHandlerTests(SimpleTestCase):
+    def test_records_written_by_background_thread(self):
+        """Test enqueued records are formatted and written by the listener"""
+        stream = io.StringIO()
+        handler = BackgroundQueueHandler(stream)
+        handler.setFormatter(JSONFormatter())
+        handler.handle(make_record(action='retrieve'))
+        handler.flush()
+        handler.close()
+
+        payload = json.loads(stream.getvalue())
+        self.assertEqual(payload['message'], 'hello world')
+        self.assertEqual(payload['action'], 'retrieve')
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test records are dropped and counted once the queue is full"""
+        handler = BackgroundQueueHandler(io.StringIO(), maxsize=1)
+        handler.stop()
+        handler.handle(make_record())
+        handler.handle(make_record())
+        handler.close()
+
+        self.assertEqual(handler.dropped, 1)
+
+    def test_close_waits_for_room_in_full_queue(self):
+        """Test stopping with a full queue waits for the writer instead of raising"""
+        release = threading.Event()
+
+        class SlowStream(io.StringIO):
+            def write(self, text):
+                release.wait(5)
+                return super().write(text)
+
+        stream = SlowStream()
+        handler = BackgroundQueueHandler(stream, maxsize=1)
+        handler.handle(make_record())
+        deadline = time.monotonic() + 1
+        while handler.queue.qsize() and time.monotonic() < deadline:
+            time.sleep(0.001)
+        handler.handle(make_record())
+        threading.Timer(0.05, release.set).start()
+        handler.close()
+
+        self.assertEqual(stream.getvalue().splitlines(), ['hello world'] * 2)
+        self.assertEqual(handler.dropped, 0)
+
+    def test_metrics_cover_open_handlers(self):
+        """Test one metric sums the handlers still open, not the ones replaced by dictConfig"""
+        before = logs.stats()['dropped']
+        handlers = [BackgroundQueueHandler(io.StringIO(), maxsize=1) for _ in range(2)]
+        for handler in handlers:
+            handler.stop()
+            handler.handle(make_record())
+            handler.handle(make_record())
+
+        self.assertEqual(logs.stats()['dropped'], before + 2)
+        handlers[0].close()
+        self.assertEqual(logs.stats()['dropped'], before + 1)
+        self.assertNotIn(handlers[0], logs.open_handlers)
+        handlers[1].close()
@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+MEDIA_ROOT = tempfile.mkdtemp()
+CONTENT = bytes(range(256)) * 4
+
+
+def media_url(path):
+    """Return the URL a media file is served from"""
+    return reverse("media", args=[path])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_ACCEL_REDIRECT_PREFIX=None, MEDIA_SENDFILE_HEADER=None)
+class MediaServeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(MEDIA_ROOT, 'uploads/recipe'), exist_ok=True)
+        for path in ('uploads/recipe/image.jpg', 'other.txt'):
+            with open(os.path.join(MEDIA_ROOT, path), 'wb') as f:
+                f.write(CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_full_file_with_cache_headers(self):
+        """Test full file is served with validators and immutable caching"""
+        resp = self.client.get(media_url('uploads/recipe/image.jpg'))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b''.join(resp.streaming_content), CONTENT)
+        self.assertEqual(resp['Content-Type'], 'image/jpeg')
+        self.assertEqual(resp['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(resp['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', resp['Cache-Control'])
+        self.assertTrue(resp['ETag'].startswith('"'))
+
+    def test_mutable_path_short_cache(self):
+        """Test files outside immutable prefixes are not cached forever"""
+        resp = self.client.get(media_url('other.txt'))
+
+        self.assertNotIn('immutable', resp['Cache-Control'])
+
+    def test_if_none_match_not_modified(self):
+        """Test a matching ETag returns 304 without a body"""
+        url = media_url('uploads/recipe/image.jpg')
+        etag = self.client.get(url)['ETag']
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], etag)
+
+    def test_range_request(self):
+        """Test a single byte range returns 206 with the slice"""
+        resp = self.client.get(media_url('uploads/recipe/image.jpg'), HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b''.join(resp.streaming_content), CONTENT[10:20])
+        self.assertEqual(resp['Content-Range'], 'bytes 10-19/%d' % len(CONTENT))
+        self.assertEqual(resp['Content-Length'], '10')
+
+    def test_suffix_range_request(self):
+        """Test a suffix range returns the end of the file"""
+        resp = self.client.get(media_url('uploads/recipe/image.jpg'), HTTP_RANGE='bytes=-5')
+
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b''.join(resp.streaming_content), CONTENT[-5:])
+
+    def test_unsatisfiable_range(self):
+        """Test a range past the end of file returns 416"""
+        resp = self.client.get(media_url('uploads/recipe/image.jpg'), HTTP_RANGE='bytes=5000-')
+
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp['Content-Range'], 'bytes */%d' % len(CONTENT))
+
+    def test_stale_if_range_serves_full_file(self):
+        """Test a stale If-Range validator ignores the Range header"""
+        resp = self.client.get(media_url('uploads/recipe/image.jpg'), HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"')
+
+        self.assertEqual(resp.status_code, 200)
+
+    def test_missing_file_and_traversal(self):
+        """Test missing files return 404 and paths outside MEDIA_ROOT are rejected"""
+        self.assertEqual(self.client.get(media_url('nope.jpg')).status_code, 404)
+        self.assertEqual(self.client.get(media_url('uploads')).status_code, 404)
+        self.assertEqual(self.client.get(media_url('../etc/passwd')).status_code, 400)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        """Test delegation to the proxy through X-Accel-Redirect"""
+        resp = self.client.get(media_url('uploads/recipe/image.jpg'))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['X-Accel-Redirect'], '/protected-media/uploads/recipe/image.jpg')
+        self.assertEqual(resp.content, b'')
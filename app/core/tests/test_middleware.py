@@ -0,0 +1,107 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from core.middleware import StatementTimeout, StatementTimeoutMiddleware
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+
+class QueryCanceled(Exception):
+    pgcode = '57014'
+
+
+@override_settings(DB_STATEMENT_TIMEOUTS={'recipe:recipe-list': 100})
+class StatementTimeoutMiddlewareTests(TestCase):
+    """Test per endpoint statement timeouts"""
+
+    def setUp(self):
+        self.middleware = StatementTimeoutMiddleware(lambda request: HttpResponse())
+        self.request = RequestFactory().get('/api/recipe/recipe/')
+        self.request.statement_timeout = StatementTimeout()
+        self.connections = {}
+
+    def test_query_canceled_returns_503(self):
+        """Test a statement timeout becomes a service unavailable response"""
+        try:
+            raise OperationalError('canceling statement') from QueryCanceled()
+        except OperationalError as exc:
+            response = self.middleware.process_exception(self.request, exc)
+
+        self.assertEqual(response.status_code, 503)
+
+    def test_other_errors_are_not_handled(self):
+        """Test unrelated database errors propagate"""
+        self.assertIsNone(self.middleware.process_exception(self.request, OperationalError('gone')))
+
+    def run_queries(self, statement_timeout, *aliases, in_atomic_block=False, cursor_name=None):
+        """The SQL sent for one query per alias through the wrapper"""
+        sent = []
+        for alias in aliases:
+            connection = self.connections.setdefault(alias, SimpleNamespace(alias=alias))
+            connection.in_atomic_block = in_atomic_block
+            context = {'connection': connection, 'cursor': SimpleNamespace(cursor=SimpleNamespace(name=cursor_name))}
+            statement_timeout(lambda sql, params, many, context: sent.append(sql), 'SELECT 1', None, False, context)
+        return sent
+
+    def test_override_sent_with_first_query(self):
+        """Test an endpoint's timeout is SET in the same round-trip as its first query per database"""
+        statement_timeout = StatementTimeout()
+        statement_timeout.timeout = 100
+
+        sent = self.run_queries(statement_timeout, 'default', 'default', 'shard1')
+
+        self.assertEqual(sent, ['SET statement_timeout = 100; SELECT 1', 'SELECT 1', 'SET statement_timeout = 100; SELECT 1'])
+        self.assertEqual(statement_timeout.aliases, {'default', 'shard1'})
+
+    def test_override_reset_by_next_request(self):
+        """Test a later request resets an override once, and other requests send nothing extra"""
+        overridden = StatementTimeout()
+        overridden.timeout = 100
+        self.run_queries(overridden, 'default')
+
+        self.assertEqual(self.run_queries(StatementTimeout(), 'default', 'default'), ['RESET statement_timeout; SELECT 1', 'SELECT 1'])
+        self.assertEqual(self.run_queries(StatementTimeout(), 'default'), ['SELECT 1'])
+
+    def test_reset_repeated_after_transaction(self):
+        """Test a RESET sent inside a transaction, which may roll back, is sent again"""
+        overridden = StatementTimeout()
+        overridden.timeout = 100
+        self.run_queries(overridden, 'default')
+
+        self.run_queries(StatementTimeout(), 'default', in_atomic_block=True)
+
+        self.assertEqual(self.run_queries(StatementTimeout(), 'default'), ['RESET statement_timeout; SELECT 1'])
+
+    def test_named_cursor_waits_for_next_query(self):
+        """Test server side cursors, which take one statement, are sent as they are"""
+        statement_timeout = StatementTimeout()
+        statement_timeout.timeout = 100
+
+        self.assertEqual(self.run_queries(statement_timeout, 'default', cursor_name='chunked'), ['SELECT 1'])
+        self.assertEqual(self.run_queries(statement_timeout, 'default'), ['SET statement_timeout = 100; SELECT 1'])
+
+    def test_wrapper_installed_for_the_request(self):
+        """Test the request's wrapper covers PostgreSQL connections while the response is built"""
+        installed = []
+
+        def get_response(request):
+            self.middleware.process_view(request, None, (), {})
+            installed.extend(connection.execute_wrappers)
+            return HttpResponse()
+
+        self.middleware.get_response = get_response
+        self.request.resolver_match = type('Match', (), {'view_name': 'recipe:recipe-list'})()
+        with patch.object(connection, 'vendor', 'postgresql'):
+            self.middleware(self.request)
+
+        self.assertEqual(installed, [self.request.statement_timeout])
+        self.assertEqual(self.request.statement_timeout.timeout, 100)
+        self.assertEqual(connection.execute_wrappers, [])
+
+    def test_no_override_for_other_views(self):
+        """Test views without an override keep the connection's web default"""
+        self.request.resolver_match = type('Match', (), {'view_name': 'recipe:tag-list'})()
+        self.middleware.process_view(self.request, None, (), {})
+
+        self.assertIsNone(self.request.statement_timeout.timeout)
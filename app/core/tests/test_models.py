@@ -2,6 +2,7 @@ from unittest.mock import patch
 
 from core.models import Tag, Ingredient, Recipe, recipe_image_file_path
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
 
@@ -62,6 +63,39 @@ class ModelTest(TestCase):
         )
         self.assertEqual(str(ingredients), ingredients.name)
 
+    def test_ingredient_name_unique_per_user(self):
+        """Test ingredient names are unique per user ignoring case"""
+        user = sample_user()
+        Ingredient.objects.create(user=user, name="Cucumber")
+
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Ingredient.objects.create(user=user, name="CUCUMBER")
+
+    def test_ingredient_upsert(self):
+        """Test upsert returns the existing ingredient"""
+        user = sample_user()
+        ingredient = Ingredient.objects.create(user=user, name="Cucumber")
+
+        existing, created = Ingredient.objects.upsert(user, "cucumber")
+        new, new_created = Ingredient.objects.upsert(user, "Salt")
+
+        self.assertEqual((existing, created), (ingredient, False))
+        self.assertTrue(new_created)
+        self.assertEqual(Ingredient.objects.get(pk=new.pk).name, "Salt")
+
+    @patch('core.models.supports_insert_returning', return_value=False)
+    def test_ingredient_upsert_without_returning(self, mock_returning):
+        """Test upsert falls back to create then get where RETURNING is missing"""
+        user = sample_user()
+        ingredient = Ingredient.objects.create(user=user, name="Cucumber")
+
+        self.assertEqual(Ingredient.objects.upsert(user, "cucumber"), (ingredient, False))
+        new, created = Ingredient.objects.upsert(user, "Salt")
+
+        self.assertTrue(created)
+        self.assertEqual(Ingredient.objects.get(pk=new.pk).name, "Salt")
+
     def test_recipe_str(self):
         """Test recipe string representation"""
         recipe = Recipe.objects.create(
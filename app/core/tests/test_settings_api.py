@@ -0,0 +1,40 @@
+from app import settings_api
+from core.startup import parse_importtime
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+
+@override_settings(ROOT_URLCONF=settings_api.ROOT_URLCONF, MIDDLEWARE=settings_api.MIDDLEWARE)
+class ApiProfileTests(TestCase):
+    """Test the API-only settings profile"""
+
+    def test_profile_drops_admin_and_sessions(self):
+        """Test the API profile has no admin, session or CSRF machinery"""
+        self.assertNotIn('django.contrib.admin', settings_api.INSTALLED_APPS)
+        self.assertNotIn('django.contrib.sessions', settings_api.INSTALLED_APPS)
+        self.assertNotIn('django.middleware.csrf.CsrfViewMiddleware', settings_api.MIDDLEWARE)
+        self.assertEqual(self.client.get('/admin/').status_code, 404)
+
+    def test_token_auth_without_session_middleware(self):
+        """Test token authenticated API requests work in the API profile"""
+        user = get_user_model().objects.create_user('api@test.com', 'testpass')
+        token = Token.objects.create(user=user)
+
+        resp = self.client.get('/api/user/me/', HTTP_AUTHORIZATION='Token %s' % token.key)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['email'], 'api@test.com')
+
+    def test_parse_importtime(self):
+        """Test -X importtime output is parsed with nesting depth"""
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   recipe.cache\n'
+            'import time:       300 |        420 | recipe.signals\n'
+        )
+
+        self.assertEqual(list(parse_importtime(output)), [
+            ('recipe.cache', 120, 120, 1),
+            ('recipe.signals', 300, 420, 0),
+        ])
@@ -0,0 +1,168 @@
+from io import StringIO
+from unittest import skipIf
+from unittest.mock import patch
+
+from core.models import Recipe, Tag, Ingredient
+from core.shards import id_range_start, shard_for_new_user, using_user
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from users.purge import purge_user_data
+
+RECIPES_URL = reverse("recipe:recipe-list")
+TAGS_URL = reverse("recipe:tag-list")
+
+
+@skipIf(len(settings.DATABASE_SHARDS) < 2, 'Run with --settings app.settings_shards_test')
+class ShardingTests(TestCase):
+    """Test user data is kept on the shard of its user"""
+    multi_db = True
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="sharded@test.com", password="password1", shard="shard1"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sample_recipe(self, user, title="Curry"):
+        with using_user(user.pk):
+            recipe = Recipe.objects.create(user=user, title=title, time_minutes=5, price=1)
+            recipe.tags.add(Tag.objects.create(user=user, name=title + " tag"))
+            recipe.ingredients.add(Ingredient.objects.create(user=user, name=title + " ingredient"))
+        return recipe
+
+    def test_new_users_are_placed_by_email(self):
+        """Test new users get the shard derived from their email"""
+        emails = ["user%d@test.com" % i for i in range(20)]
+        users = [get_user_model().objects.create_user(email=email) for email in emails]
+
+        self.assertEqual([user.shard for user in users], [shard_for_new_user(email) for email in emails])
+        self.assertEqual({user.shard for user in users}, set(settings.DATABASE_SHARDS))
+
+    def test_api_writes_go_to_the_user_shard(self):
+        """Test rows created through the API live on the user's shard only"""
+        tag = self.client.post(TAGS_URL, {"name": "Vegan"})
+        resp = self.client.post(RECIPES_URL, {
+            "title": "Salad", "time_minutes": 5, "price": "2.00", "tags": [tag.data["id"]]
+        })
+
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.using("shard1").get(pk=resp.data["id"])
+        self.assertEqual(list(recipe.tags.values_list("name", flat=True)), ["Vegan"])
+        self.assertFalse(Recipe.objects.using("default").exists())
+        self.assertGreaterEqual(recipe.pk, id_range_start("shard1"))
+        self.assertEqual([r["title"] for r in self.client.get(RECIPES_URL).data], ["Salad"])
+
+    @override_settings(DB_STATEMENT_TIMEOUTS={"recipe:tag-list": 100})
+    def test_statement_timeout_on_user_shard(self):
+        """Test an endpoint's statement timeout is sent to the shard the user's queries run on"""
+        Tag.objects.using("shard1").create(user=self.user, name="Vegan")
+        sent = []
+        execute = CursorWrapper._execute
+
+        def record(cursor, sql, params, *args):
+            sent.append((cursor.db.alias, sql))
+            # SQLite takes one statement at a time; run the query itself.
+            return execute(cursor, sql.split("; ", 1)[-1], params, *args)
+
+        with patch.object(CursorWrapper, "_execute", record), \
+                patch.object(connections["default"], "vendor", "postgresql"), \
+                patch.object(connections["shard1"], "vendor", "postgresql"):
+            resp = self.client.get(TAGS_URL)
+
+        self.assertEqual([tag["name"] for tag in resp.data], ["Vegan"])
+        shard_sql = [sql for alias, sql in sent if alias == "shard1"]
+        self.assertTrue(shard_sql[0].startswith("SET statement_timeout = 100; SELECT "))
+        self.assertFalse([sql for sql in shard_sql[1:] if "statement_timeout" in sql])
+
+    def test_writes_refused_while_moving(self):
+        """Test a user being moved can read but not write"""
+        self.sample_recipe(self.user)
+        self.user.shard_moving = True
+
+        read = self.client.get(RECIPES_URL)
+        write = self.client.post(TAGS_URL, {"name": "Vegan"})
+
+        self.assertEqual(len(read.data), 1)
+        self.assertEqual(write.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn("Retry-After", write)
+
+    def test_move_user_shard(self):
+        """Test moving a user keeps ids and links and empties the old shard"""
+        recipe = self.sample_recipe(self.user)
+        other = get_user_model().objects.create_user(email="other@test.com", shard="shard1")
+        self.sample_recipe(other, "Soup")
+
+        call_command("move_user_shard", "--user", self.user.email, "--to", "default", "--grace", "0", stdout=StringIO())
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.shard, "default")
+        self.assertFalse(self.user.shard_moving)
+        moved = Recipe.objects.using("default").get(pk=recipe.pk)
+        self.assertEqual(list(moved.tags.values_list("name", flat=True)), ["Curry tag"])
+        self.assertEqual(list(moved.ingredients.values_list("name", flat=True)), ["Curry ingredient"])
+        self.assertFalse(Recipe.objects.using("shard1").filter(user=self.user).exists())
+        self.assertFalse(Tag.objects.using("shard1").filter(user=self.user).exists())
+        self.assertEqual(Recipe.objects.using("shard1").get().title, "Soup")
+        self.assertEqual(Recipe.tags.through.objects.using("shard1").count(), 1)
+        self.assertEqual([r["id"] for r in self.client.get(RECIPES_URL).data], [recipe.pk])
+
+    def test_rebalance(self):
+        """Test rebalancing evens out the users per shard"""
+        for i in range(4):
+            get_user_model().objects.create_user(email="user%d@test.com" % i, shard="default")
+
+        call_command("move_user_shard", "--rebalance", "--grace", "0", stdout=StringIO())
+
+        counts = [get_user_model().objects.filter(shard=shard).count() for shard in settings.DATABASE_SHARDS]
+        self.assertEqual(sorted(counts), [2, 3])
+
+    def test_purge_user_on_shard(self):
+        """Test purging an account removes the rows on its shard"""
+        self.sample_recipe(self.user)
+
+        totals = purge_user_data(self.user.pk)
+
+        self.assertEqual(totals["recipes"], 1)
+        self.assertFalse(Recipe.objects.using("shard1").exists())
+        self.assertFalse(Tag.objects.using("shard1").exists())
+
+    def test_deleting_user_purges_shard(self):
+        """Test deleting a user outside the purge job still removes their rows on other shards"""
+        self.sample_recipe(self.user)
+        other = get_user_model().objects.create_user(email="other@test.com", shard="shard1")
+        kept = self.sample_recipe(other, "Soup")
+
+        self.user.delete()
+
+        self.assertEqual(list(Recipe.objects.using("shard1").all()), [kept])
+        self.assertEqual(list(Tag.objects.using("shard1").values_list("name", flat=True)), ["Soup tag"])
+        self.assertEqual(Ingredient.objects.using("shard1").count(), 1)
+        self.assertEqual(Recipe.tags.through.objects.using("shard1").count(), 1)
+
+    def test_admin_changelist_browses_one_shard(self):
+        """Test the admin lists the first shard by default and the owner's shard when filtered"""
+        admin = get_user_model().objects.create_superuser(email="admin@test.com", password="password1")
+        self.sample_recipe(admin, "Soup")
+        self.sample_recipe(self.user, "Curry")
+        self.client.force_login(admin)
+        url = reverse("admin:core_recipe_changelist")
+
+        titles = {
+            name: [recipe.title for recipe in self.client.get(url, params).context["cl"].result_list]
+            for name, params in (
+                ("unfiltered", {}),
+                ("shard", {"shard": "shard1"}),
+                ("user", {"user_id": self.user.pk}),
+                ("email", {"q": self.user.email}),
+            )
+        }
+
+        self.assertEqual(titles, {"unfiltered": ["Soup"], "shard": ["Curry"], "user": ["Curry"], "email": ["Curry"]})
@@ -0,0 +1,43 @@
+import threading
+
+from core.singleflight import SingleFlight
+from django.test import SimpleTestCase
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Test concurrent callers share the leader's result"""
+
+    def test_followers_get_leader_result(self):
+        """Test every caller joining while the leader runs waits for its result"""
+        group = SingleFlight()
+        flight, leader = group.join('key')
+        results = []
+        followers = []
+        for _ in range(4):
+            joined, is_leader = group.join('key')
+            self.assertFalse(is_leader)
+            thread = threading.Thread(target=lambda joined=joined: results.append(group.wait(joined, 5)))
+            thread.start()
+            followers.append(thread)
+
+        group.complete('key', flight, 'result')
+        for thread in followers:
+            thread.join()
+
+        self.assertTrue(leader)
+        self.assertEqual(results, ['result'] * 4)
+        self.assertEqual(group.join('key')[1], True)
+        self.assertEqual(group.stats(), {'in_flight': 1, 'led': 2, 'shared': 4, 'timeouts': 0, 'failures': 0})
+
+    def test_timeout_and_failure(self):
+        """Test a follower gets None when the leader is too slow or fails"""
+        group = SingleFlight()
+        flight, _ = group.join('key')
+        follower, _ = group.join('key')
+
+        self.assertIsNone(group.wait(follower, 0.01))
+        group.complete('key', flight, None)
+        self.assertIsNone(group.wait(follower, 0.01))
+        self.assertEqual(group.stats()['timeouts'], 1)
+        self.assertEqual(group.stats()['failures'], 1)
+        self.assertEqual(group.stats()['in_flight'], 0)
@@ -0,0 +1,45 @@
+from rest_framework import authentication, permissions, status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import metrics, shards
+
+
+class MetricsView(APIView):
+    """Expose process local cache and server metrics to staff users"""
+    authentication_classes = (authentication.TokenAuthentication,)
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(metrics.snapshot())
+
+
+class ShardMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Your data is being moved, try again shortly.'
+    default_code = 'shard_moving'
+    wait = 5
+
+
+class UserShardMixin:
+    """Run the queries of a request on the shard of the authenticated user.
+
+    While the user's data is being moved between shards only reads are
+    served; writes get a 503 with Retry-After.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user = request.user
+        if user.is_authenticated:
+            if user.shard_moving and request.method not in permissions.SAFE_METHODS:
+                raise ShardMoving()
+            shards.activate(user.shard)
+
+    def dispatch(self, request, *args, **kwargs):
+        previous = shards.current_shard()
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            shards.activate(previous)
@@ -0,0 +1,24 @@
+#!/bin/sh
+# Container entrypoint: `web` (default) serves the API with gunicorn,
+# using DJANGO_SETTINGS_MODULE (app.settings_api for API-only workers),
+# `worker` runs background jobs, anything else is run as a command.
+set -e
+
+case "${1:-web}" in
+  web)
+    python manage.py wait_for_db
+    # Migrate with the full profile so admin and session tables exist too,
+    # on every shard (see DB_SHARDS).
+    for db in $(python manage.py shell --settings app.settings -c "from django.conf import settings; print(*settings.DATABASE_SHARDS)"); do
+      python manage.py migrate --noinput --settings app.settings --database "$db"
+    done
+    exec gunicorn app.wsgi
+    ;;
+  worker)
+    python manage.py wait_for_db
+    exec python manage.py run_worker
+    ;;
+  *)
+    exec "$@"
+    ;;
+esac
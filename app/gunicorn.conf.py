@@ -0,0 +1,63 @@
+"""Gunicorn settings for production, read from the environment.
+
+Gunicorn loads ./gunicorn.conf.py automatically, so the entrypoint only
+needs `gunicorn app.wsgi`. Every setting can be overridden with the
+matching GUNICORN_* variable (or WEB_CONCURRENCY for the worker count).
+"""
+import multiprocessing
+import os
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+# Web workers connect with DB_STATEMENT_TIMEOUT and
+# DB_IDLE_IN_TRANSACTION_TIMEOUT, see settings.
+os.environ.setdefault('DB_WEB_TIMEOUTS', '1')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# sync for CPU bound requests, gthread to overlap database/cache waits
+# with a few threads per process, gevent for many slow clients
+# (`pip install gevent psycogreen`).
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class not in ('sync', 'gthread', 'gevent'):
+    raise ValueError('GUNICORN_WORKER_CLASS must be sync, gthread or gevent, not %r' % worker_class)
+workers = env_int('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+threads = env_int('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1)
+worker_connections = env_int('GUNICORN_WORKER_CONNECTIONS', 1000)
+
+# Import Django and the URLconf once in the master; workers share those
+# pages copy-on-write instead of each paying the import time and memory.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Recycle workers after a jittered number of requests so slow leaks are
+# bounded and workers do not all restart at the same moment.
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', 200)
+
+# Keep-alive must outlive the load balancer idle timeout, or the balancer
+# reuses connections gunicorn already closed.
+keepalive = env_int('GUNICORN_KEEPALIVE', 75)
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+
+# The worker heartbeat file is touched on every request; keep it off disk.
+worker_tmp_dir = os.environ.get('GUNICORN_WORKER_TMP_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # Database connections opened while preloading must not be shared.
+    from django.db import connections
+    connections.close_all()
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            server.log.warning('psycogreen is not installed, database calls will block gevent workers')
+        else:
+            patch_psycopg()
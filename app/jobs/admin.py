@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'locked_by')
+    list_filter = ('status',)
+    search_fields = ('name', 'idempotency_key')
+    readonly_fields = ('created_at', 'updated_at')
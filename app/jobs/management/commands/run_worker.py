@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.queue import run_pending
+
+
+def work(worker_id, batch, poll_interval, once=False):
+    """Worker loop: run due jobs, sleep when the queue is empty"""
+    stopping = []
+    if not once:
+        signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    while not stopping:
+        ran = run_pending(worker_id, batch)
+        if once and not ran:
+            return
+        if not ran:
+            time.sleep(poll_interval)
+
+
+def child(worker_id, batch, poll_interval):
+    # Connections inherited from the parent must not be shared after fork.
+    connections.close_all()
+    work(worker_id, batch, poll_interval)
+
+
+class Command(BaseCommand):
+    """Run background jobs from the database queue, no broker required"""
+    help = 'Process queued jobs with a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOBS_WORKER_PROCESSES)
+        parser.add_argument('--batch', type=int, default=10, help='Jobs claimed per poll')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOBS_POLL_INTERVAL)
+        parser.add_argument('--once', action='store_true', help='Drain the queue in this process and exit')
+
+    def handle(self, *args, **options):
+        base_id = f'{socket.gethostname()}:{os.getpid()}'
+        if options['once'] or options['processes'] <= 1:
+            self.stdout.write(f'Worker {base_id} started')
+            work(base_id, options['batch'], options['poll_interval'], once=options['once'])
+            return
+
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        pool = {}
+        stopping = []
+
+        def stop(*args):
+            stopping.append(True)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write(f'Starting {options["processes"]} workers')
+        while not stopping:
+            # Start missing workers and replace the ones that died.
+            for index in range(options['processes']):
+                process = pool.get(index)
+                if process is None or not process.is_alive():
+                    process = context.Process(
+                        target=child,
+                        args=(f'{base_id}:{index}', options['batch'], options['poll_interval']),
+                        daemon=True,
+                    )
+                    process.start()
+                    pool[index] = process
+            time.sleep(1)
+
+        for process in pool.values():
+            process.terminate()
+        for process in pool.values():
+            process.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
@@ -0,0 +1,164 @@
+import json
+import logging
+import random
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+_local = threading.local()
+
+
+def task(name=None, max_attempts=None):
+    """Register a function as a job handler, called with the payload as keyword arguments"""
+    def decorator(func):
+        func.job_name = name or f'{func.__module__}.{func.__name__}'
+        func.max_attempts = max_attempts or settings.JOBS_MAX_ATTEMPTS
+        registry[func.job_name] = func
+        return func
+
+    return decorator
+
+
+def enqueue(func, payload=None, idempotency_key=None, delay=0):
+    """Queue a job for a registered task.
+
+    With an idempotency key, enqueueing the same work twice returns the
+    job created the first time instead of queueing a duplicate.
+    """
+    name = func if isinstance(func, str) else func.job_name
+    handler = registry[name]
+    if idempotency_key:
+        existing = Job.objects.filter(idempotency_key=idempotency_key).first()
+        if existing is not None:
+            return existing
+
+    job = Job(
+        name=name,
+        payload=json.dumps(payload or {}),
+        max_attempts=handler.max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        idempotency_key=idempotency_key,
+    )
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        if not idempotency_key:
+            raise
+        return Job.objects.get(idempotency_key=idempotency_key)
+    return job
+
+
+def claimable(now):
+    """Queued jobs that are due, and running jobs whose visibility timeout expired with attempts left"""
+    return Q(status=Job.QUEUED, run_at__lte=now) | Q(
+        status=Job.RUNNING, locked_until__lt=now, attempts__lt=F('max_attempts')
+    )
+
+
+def fail_abandoned(now):
+    """Fail running jobs whose visibility timeout expired on their last attempt.
+
+    A job that kills its worker (OOM, segfault, SIGKILL) never reaches the
+    failure handling in run_job, so this is where it stops being retried.
+    """
+    abandoned = Job.objects.filter(status=Job.RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts'))
+    for pk, name in abandoned.values_list('pk', 'name'):
+        logger.error('Job failed permanently, its worker stopped', extra={'job': pk, 'job_name': name})
+    return abandoned.update(
+        status=Job.FAILED,
+        last_error='Visibility timeout expired on the last attempt; the worker stopped without reporting.',
+        locked_until=None,
+        updated_at=now,
+    )
+
+
+def claim(worker_id, limit):
+    """Atomically take up to `limit` due jobs for this worker.
+
+    Each job is taken with a conditional UPDATE, so concurrent workers on
+    any database backend never run the same job twice within its
+    visibility timeout.
+    """
+    now = timezone.now()
+    fail_abandoned(now)
+    locked_until = now + timedelta(seconds=settings.JOBS_VISIBILITY_TIMEOUT)
+    candidates = Job.objects.filter(claimable(now)).order_by('run_at').values_list('pk', flat=True)[:limit * 2]
+    claimed = []
+    for pk in candidates:
+        taken = Job.objects.filter(claimable(now), pk=pk).update(
+            status=Job.RUNNING,
+            locked_by=worker_id,
+            locked_until=locked_until,
+            attempts=F('attempts') + 1,
+        )
+        if taken:
+            claimed.append(pk)
+            if len(claimed) == limit:
+                break
+    return list(Job.objects.filter(pk__in=claimed).order_by('run_at'))
+
+
+def report_progress(**progress):
+    """Record progress of the job running in this thread on its Job row.
+
+    Reporting also extends the visibility timeout, so long running jobs
+    that make progress are not handed to another worker.
+    """
+    job = getattr(_local, 'job', None)
+    if job is not None:
+        now = timezone.now()
+        Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+            progress=json.dumps(progress, default=str),
+            locked_until=now + timedelta(seconds=settings.JOBS_VISIBILITY_TIMEOUT),
+            updated_at=now,
+        )
+
+
+def backoff(attempts):
+    """Exponential retry delay in seconds, with jitter"""
+    delay = min(settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOBS_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome, retrying failures later"""
+    owned = Job.objects.filter(pk=job.pk, locked_by=job.locked_by, status=Job.RUNNING)
+    _local.job = job
+    try:
+        handler = registry[job.name]
+        handler(**json.loads(job.payload))
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job failed permanently', extra={'job': job.pk, 'job_name': job.name})
+            owned.update(status=Job.FAILED, last_error=error, locked_until=None, updated_at=timezone.now())
+        else:
+            retry_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+            logger.warning('Job failed, retrying', extra={'job': job.pk, 'job_name': job.name, 'retry_at': retry_at})
+            owned.update(status=Job.QUEUED, last_error=error, run_at=retry_at, locked_until=None,
+                         updated_at=timezone.now())
+        return False
+    finally:
+        _local.job = None
+
+    owned.update(status=Job.DONE, locked_until=None, updated_at=timezone.now())
+    return True
+
+
+def run_pending(worker_id, limit):
+    """Claim and run one batch of jobs, returning how many were run"""
+    jobs = claim(worker_id, limit)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
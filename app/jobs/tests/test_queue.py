@@ -0,0 +1,102 @@
+import io
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from jobs.models import Job
+from jobs.queue import task, enqueue, claim, run_pending
+
+calls = []
+
+
+@task(name='tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task(name='tests.explode', max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        """Test a queued job runs once and is marked done"""
+        job = enqueue(record, {'value': 42})
+
+        self.assertEqual(run_pending('worker-1', 10), 1)
+        self.assertEqual(calls, [42])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(run_pending('worker-1', 10), 0)
+
+    def test_idempotency_key_deduplicates(self):
+        """Test enqueueing twice with one key creates a single job"""
+        first = enqueue(record, {'value': 1}, idempotency_key='record-1')
+        second = enqueue(record, {'value': 2}, idempotency_key='record-1')
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_delayed_job_not_claimed_early(self):
+        """Test a job is not run before its run_at"""
+        enqueue(record, {'value': 1}, delay=60)
+
+        self.assertEqual(claim('worker-1', 10), [])
+
+    @patch('jobs.queue.backoff', return_value=30)
+    def test_failure_retried_with_backoff_then_failed(self, mock_backoff):
+        """Test failures are retried later and fail after max attempts"""
+        job = enqueue(explode)
+
+        run_pending('worker-1', 10)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=20))
+        self.assertIn('boom', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        run_pending('worker-1', 10)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_claimed_job_invisible_until_timeout(self):
+        """Test a running job is only reclaimed after its visibility timeout"""
+        job = enqueue(record, {'value': 1})
+        self.assertEqual(len(claim('worker-1', 10)), 1)
+        self.assertEqual(claim('worker-2', 10), [])
+
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed = claim('worker-2', 10)
+
+        self.assertEqual([j.pk for j in reclaimed], [job.pk])
+        self.assertEqual(reclaimed[0].locked_by, 'worker-2')
+        self.assertEqual(reclaimed[0].attempts, 2)
+
+    def test_abandoned_last_attempt_failed(self):
+        """Test a job whose worker died on its last attempt is failed, not reclaimed"""
+        job = enqueue(explode)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING, attempts=2, locked_until=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(claim('worker-2', 10), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsNone(job.locked_until)
+
+    def test_run_worker_once(self):
+        """Test the worker command drains the queue"""
+        enqueue(record, {'value': 1})
+        enqueue(record, {'value': 2})
+
+        call_command('run_worker', once=True, stdout=io.StringIO())
+
+        self.assertEqual(sorted(calls), [1, 2])
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
@@ -3,3 +3,17 @@ from django.apps import AppConfig
 
 class RecipeConfig(AppConfig):
     name = 'recipe'
+
+    def ready(self):
+        from core import metrics
+        from . import signals  # noqa: F401
+        from .cache import read_flights, recipe_cache
+        from .pantry import pantry_indexes
+        from .similar import similar_indexes
+        from .suggest import suggest_cache
+
+        metrics.register('recipe_cache', recipe_cache.stats)
+        metrics.register('recipe_suggest_cache', suggest_cache.stats)
+        metrics.register('recipe_similar_indexes', similar_indexes.stats)
+        metrics.register('recipe_pantry_indexes', pantry_indexes.stats)
+        metrics.register('recipe_read_flights', read_flights.stats)
@@ -0,0 +1,205 @@
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from core.singleflight import SingleFlight
+from django.conf import settings
+from django.core.cache import caches
+
+
+class LRUCache:
+    """Thread safe in process LRU with hit/miss/eviction counters"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """Look up without touching the LRU order or the counters"""
+        with self.lock:
+            return self.data.get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class RecipeResponseCache:
+    """Two level cache of recipe detail payloads.
+
+    Entries live in an in process LRU in front of the shared Django cache
+    and are keyed by recipe id and an opaque version token held in the
+    shared cache. Invalidating a recipe drops its token, orphaning every
+    copy at both levels. A dependency index maps tag/ingredient ids to the
+    recipes whose cached payload embeds them, so editing one tag only
+    invalidates the recipes that show it. Index updates are last writer
+    wins; an entry missed by a racing update expires with the shared tier
+    timeout.
+    """
+
+    def __init__(self, alias, local_size, timeout):
+        self.alias = alias
+        self.local = LRUCache(local_size)
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.shared_hits = self.shared_misses = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def version_key(recipe_id):
+        return 'recipe:version:%s' % recipe_id
+
+    @staticmethod
+    def data_key(recipe_id, version):
+        return 'recipe:data:%s:%s' % (recipe_id, version)
+
+    @staticmethod
+    def dependency_key(kind, pk):
+        return 'recipe:deps:%s:%s' % (kind, pk)
+
+    def version(self, recipe_id):
+        """Return the current version token of a recipe, creating one if needed.
+
+        Read it before loading the recipe from the database so that an
+        invalidation racing with the load orphans the stored entry.
+        """
+        key = self.version_key(recipe_id)
+        version = self.shared.get(key)
+        if version is None:
+            self.shared.add(key, uuid.uuid4().hex, None)
+            version = self.shared.get(key)
+        return version
+
+    def get(self, recipe_id, version):
+        key = (recipe_id, version)
+        entry = self.local.get(key)
+        if entry is not None:
+            return entry
+        entry = self.shared.get(self.data_key(recipe_id, version))
+        with self.lock:
+            if entry is None:
+                self.shared_misses += 1
+            else:
+                self.shared_hits += 1
+        if entry is not None:
+            self.local.set(key, entry)
+        return entry
+
+    def set(self, recipe_id, version, entry, dependencies):
+        """Store an entry with the (kind, pk) pairs its payload depends on"""
+        self.local.set((recipe_id, version), entry)
+        self.shared.set(self.data_key(recipe_id, version), entry, self.timeout)
+
+        keys = [self.dependency_key(kind, pk) for kind, pk in dependencies]
+        if keys:
+            current = self.shared.get_many(keys)
+            self.shared.set_many(
+                {key: current.get(key, frozenset()) | {recipe_id} for key in keys},
+                self.timeout
+            )
+
+    def update(self, recipe_id, version, entry):
+        """Replace a stored entry, keeping its dependencies"""
+        self.local.set((recipe_id, version), entry)
+        self.shared.set(self.data_key(recipe_id, version), entry, self.timeout)
+
+    def invalidate(self, recipe_ids):
+        self.shared.delete_many([self.version_key(recipe_id) for recipe_id in recipe_ids])
+
+    def invalidate_dependency(self, kind, pk):
+        """Invalidate every cached recipe embedding the given tag/ingredient"""
+        key = self.dependency_key(kind, pk)
+        recipe_ids = self.shared.get(key)
+        if recipe_ids:
+            self.invalidate(recipe_ids)
+        self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        stats = {'local': self.local.stats()}
+        with self.lock:
+            lookups = self.shared_hits + self.shared_misses
+            stats['shared'] = {
+                'hits': self.shared_hits,
+                'misses': self.shared_misses,
+                'hit_ratio': self.shared_hits / lookups if lookups else 0.0,
+            }
+        return stats
+
+
+recipe_cache = RecipeResponseCache(
+    settings.RECIPE_CACHE_ALIAS,
+    settings.RECIPE_CACHE_LOCAL_SIZE,
+    settings.RECIPE_CACHE_TIMEOUT,
+)
+
+# Identical reads of the recipe API running at once, see recipe.views.CoalescedReadsMixin
+read_flights = SingleFlight()
+
+
+def user_data_version(user_id):
+    """Opaque token that changes whenever the user's recipes, tags or ingredients change"""
+    cache = caches[settings.RECIPE_CACHE_ALIAS]
+    key = 'user:data-version:%s' % user_id
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_data_version(user_id):
+    """Give the user's data a new version token and return it"""
+    version = uuid.uuid4().hex
+    caches[settings.RECIPE_CACHE_ALIAS].set('user:data-version:%s' % user_id, version, None)
+    return version
+
+
+def query_digest(params, names=None):
+    """Fixed length digest of query parameters in any order, only of `names` when given"""
+    if names is None:
+        items = params.lists()
+    else:
+        items = [(name, params.getlist(name)) for name in names if name in params]
+    query = urlencode(sorted(items), doseq=True)
+    return hashlib.sha1(query.encode('utf-8')).hexdigest()
@@ -0,0 +1,142 @@
+"""Columnar snapshots of recipes for analytics, as Parquet or Arrow IPC files.
+
+pyarrow is optional and only needed by the export_recipes command.
+"""
+from core.models import Recipe
+from django.conf import settings
+from django.db.models import Max, Min
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+COLUMNS = ('id', 'user_id', 'title', 'time_minutes', 'price', 'link')
+
+
+def schema():
+    return pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('user_id', pyarrow.int64()),
+        ('title', pyarrow.string()),
+        ('time_minutes', pyarrow.int32()),
+        ('price', pyarrow.decimal128(5, 2)),
+        ('link', pyarrow.string()),
+        ('tag_ids', pyarrow.list_(pyarrow.int64())),
+        ('ingredient_ids', pyarrow.list_(pyarrow.int64())),
+    ])
+
+
+def id_ranges(db, user_id, parts):
+    """Split the recipe ids on one shard into up to `parts` contiguous (first, last) ranges"""
+    recipes = Recipe.objects.using(db)
+    if user_id is not None:
+        recipes = recipes.filter(user_id=user_id)
+    bounds = recipes.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    first, last = bounds['first'], bounds['last']
+    step = max(1, -(-(last - first + 1) // parts))
+    return [(start, min(start + step - 1, last)) for start in range(first, last + 1, step)]
+
+
+def export_units(user, parts):
+    """(shard, first id, last id) units covering a user's recipes, or every recipe"""
+    if user is not None:
+        return [(user.shard, first, last) for first, last in id_ranges(user.shard, user.pk, parts)]
+    return [(db, first, last) for db in settings.DATABASE_SHARDS for first, last in id_ranges(db, None, parts)]
+
+
+def list_column(ids, links):
+    """List array of the link targets of every id; both inputs sorted by recipe id"""
+    offsets = [0]
+    values = []
+    position = 0
+    for recipe_id in ids:
+        while position < len(links) and links[position][0] < recipe_id:
+            position += 1
+        while position < len(links) and links[position][0] == recipe_id:
+            values.append(links[position][1])
+            position += 1
+        offsets.append(len(values))
+    return pyarrow.ListArray.from_arrays(pyarrow.array(offsets, pyarrow.int32()), pyarrow.array(values, pyarrow.int64()))
+
+
+def links_between(db, field_name, first, last, user_id=None):
+    """(recipe id, target id) links of a recipe id range, sorted"""
+    field = Recipe._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = through._meta.get_field(field.m2m_field_name()).attname
+    target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+    links = through.objects.using(db).filter(**{'%s__gte' % source: first, '%s__lte' % source: last})
+    if user_id is not None:
+        # Other users' recipes can sit between the ids of this one.
+        links = links.filter(**{'%s__user_id' % field.m2m_field_name(): user_id})
+    return list(links.order_by(source, target).values_list(source, target))
+
+
+def build_batch(db, rows, user_id=None):
+    """One record batch from recipe rows, built a column at a time"""
+    columns = list(zip(*rows))
+    ids = columns[0]
+    first, last = ids[0], ids[-1]
+    arrays = [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema())]
+    arrays.append(list_column(ids, links_between(db, 'tags', first, last, user_id)))
+    arrays.append(list_column(ids, links_between(db, 'ingredients', first, last, user_id)))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema())
+
+
+def iter_batches(db, first, last, user_id=None, chunk_size=50000):
+    """Record batches of at most `chunk_size` recipes, read through a server side cursor"""
+    recipes = Recipe.objects.using(db).filter(pk__gte=first, pk__lte=last)
+    if user_id is not None:
+        recipes = recipes.filter(user_id=user_id)
+    rows = []
+    for row in recipes.order_by('pk').values_list(*COLUMNS).iterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield build_batch(db, rows, user_id)
+            rows = []
+    if rows:
+        yield build_batch(db, rows, user_id)
+
+
+class SnapshotWriter:
+    """Write record batches to one Parquet file (a row group each) or Arrow IPC file"""
+
+    def __init__(self, path, fmt, compression=None):
+        if fmt == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(path, schema(), compression=compression or 'snappy')
+        else:
+            options = pyarrow.ipc.IpcWriteOptions(compression=compression)
+            self.writer = pyarrow.ipc.new_file(path, schema(), options=options)
+        self.fmt = fmt
+        self.rows = 0
+
+    def write(self, batch):
+        if self.fmt == 'parquet':
+            self.writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export(path, fmt, units, user_id=None, chunk_size=50000, compression=None):
+    """Write the recipes of (shard, first id, last id) units to one file, return the row count"""
+    with SnapshotWriter(path, fmt, compression) as writer:
+        for db, first, last in units:
+            for batch in iter_batches(db, first, last, user_id, chunk_size):
+                writer.write(batch)
+    return writer.rows
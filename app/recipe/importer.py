@@ -0,0 +1,259 @@
+import csv
+import io
+import json
+import zlib
+from decimal import Decimal, InvalidOperation
+
+from core.models import Recipe, Tag, Ingredient, ImportCheckpoint
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models.functions import Lower
+from recipe.cache import bump_user_data_version
+
+LIST_SEPARATOR = '|'
+MAX_PRICE = Decimal('999.99')
+ROW_ERROR = object()
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, fmt):
+    """Stream rows from a CSV or NDJSON file as dicts, one line at a time.
+
+    A line that is not a JSON object comes back as a row holding only
+    ROW_ERROR, which clean_row reports as invalid.
+    """
+    with open(path, newline='', encoding='utf-8') as source:
+        if fmt == 'csv':
+            for row in csv.DictReader(source):
+                for key in ('tags', 'ingredients'):
+                    value = row.get(key) or ''
+                    row[key] = [name for name in value.split(LIST_SEPARATOR) if name.strip()]
+                yield row
+        else:
+            for line in source:
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError as exc:
+                        row = {ROW_ERROR: 'invalid JSON: %s' % exc}
+                    if not isinstance(row, dict):
+                        row = {ROW_ERROR: 'a row must be a JSON object'}
+                    yield row
+
+
+def user_shard(email, shards):
+    """Stable shard number of a user, so a user's rows always go to one process"""
+    return zlib.crc32(email.strip().lower().encode('utf-8')) % shards
+
+
+def unique_names(names):
+    """Stripped names without case insensitive repeats, in first seen spelling"""
+    unique = {}
+    for name in names or []:
+        name = name.strip()[:255]
+        if name:
+            unique.setdefault(name.lower(), name)
+    return list(unique.values())
+
+
+def clean_names(row, key):
+    names = row.get(key) or []
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise RowError('%s must be a list of names' % key)
+    return unique_names(names)
+
+
+def clean_row(row):
+    """Validate a source row and return the recipe fields"""
+    if ROW_ERROR in row:
+        raise RowError(row[ROW_ERROR])
+    title = row.get('title') or ''
+    if not isinstance(title, str) or not title.strip() or len(title.strip()) > 255:
+        raise RowError('title is required and at most 255 characters')
+    try:
+        time_minutes = int(row.get('time_minutes'))
+    except (TypeError, ValueError):
+        raise RowError('time_minutes must be an integer')
+    price = row.get('price')
+    try:
+        price = Decimal(str('10.00' if price in (None, '') else price)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RowError('price must be a number')
+    if not price.is_finite() or not 0 <= price <= MAX_PRICE:
+        raise RowError('price must be between 0 and %s' % MAX_PRICE)
+    link = row.get('link') or ''
+    if not isinstance(link, str):
+        raise RowError('link must be a string')
+    return {
+        'email': str(row.get('user') or '').strip(),
+        'title': title.strip(),
+        'time_minutes': time_minutes,
+        'price': price,
+        'link': link[:255],
+        'tags': clean_names(row, 'tags'),
+        'ingredients': clean_names(row, 'ingredients'),
+    }
+
+
+class RecipeImporter:
+    """Insert batches of recipes with their tags and ingredients.
+
+    Tags and ingredients are upserted by (user, name) with one lookup and
+    one bulk insert per batch. Recipes and link rows go through COPY on
+    PostgreSQL and bulk_create elsewhere. Rows are written to the shard of
+    their user, and every shard keeps its own checkpoint, advanced in the
+    same transaction as its part of the batch, so a resumed import neither
+    skips nor duplicates rows.
+    """
+
+    def __init__(self, checkpoint_key):
+        self.checkpoint_key = checkpoint_key
+        self.users = {}
+        self.positions = {}
+
+    def checkpoint(self):
+        """Position every shard has committed, the row to resume after"""
+        for db in settings.DATABASE_SHARDS:
+            checkpoint = ImportCheckpoint.objects.using(db).filter(key=self.checkpoint_key).first()
+            self.positions[db] = checkpoint.position if checkpoint else 0
+        return min(self.positions.values())
+
+    def resolve_users(self, emails):
+        missing = set(emails) - set(self.users)
+        if missing:
+            found = get_user_model().objects.filter(email__in=missing).values_list('email', 'pk', 'shard')
+            self.users.update((email, (pk, shard)) for email, pk, shard in found)
+
+    def lookup_names(self, db, model, pairs):
+        names = model.objects.using(db).annotate(lower_name=Lower('name')).filter(
+            user_id__in={user_id for user_id, name in pairs},
+            lower_name__in={name for user_id, name in pairs},
+        )
+        return {
+            (user_id, name): pk
+            for pk, user_id, name in names.values_list('pk', 'user_id', 'lower_name')
+            if (user_id, name) in pairs
+        }
+
+    def upsert_names(self, db, model, pairs):
+        """Return {(user_id, lower name): pk}, creating the missing rows in bulk"""
+        if not pairs:
+            return {}
+        # Names are unique per user regardless of case; the first spelling wins.
+        spellings = {}
+        for user_id, name in sorted(pairs):
+            spellings.setdefault((user_id, name.lower()), name)
+        existing = self.lookup_names(db, model, spellings)
+        missing = [key for key in spellings if key not in existing]
+        if missing:
+            model.objects.using(db).bulk_create(
+                [model(user_id=user_id, name=spellings[user_id, name]) for user_id, name in missing]
+            )
+            existing.update(self.lookup_names(db, model, set(missing)))
+        return existing
+
+    def insert_recipes(self, db, recipes):
+        """Insert recipe rows and return their ids in order"""
+        connection = connections[db]
+        if connection.vendor == 'postgresql':
+            return self.copy_recipes(connection, recipes)
+        objs = [Recipe(user_id=r['user_id'], title=r['title'], time_minutes=r['time_minutes'],
+                       price=r['price'], link=r['link']) for r in recipes]
+        if connection.features.can_return_ids_from_bulk_insert:
+            Recipe.objects.using(db).bulk_create(objs)
+        else:
+            for obj in objs:
+                obj.save(using=db)
+        return [obj.pk for obj in objs]
+
+    def copy_recipes(self, connection, recipes):
+        table = Recipe._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [table, len(recipes)]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for pk, r in zip(ids, recipes):
+                writer.writerow([pk, r['title'], r['time_minutes'], r['price'], r['link'], r['user_id'], ''])
+            buffer.seek(0)
+            # An unquoted empty field is NULL in CSV COPY; the text columns store '' as the ORM does.
+            cursor.copy_expert(
+                'COPY "%s" (id, title, time_minutes, price, link, user_id, image) FROM STDIN '
+                'WITH (FORMAT csv, FORCE_NOT_NULL (title, link, image))' % table,
+                buffer
+            )
+        return ids
+
+    def insert_links(self, db, field_name, links):
+        if not links:
+            return
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        source = through._meta.get_field(field.m2m_field_name())
+        target = through._meta.get_field(field.m2m_reverse_field_name())
+        connection = connections[db]
+        if connection.vendor == 'postgresql':
+            buffer = io.StringIO(''.join('%d,%d\n' % link for link in links))
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    'COPY "%s" ("%s", "%s") FROM STDIN WITH (FORMAT csv)' % (
+                        through._meta.db_table, source.column, target.column),
+                    buffer
+                )
+        else:
+            through.objects.using(db).bulk_create(
+                [through(**{source.attname: recipe_id, target.attname: pk}) for recipe_id, pk in links]
+            )
+
+    def import_shard(self, db, recipes, position):
+        with transaction.atomic(using=db):
+            tags = self.upsert_names(db, Tag, {(r['user_id'], name) for r in recipes for name in r['tags']})
+            ingredients = self.upsert_names(
+                db, Ingredient, {(r['user_id'], name) for r in recipes for name in r['ingredients']}
+            )
+            ids = self.insert_recipes(db, recipes) if recipes else []
+            self.insert_links(db, 'tags', [
+                (pk, tags[(r['user_id'], name.lower())]) for pk, r in zip(ids, recipes) for name in r['tags']
+            ])
+            self.insert_links(db, 'ingredients', [
+                (pk, ingredients[(r['user_id'], name.lower())]) for pk, r in zip(ids, recipes) for name in r['ingredients']
+            ])
+            ImportCheckpoint.objects.using(db).update_or_create(
+                key=self.checkpoint_key, defaults={'position': position}
+            )
+        self.positions[db] = position
+
+    def import_batch(self, rows, position):
+        """Import cleaned rows and move every shard's checkpoint to `position`.
+
+        Each row carries its source `position`; rows a shard committed
+        before an interruption are not imported again.
+        """
+        self.resolve_users({row['email'] for row in rows})
+        by_shard = {db: [] for db in settings.DATABASE_SHARDS}
+        unknown = 0
+        for row in rows:
+            user = self.users.get(row['email'])
+            if user is None:
+                unknown += 1
+                continue
+            row['user_id'], db = user
+            if row['position'] > self.positions.get(db, 0):
+                by_shard.setdefault(db, []).append(row)
+
+        imported = 0
+        for db, recipes in by_shard.items():
+            if position > self.positions.get(db, 0):
+                self.import_shard(db, recipes, position)
+                imported += len(recipes)
+
+        for user_id in {r['user_id'] for recipes in by_shard.values() for r in recipes}:
+            bump_user_data_version(user_id)
+        return imported, unknown
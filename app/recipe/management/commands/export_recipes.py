@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+
+from core.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from recipe import export
+
+
+def export_part(args):
+    # Connections inherited from the parent must not be shared after fork.
+    connections.close_all()
+    return export.export(*args)
+
+
+class Command(BaseCommand):
+    """Write a columnar snapshot of recipes for analytics"""
+    help = 'Export recipes with their tag and ingredient ids to Parquet or Arrow IPC, for one user or everyone'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output file, or directory of part files with --workers')
+        parser.add_argument('--format', choices=sorted(export.FORMATS), help='Defaults to the file extension')
+        parser.add_argument('--user', help='Only export the recipes of this user id or email')
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Rows per cursor fetch and row group')
+        parser.add_argument('--workers', type=int, default=1, help='Export id ranges in parallel processes')
+        parser.add_argument('--compression', help='e.g. zstd, snappy (Parquet) or lz4 (Arrow)')
+
+    def handle(self, *args, **options):
+        if export.pyarrow is None:
+            raise CommandError('export_recipes needs pyarrow: pip install pyarrow')
+        path = os.path.abspath(options['path'])
+        fmt = options['format'] or ('arrow' if path.endswith(('.arrow', '.feather')) else 'parquet')
+        user = self.get_user(options['user']) if options['user'] else None
+        user_id = user.pk if user else None
+        workers = options['workers']
+        units = export.export_units(user, workers)
+
+        if workers <= 1:
+            rows = export.export(path, fmt, units, user_id, options['chunk_size'], options['compression'])
+            self.stdout.write(self.style.SUCCESS('Exported %d recipes to %s' % (rows, path)))
+            return
+
+        os.makedirs(path, exist_ok=True)
+        parts = [
+            (os.path.join(path, 'part-%05d%s' % (index, export.FORMATS[fmt])), fmt, [unit], user_id,
+             options['chunk_size'], options['compression'])
+            for index, unit in enumerate(units)
+        ]
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            rows = sum(pool.map(export_part, parts))
+        self.stdout.write(self.style.SUCCESS('Exported %d recipes to %d files in %s' % (rows, len(parts), path)))
+
+    def get_user(self, value):
+        lookup = {'pk': value} if value.isdigit() else {'email': value}
+        try:
+            return User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError('User not found: %s' % value)
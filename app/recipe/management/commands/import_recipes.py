@@ -0,0 +1,95 @@
+import hashlib
+import multiprocessing
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from recipe.importer import RecipeImporter, RowError, clean_row, read_rows, user_shard
+
+
+class Command(BaseCommand):
+    """Bulk load recipes from a CSV or NDJSON file"""
+    help = 'Import recipes with their tags and ingredients, resumable and shardable by user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--shards', type=int, default=1, help='Split users into this many shards')
+        parser.add_argument('--shard', type=int, help='Only import the users of this shard')
+        parser.add_argument('--workers', type=int, default=1, help='Import every shard in its own process')
+        parser.add_argument('--checkpoint-key', help='Defaults to the file path and shard')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError('File not found: %s' % path)
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+
+        if options['workers'] > 1:
+            self.run_workers(path, fmt, options)
+            return
+        shards = options['shards']
+        shard = options['shard']
+        if shard is not None and not 0 <= shard < shards:
+            raise CommandError('--shard must be between 0 and %d' % (shards - 1))
+        self.import_file(path, fmt, options['batch_size'], shards, shard, options['checkpoint_key'])
+
+    def run_workers(self, path, fmt, options):
+        """Fork one process per shard; each keeps its own checkpoint"""
+        workers = options['workers']
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=self.worker, args=(path, fmt, options['batch_size'], workers, shard))
+            for shard in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        failed = [shard for shard, process in enumerate(processes) if process.exitcode != 0]
+        if failed:
+            raise CommandError('Shards %s failed; run the command again to resume' % failed)
+
+    def worker(self, path, fmt, batch_size, shards, shard):
+        connections.close_all()
+        self.import_file(path, fmt, batch_size, shards, shard)
+
+    def import_file(self, path, fmt, batch_size, shards, shard, checkpoint_key=None):
+        if checkpoint_key is None:
+            digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+            checkpoint_key = 'import:%s:%s/%s' % (digest, shard if shard is not None else 0, shards)
+        importer = RecipeImporter(checkpoint_key)
+        start = importer.checkpoint()
+        imported = skipped = invalid = 0
+        batch = []
+        position = 0
+
+        for position, row in enumerate(read_rows(path, fmt), 1):
+            if position <= start:
+                continue
+            if shard is not None and user_shard(str(row.get('user') or ''), shards) != shard:
+                continue
+            try:
+                batch.append(dict(clean_row(row), position=position))
+            except RowError as exc:
+                invalid += 1
+                self.stderr.write('Row %d skipped: %s' % (position, exc))
+            if len(batch) >= batch_size:
+                done, unknown = importer.import_batch(batch, position)
+                imported += done
+                skipped += unknown
+                batch = []
+        if position > start:
+            done, unknown = importer.import_batch(batch, position)
+            imported += done
+            skipped += unknown
+
+        label = 'Shard %d/%d: ' % (shard, shards) if shard is not None else ''
+        if start:
+            self.stdout.write('%sresumed after row %d' % (label, start))
+        self.stdout.write(self.style.SUCCESS(
+            '%simported %d recipes, %d rows for unknown users, %d invalid rows' % (label, imported, skipped, invalid)
+        ))
@@ -0,0 +1,107 @@
+from array import array
+
+from core.models import Recipe
+from django.conf import settings
+
+from .cache import LRUCache, user_data_version
+
+pantry_indexes = LRUCache(settings.RECIPE_PANTRY_INDEX_USERS)
+
+
+def set_bits(bitset):
+    """Positions of the set bits, lowest first"""
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+
+def popcount(bitset):
+    return bin(bitset).count('1')
+
+
+class PantryIndex:
+    """Ingredient bitsets of one user's recipes, for pantry queries.
+
+    Recipes take slots in id order, kept in an array. Each recipe has a
+    bitset of ingredient positions, and each ingredient a bitset of the
+    recipe slots using it, so a query is a few big integer operations per
+    ingredient over all recipes at once.
+    """
+
+    def __init__(self, version, recipe_ids, links):
+        self.version = version
+        self.recipe_ids = array('q', recipe_ids)
+        slots = {recipe_id: slot for slot, recipe_id in enumerate(self.recipe_ids)}
+        self.positions = {}
+        self.ingredient_ids = array('q')
+        self.rows = [0] * len(self.recipe_ids)
+        columns = []
+        for recipe_id, ingredient_id in links:
+            position = self.positions.get(ingredient_id)
+            if position is None:
+                position = self.positions[ingredient_id] = len(self.ingredient_ids)
+                self.ingredient_ids.append(ingredient_id)
+                columns.append(0)
+            slot = slots[recipe_id]
+            self.rows[slot] |= 1 << position
+            columns[position] |= 1 << slot
+        self.columns = columns
+        self.all = (1 << len(self.recipe_ids)) - 1
+
+    @classmethod
+    def build(cls, user_id, version):
+        recipe_ids = Recipe.objects.filter(user_id=user_id).order_by('pk').values_list('pk', flat=True)
+        through = Recipe.ingredients.through
+        links = through.objects.filter(recipe__user_id=user_id).values_list('recipe_id', 'ingredient_id')
+        return cls(version, list(recipe_ids), links.iterator())
+
+    def pantry_mask(self, pantry):
+        mask = 0
+        for ingredient_id in pantry:
+            position = self.positions.get(ingredient_id)
+            if position is not None:
+                mask |= 1 << position
+        return mask
+
+    def missing_counts(self, pantry_mask, max_missing):
+        """Bitsets of the recipe slots missing at least 1 .. max_missing + 1 ingredients"""
+        at_least = [self.all] + [0] * (max_missing + 1)
+        for position, column in enumerate(self.columns):
+            if pantry_mask >> position & 1:
+                continue
+            for count in range(max_missing + 1, 0, -1):
+                at_least[count] |= at_least[count - 1] & column
+        return at_least
+
+    def cookable(self, pantry, max_missing=0, limit=None):
+        """(total, [(recipe id, missing ingredient ids)]) for recipes missing at most `max_missing`
+
+        Results come fewest missing ingredients first, then by recipe id.
+        """
+        pantry_mask = self.pantry_mask(pantry)
+        at_least = self.missing_counts(pantry_mask, max_missing)
+        total = popcount(self.all & ~at_least[max_missing + 1])
+        results = []
+        for count in range(max_missing + 1):
+            exactly = at_least[count] & ~at_least[count + 1]
+            for slot in set_bits(exactly):
+                if limit is not None and len(results) >= limit:
+                    return total, results
+                missing = [self.ingredient_ids[position] for position in set_bits(self.rows[slot] & ~pantry_mask)]
+                results.append((self.recipe_ids[slot], missing))
+        return total, results
+
+
+def get_index(user_id):
+    """The user's index, rebuilt on first use after their data changed"""
+    version = user_data_version(user_id)
+    index = pantry_indexes.get(user_id)
+    if index is None or index.version != version:
+        index = PantryIndex.build(user_id, version)
+        pantry_indexes.set(user_id, index)
+    return index
+
+
+def cookable_recipes(user, pantry, max_missing=0, limit=None):
+    return get_index(user.pk).cookable(pantry, max_missing, limit)
@@ -0,0 +1,94 @@
+from django.db import router, transaction
+from django.db.models.signals import m2m_changed
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+
+class UserManyRelatedField(serializers.ManyRelatedField):
+    """Resolve a list of primary keys with a single `id__in` query"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        pks = []
+        for item in data:
+            if isinstance(item, bool):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+            try:
+                pk = int(item)
+            except (TypeError, ValueError):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+            if pk not in pks:
+                pks.append(pk)
+
+        objects = child.get_queryset().in_bulk(pks) if pks else {}
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key relation limited to the objects of the requesting user"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return UserManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.context.get('request')
+        if request is None:
+            return queryset.none()
+        return queryset.filter(user=request.user)
+
+
+def set_many_related(instance, field_name, objects, created=False):
+    """Replace the related objects of a many to many field.
+
+    The diff against the current links is computed in memory and applied
+    with one DELETE and one bulk INSERT on the through table. The usual
+    `m2m_changed` signals are sent so receivers still see the change.
+    """
+    field = instance._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = through._meta.get_field(field.m2m_field_name()).attname
+    target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+    model = field.remote_field.model
+    db = router.db_for_write(through, instance=instance)
+    links = through._default_manager.using(db)
+
+    new_ids = {obj.pk for obj in objects}
+    if created:
+        current_ids = set()
+    else:
+        current_ids = set(links.filter(**{source: instance.pk}).values_list(target, flat=True))
+    removed = current_ids - new_ids
+    added = new_ids - current_ids
+
+    with transaction.atomic(using=db, savepoint=False):
+        if removed:
+            send_m2m_changed(through, instance, 'pre_remove', model, removed, db)
+            # Through rows have no dependents; skip the collector so this stays
+            # one DELETE even with m2m_changed receivers connected.
+            links.filter(**{source: instance.pk, '%s__in' % target: removed})._raw_delete(db)
+            send_m2m_changed(through, instance, 'post_remove', model, removed, db)
+        if added:
+            send_m2m_changed(through, instance, 'pre_add', model, added, db)
+            links.bulk_create([through(**{source: instance.pk, target: pk}) for pk in added])
+            send_m2m_changed(through, instance, 'post_add', model, added, db)
+
+
+def send_m2m_changed(through, instance, action, model, pk_set, using):
+    m2m_changed.send(
+        sender=through, action=action, instance=instance, reverse=False,
+        model=model, pk_set=set(pk_set), using=using,
+    )
@@ -1,4 +1,6 @@
 from core.models import Tag, Ingredient, Recipe
+from django.db import transaction
+from recipe.relations import UserPrimaryKeyRelatedField, set_many_related
 from rest_framework import serializers
 
 
@@ -22,14 +24,36 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 class RecipeSerializer(serializers.ModelSerializer):
     """Serialize a recipe"""
-    ingredients = serializers.PrimaryKeyRelatedField(many=True, queryset=Ingredient.objects.all())
-    tags = serializers.PrimaryKeyRelatedField(many=True, queryset=Tag.objects.all())
+    ingredients = UserPrimaryKeyRelatedField(many=True, queryset=Ingredient.objects.all())
+    tags = UserPrimaryKeyRelatedField(many=True, queryset=Tag.objects.all())
+    many_related_fields = ('ingredients', 'tags')
 
     class Meta:
         model = Recipe
         fields = ('id', 'title', 'ingredients', 'tags', 'price', 'time_minutes', 'link',)
         read_only_fields = ('id',)
 
+    def pop_many_related(self, validated_data):
+        return {name: validated_data.pop(name) for name in self.many_related_fields if name in validated_data}
+
+    def create(self, validated_data):
+        """Create the recipe then bulk insert its tag and ingredient links"""
+        related = self.pop_many_related(validated_data)
+        with transaction.atomic(savepoint=False):
+            recipe = super().create(validated_data)
+            for name, objects in related.items():
+                set_many_related(recipe, name, objects, created=True)
+        return recipe
+
+    def update(self, instance, validated_data):
+        """Update the recipe and apply the tag and ingredient diff in bulk"""
+        related = self.pop_many_related(validated_data)
+        with transaction.atomic(savepoint=False):
+            recipe = super().update(instance, validated_data)
+            for name, objects in related.items():
+                set_many_related(recipe, name, objects)
+        return recipe
+
 
 class RecipeDetailsSerializer(RecipeSerializer):
     """"Serialize Recipe details"""
@@ -0,0 +1,102 @@
+from core.models import Tag, Ingredient, Recipe, User
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import similar
+from .cache import recipe_cache, bump_user_data_version, user_data_version
+
+
+@receiver(post_save, sender=User)
+def reset_user_data(sender, instance, created, **kwargs):
+    if created:
+        bump_user_data_version(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    recipe_cache.invalidate([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tag(sender, instance, **kwargs):
+    recipe_cache.invalidate_dependency('tag', instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient(sender, instance, **kwargs):
+    recipe_cache.invalidate_dependency('ingredient', instance.pk)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_recipe_links(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not action.startswith('post_') and action != 'pre_clear':
+        return
+    if not reverse:
+        recipe_cache.invalidate([instance.pk])
+    elif pk_set:
+        recipe_cache.invalidate(pk_set)
+    else:
+        # Reverse clear, e.g. tag.recipe_set.clear(): every recipe showing it.
+        kind = 'tag' if sender is Recipe.tags.through else 'ingredient'
+        recipe_cache.invalidate_dependency(kind, instance.pk)
+
+
+def bump_user_data(user_id, using, apply=None):
+    """Give the user's data a new version, and queue the write for the similarity index"""
+    previous = user_data_version(user_id) if similar.tracking(user_id) else None
+    similar.after_change(user_id, previous, bump_user_data_version(user_id), using, apply)
+
+
+@receiver([pre_save, pre_delete], sender=Recipe)
+@receiver([pre_save, pre_delete], sender=Tag)
+@receiver([pre_save, pre_delete], sender=Ingredient)
+def similar_before_change(sender, instance, **kwargs):
+    similar.before_change(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def user_data_saved(sender, instance, using, created=False, **kwargs):
+    if sender is Recipe and created:
+        bump_user_data(instance.user_id, using, lambda index: index.add_recipe(instance.pk))
+    else:
+        bump_user_data(instance.user_id, using)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, using, **kwargs):
+    bump_user_data(instance.user_id, using, lambda index: index.remove_recipe(instance.pk))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def feature_deleted(sender, instance, using, **kwargs):
+    kind = similar.TAG if sender is Tag else similar.INGREDIENT
+    bump_user_data(instance.user_id, using, lambda index: index.remove_feature(similar.feature(kind, instance.pk)))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def links_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action.startswith('pre_'):
+        similar.before_change(instance.user_id)
+        return
+    kind = similar.TAG if sender is Recipe.tags.through else similar.INGREDIENT
+
+    def apply(index):
+        if action == 'post_clear':
+            if reverse:
+                index.remove_feature(similar.feature(kind, instance.pk))
+            else:
+                index.clear_kind(instance.pk, kind)
+            return
+        change = index.link if action == 'post_add' else index.unlink
+        for pk in pk_set:
+            if reverse:
+                change(pk, similar.feature(kind, instance.pk))
+            else:
+                change(instance.pk, similar.feature(kind, pk))
+
+    bump_user_data(instance.user_id, using, apply)
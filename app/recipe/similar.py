@@ -0,0 +1,169 @@
+import heapq
+import threading
+from collections import Counter, defaultdict
+from operator import itemgetter
+
+from core.models import Recipe
+from django.conf import settings
+from django.db import transaction
+
+from .cache import LRUCache, user_data_version
+
+TAG, INGREDIENT = 0, 1
+FIELDS = ((TAG, 'tags'), (INGREDIENT, 'ingredients'))
+
+similar_indexes = LRUCache(settings.RECIPE_SIMILAR_INDEX_USERS)
+_local = threading.local()
+
+
+def feature(kind, pk):
+    """Tags and ingredients as one integer space"""
+    return pk * 2 + kind
+
+
+class SimilarityIndex:
+    """Inverted index from tag and ingredient to the recipes of one user.
+
+    Similar recipes are ranked by the Jaccard similarity of their tag and
+    ingredient sets. Only recipes sharing a feature are counted, and
+    candidates are visited by shared count, stopping once the remaining
+    ones cannot beat the current top `limit`.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.features = {}
+        self.postings = defaultdict(set)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, user_id, version):
+        index = cls(version)
+        for pk in Recipe.objects.filter(user_id=user_id).values_list('pk', flat=True):
+            index.features[pk] = set()
+        for kind, field_name in FIELDS:
+            field = Recipe._meta.get_field(field_name)
+            through = field.remote_field.through
+            source = field.m2m_field_name()
+            target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+            links = through.objects.filter(**{'%s__user_id' % source: user_id})
+            for recipe_id, pk in links.values_list('%s_id' % source, target).iterator():
+                index.link(recipe_id, feature(kind, pk))
+        return index
+
+    def link(self, recipe_id, key):
+        self.features.setdefault(recipe_id, set()).add(key)
+        self.postings[key].add(recipe_id)
+
+    def unlink(self, recipe_id, key):
+        self.features.get(recipe_id, set()).discard(key)
+        recipes = self.postings.get(key)
+        if recipes is not None:
+            recipes.discard(recipe_id)
+            if not recipes:
+                del self.postings[key]
+
+    def add_recipe(self, recipe_id):
+        self.features.setdefault(recipe_id, set())
+
+    def remove_recipe(self, recipe_id):
+        for key in list(self.features.get(recipe_id, ())):
+            self.unlink(recipe_id, key)
+        self.features.pop(recipe_id, None)
+
+    def remove_feature(self, key):
+        for recipe_id in self.postings.pop(key, ()):
+            self.features[recipe_id].discard(key)
+
+    def clear_kind(self, recipe_id, kind):
+        for key in [key for key in self.features.get(recipe_id, ()) if key % 2 == kind]:
+            self.unlink(recipe_id, key)
+
+    def similar(self, recipe_id, limit):
+        """[(recipe id, score)] most similar first, None for a recipe not in the index"""
+        with self.lock:
+            features = self.features.get(recipe_id)
+            if features is None:
+                return None
+            shared = Counter()
+            for key in features:
+                shared.update(self.postings[key])
+            shared.pop(recipe_id, None)
+            size = len(features)
+            best = []
+            for other, count in sorted(shared.items(), key=itemgetter(1), reverse=True):
+                # count / size bounds the score of this and every later candidate.
+                if len(best) == limit and count / size < best[0][0]:
+                    break
+                score = count / (size + len(self.features[other]) - count)
+                entry = (score, -other)
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+        return [(-negative_id, score) for score, negative_id in sorted(best, reverse=True)]
+
+
+def get_index(user_id):
+    """The user's index, rebuilt when it missed a change to their data"""
+    version = user_data_version(user_id)
+    index = similar_indexes.get(user_id)
+    if index is None or index.version != version:
+        index = SimilarityIndex.build(user_id, version)
+        similar_indexes.set(user_id, index)
+    return index
+
+
+def similar_recipes(user, recipe_id, limit):
+    return get_index(user.pk).similar(recipe_id, limit)
+
+
+def _starts():
+    """Index versions the writes running in this thread started from, by user"""
+    starts = getattr(_local, 'starts', None)
+    if starts is None:
+        starts = _local.starts = {}
+    return starts
+
+
+def before_change(user_id):
+    """Note the version of a loaded index, before a write to the user's data"""
+    index = similar_indexes.peek(user_id)
+    if index is not None:
+        # Deletes send every pre_delete before any post_delete: keep the first.
+        _starts().setdefault(user_id, index.version)
+
+
+def tracking(user_id):
+    """Whether a write of this thread to the user's data started from a loaded index"""
+    return user_id in _starts()
+
+
+def after_change(user_id, previous, token, using, apply=None):
+    """Apply a write to a loaded index once its transaction commits.
+
+    `previous` is the user data version read just before the write set it
+    to `token`. The index takes the change and exactly that token only if
+    it is still at the version the write started from, and no other write
+    bumped the version in between. Otherwise it is marked stale and
+    rebuilt on next use, as it is when the transaction rolls back and the
+    change is never applied.
+    """
+    start = _starts().pop(user_id, None)
+    if start is None or start != previous:
+        start = apply = None
+    if similar_indexes.peek(user_id) is not None:
+        transaction.on_commit(lambda: _commit_change(user_id, start, token, apply), using=using)
+
+
+def _commit_change(user_id, start, token, apply):
+    index = similar_indexes.peek(user_id)
+    if index is None:
+        return
+    with index.lock:
+        if start is not None and index.version == start:
+            if apply is not None:
+                apply(index)
+            index.version = token
+        else:
+            index.version = None
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+from .cache import LRUCache, user_data_version
+
+suggest_cache = LRUCache(settings.RECIPE_SUGGEST_CACHE_SIZE)
+
+
+def query_suggestions(queryset, prefix, limit):
+    """Names starting with `prefix`, most used across the user's recipes first"""
+    rows = queryset.annotate(lower_name=Lower('name')).filter(
+        lower_name__startswith=prefix
+    ).annotate(uses=Count('recipe')).order_by('-uses', 'lower_name', 'id').values('id', 'name', 'uses')[:limit]
+    return list(rows)
+
+
+def suggest(queryset, user, prefix, limit):
+    """Top `limit` names of the user's objects starting with `prefix`, ignoring case.
+
+    Results are cached in process per user data version. While a user
+    types, a cached shorter prefix that matched fewer than `limit` names
+    already holds every answer, so it is filtered in memory instead of
+    querying again.
+    """
+    prefix = prefix.lower()
+    version = user_data_version(user.pk)
+    base = (queryset.model._meta.label, user.pk, version, limit)
+
+    for size in range(len(prefix), 0, -1):
+        rows = suggest_cache.get(base + (prefix[:size],))
+        if rows is None:
+            continue
+        if size == len(prefix):
+            return rows
+        if len(rows) < limit:
+            rows = [row for row in rows if row['name'].lower().startswith(prefix)]
+            suggest_cache.set(base + (prefix,), rows)
+            return rows
+        break
+
+    rows = query_suggestions(queryset.filter(user=user), prefix, limit)
+    suggest_cache.set(base + (prefix,), rows)
+    return rows
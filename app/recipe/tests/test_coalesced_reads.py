@@ -0,0 +1,86 @@
+import threading
+import time
+from unittest.mock import patch
+
+from core.models import Tag
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from recipe.cache import read_flights
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+TAGS_URL = reverse("recipe:tag-list")
+
+
+class CoalescedReadsTests(TestCase):
+    """Test identical concurrent reads share one response"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("coalesce@test.com", "testpass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Tag.objects.create(user=self.user, name="Vegan")
+
+    def get_in_thread(self, results):
+        thread = threading.Thread(target=lambda: results.append(self.client.get(TAGS_URL)))
+        thread.start()
+        return thread
+
+    def running_flight(self):
+        """Lead a flight for the tag list, keyed the way the view keys it"""
+        with patch.object(read_flights, 'complete', wraps=read_flights.complete) as complete:
+            self.client.get(TAGS_URL)
+        key = complete.call_args[0][0]
+        flight, leader = read_flights.join(key)
+        self.assertTrue(leader)
+        self.addCleanup(read_flights.complete, key, flight, None)
+        return key, flight
+
+    def wait_followers(self, flight, count):
+        deadline = time.monotonic() + 1
+        while flight.followers < count and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertEqual(flight.followers, count)
+
+    def test_waiting_reads_share_the_running_response(self):
+        """Test reads arriving while an identical one runs get its response"""
+        key, flight = self.running_flight()
+        results = []
+        # Two, the requests a user may run at once under admission control.
+        threads = [self.get_in_thread(results) for _ in range(2)]
+        self.wait_followers(flight, 2)
+
+        read_flights.complete(key, flight, Response([{"name": "Shared"}]))
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([(r.status_code, r.data) for r in results], [(status.HTTP_200_OK, [{"name": "Shared"}])] * 2)
+
+    @override_settings(RECIPE_COALESCE_TIMEOUT=0.01)
+    def test_timeout_falls_back_to_own_response(self):
+        """Test a read computes its own response when the running one is too slow"""
+        key, flight = self.running_flight()
+
+        resp = self.client.get(TAGS_URL)
+
+        self.assertEqual([tag["name"] for tag in resp.data], ["Vegan"])
+
+    def test_flight_ends_with_the_request(self):
+        """Test a finished read leaves nothing in flight, and writes are not coalesced"""
+        self.client.get(TAGS_URL)
+        self.client.post(TAGS_URL, {"name": "Dinner"})
+        self.client.get(reverse("recipe:recipe-detail", args=[999]))
+
+        self.assertEqual(read_flights.stats()["in_flight"], 0)
+
+    def test_key_bounded_by_query_length(self):
+        """Test a long query is keyed by its digest, the same in any parameter order"""
+        with patch.object(read_flights, 'join', wraps=read_flights.join) as join:
+            self.client.get(TAGS_URL, {"q": "x" * 1000, "limit": 5})
+            self.client.get(TAGS_URL + "?limit=5&q=" + "x" * 1000)
+
+        first, second = (call[0][0] for call in join.call_args_list)
+        self.assertEqual(first, second)
+        self.assertLess(len(repr(first)), 200)
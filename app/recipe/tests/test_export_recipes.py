@@ -0,0 +1,80 @@
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import skipIf
+
+from core.models import Recipe, Tag, Ingredient
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from recipe import export
+
+
+@skipIf(export.pyarrow is None, 'pyarrow is not installed')
+class ExportRecipesCommandTests(TransactionTestCase):
+    """Test the columnar recipe snapshot command"""
+    # Committed rows, so forked export workers see them on their own connections.
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('export@test.com', 'testpass')
+        self.other = get_user_model().objects.create_user('other@test.com', 'testpass')
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        dinner = Tag.objects.create(user=self.user, name='Dinner')
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        self.curry = Recipe.objects.create(user=self.user, title='Curry', time_minutes=30, price=Decimal('5.50'))
+        self.curry.tags.add(vegan, dinner)
+        self.curry.ingredients.add(rice)
+        self.soup = Recipe.objects.create(user=self.other, title='Soup', time_minutes=10, price=Decimal('2.00'))
+        self.salad = Recipe.objects.create(user=self.user, title='Salad', time_minutes=5, price=Decimal('3.00'))
+        self.salad.tags.add(vegan)
+        self.tags = (vegan.pk, dinner.pk)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for root, dirs, files in os.walk(self.directory, topdown=False):
+            for name in files:
+                os.remove(os.path.join(root, name))
+            os.rmdir(root)
+
+    def run_export(self, name, *args):
+        path = os.path.join(self.directory, name)
+        call_command('export_recipes', path, *args, stdout=StringIO())
+        return path
+
+    def test_export_parquet(self):
+        """Test every recipe is written with its tag and ingredient ids as lists"""
+        path = self.run_export('recipes.parquet', '--chunk-size', '2')
+
+        table = export.pyarrow.parquet.read_table(path)
+
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(export.pyarrow.parquet.ParquetFile(path).num_row_groups, 2)
+        rows = {row['title']: row for row in table.to_pylist()}
+        self.assertEqual(rows['Curry']['tag_ids'], sorted(self.tags))
+        self.assertEqual(rows['Curry']['ingredient_ids'], [Ingredient.objects.get().pk])
+        self.assertEqual(rows['Curry']['price'], Decimal('5.50'))
+        self.assertEqual(rows['Soup']['tag_ids'], [])
+        self.assertEqual(rows['Salad']['tag_ids'], [self.tags[0]])
+
+    def test_export_user_arrow(self):
+        """Test a user scoped snapshot in Arrow IPC format"""
+        path = self.run_export('recipes.arrow', '--user', self.user.email)
+
+        table = export.pyarrow.ipc.open_file(path).read_all()
+
+        self.assertEqual(table.column('title').to_pylist(), ['Curry', 'Salad'])
+        self.assertEqual(set(table.column('user_id').to_pylist()), {self.user.pk})
+
+    def test_export_parallel_parts(self):
+        """Test id ranges exported in parallel add up to the whole table"""
+        path = self.run_export('snapshot', '--workers', '2')
+
+        files = sorted(os.listdir(path))
+        tables = [export.pyarrow.parquet.read_table(os.path.join(path, name)) for name in files]
+
+        self.assertEqual(files, ['part-00000.parquet', 'part-00001.parquet'])
+        self.assertEqual(
+            sorted(title for table in tables for title in table.column('title').to_pylist()),
+            ['Curry', 'Salad', 'Soup'],
+        )
@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import skipUnless
+
+from core.models import Recipe, Tag, Ingredient, ImportCheckpoint
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from recipe.importer import user_shard
+
+CSV_HEADER = 'user,title,time_minutes,price,link,tags,ingredients\n'
+
+
+class ImportRecipesCommandTests(TestCase):
+    """Test the bulk recipe import command"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('import@test.com', 'testpass')
+        self.other = get_user_model().objects.create_user('other@test.com', 'testpass')
+
+    def write(self, content, suffix='.csv'):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as source:
+            source.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def run_import(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_recipes', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_csv_upserts_tags_and_ingredients(self):
+        """Test existing tags are reused and new names are created once"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        path = self.write(CSV_HEADER + (
+            'import@test.com,Curry,30,5.50,,Vegan|Dinner,Rice|Tofu\n'
+            'import@test.com,Salad,10,3.00,,Vegan,Tofu\n'
+            'unknown@test.com,Soup,20,2.00,,,\n'
+        ))
+
+        out, err = self.run_import(path, '--batch-size', '2')
+
+        self.assertIn('imported 2 recipes, 1 rows for unknown users', out)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 2)
+        curry = Recipe.objects.get(title='Curry')
+        self.assertEqual(curry.user, self.user)
+        self.assertEqual(str(curry.price), '5.50')
+        self.assertEqual(sorted(curry.tags.values_list('name', flat=True)), ['Dinner', 'Vegan'])
+        self.assertEqual(list(Recipe.objects.get(title='Salad').tags.all()), [vegan])
+
+    def test_import_ndjson_skips_invalid_rows(self):
+        """Test invalid rows are reported and the rest imported"""
+        rows = [
+            {'user': 'import@test.com', 'title': 'Toast', 'time_minutes': 5, 'tags': ['Breakfast']},
+            {'user': 'import@test.com', 'title': 'Broken', 'time_minutes': 'soon'},
+            {'user': 'import@test.com', 'title': 'Spelled', 'time_minutes': 5, 'tags': 'Breakfast'},
+            {'user': 'import@test.com', 'title': 'Refund', 'time_minutes': 5, 'price': -1},
+            {'user': 'import@test.com', 'title': 'Free', 'time_minutes': 5, 'price': 0},
+        ]
+        lines = [json.dumps(row) + '\n' for row in rows]
+        lines[1:1] = ['{"user": "import@test.com", "title": \n', '["not", "an", "object"]\n']
+        path = self.write(''.join(lines), suffix='.ndjson')
+
+        out, err = self.run_import(path)
+
+        self.assertIn('imported 2 recipes', out)
+        self.assertIn('5 invalid rows', out)
+        for position in (2, 3, 4, 5, 6):
+            self.assertIn('Row %d skipped' % position, err)
+        self.assertEqual(sorted(Recipe.objects.values_list('title', flat=True)), ['Free', 'Toast'])
+        self.assertEqual(str(Recipe.objects.get(title='Free').price), '0.00')
+
+    def test_import_resumes_after_checkpoint(self):
+        """Test a second run skips the rows already committed"""
+        path = self.write(CSV_HEADER + 'import@test.com,Curry,30,5.50,,,\n')
+        self.run_import(path, '--checkpoint-key', 'resume')
+        with open(path, 'a') as source:
+            source.write('import@test.com,Salad,10,3.00,,,\n')
+
+        out, err = self.run_import(path, '--checkpoint-key', 'resume')
+
+        self.assertIn('resumed after row 1', out)
+        self.assertEqual(Recipe.objects.filter(title='Curry').count(), 1)
+        self.assertTrue(Recipe.objects.filter(title='Salad').exists())
+        self.assertEqual(ImportCheckpoint.objects.get(key='resume').position, 2)
+
+    def test_import_single_shard(self):
+        """Test only the users of the requested shard are imported"""
+        path = self.write(CSV_HEADER + (
+            'import@test.com,Curry,30,5.50,,,\n'
+            'other@test.com,Salad,10,3.00,,,\n'
+        ))
+        shard = user_shard('import@test.com', 64)
+        self.assertNotEqual(shard, user_shard('other@test.com', 64))
+
+        self.run_import(path, '--shards', '64', '--shard', str(shard))
+
+        self.assertEqual(list(Recipe.objects.values_list('title', flat=True)), ['Curry'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY is PostgreSQL specific')
+    def test_copy_keeps_empty_link(self):
+        """Test rows without a link are copied with an empty link, not NULL"""
+        path = self.write(CSV_HEADER + 'import@test.com,Curry,30,5.50,,,\n')
+
+        out, err = self.run_import(path)
+
+        self.assertIn('imported 1 recipes', out)
+        self.assertEqual(Recipe.objects.get(title='Curry').link, '')
+        self.assertFalse(Recipe.objects.get(title='Curry').image)
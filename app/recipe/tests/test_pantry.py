@@ -0,0 +1,98 @@
+import random
+from unittest.mock import patch
+
+from core.models import Recipe, Ingredient
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from recipe.pantry import PantryIndex, pantry_indexes
+from rest_framework import status
+from rest_framework.test import APIClient
+
+COOKABLE_URL = reverse("recipe:recipe-cookable")
+
+
+def sample_recipe(user, title, ingredients=()):
+    recipe = Recipe.objects.create(user=user, title=title, time_minutes=10, price=5)
+    recipe.ingredients.add(*ingredients)
+    return recipe
+
+
+class PantryIndexTests(TestCase):
+    def test_matches_brute_force(self):
+        """Test bitset counting returns the recipes missing at most k ingredients"""
+        rng = random.Random(11)
+        recipes = {recipe_id: set(rng.sample(range(1, 60), rng.randint(0, 6))) for recipe_id in range(1, 400)}
+        links = [(recipe_id, pk) for recipe_id, pks in recipes.items() for pk in pks]
+        index = PantryIndex('v1', sorted(recipes), links)
+        pantry = set(rng.sample(range(1, 60), 30))
+
+        for max_missing in (0, 1, 3):
+            expected = sorted(
+                (len(pks - pantry), recipe_id, sorted(pks - pantry))
+                for recipe_id, pks in recipes.items() if len(pks - pantry) <= max_missing
+            )
+            count, results = index.cookable(pantry, max_missing)
+            self.assertEqual(count, len(expected))
+            self.assertEqual(
+                [(recipe_id, sorted(missing)) for recipe_id, missing in results],
+                [(recipe_id, missing) for _, recipe_id, missing in expected],
+            )
+            self.assertEqual(index.cookable(pantry, max_missing, limit=5), (count, results[:5]))
+
+
+class CookableApiTests(TestCase):
+    """Test the cookable recipes action"""
+
+    def setUp(self):
+        pantry_indexes.clear()
+        self.user = get_user_model().objects.create_user("pantry@test.com", "testpass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.rice = Ingredient.objects.create(user=self.user, name="Rice")
+        self.beans = Ingredient.objects.create(user=self.user, name="Beans")
+        self.lime = Ingredient.objects.create(user=self.user, name="Lime")
+        self.plain = sample_recipe(self.user, "Plain rice", [self.rice])
+        self.burrito = sample_recipe(self.user, "Burrito", [self.rice, self.beans])
+        self.bowl = sample_recipe(self.user, "Bowl", [self.rice, self.beans, self.lime])
+
+    def cookable(self, *pantry, **params):
+        return self.client.get(COOKABLE_URL, dict(params, pantry=",".join(str(item.pk) for item in pantry)))
+
+    def test_cookable_from_pantry(self):
+        """Test only recipes whose ingredients are all in the pantry are listed"""
+        other = get_user_model().objects.create_user("other@test.com", "testpass")
+        sample_recipe(other, "Copy", [Ingredient.objects.create(user=other, name="Rice")])
+
+        resp = self.cookable(self.rice, self.beans)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data["count"], 2)
+        self.assertEqual([r["title"] for r in resp.data["results"]], ["Plain rice", "Burrito"])
+
+    def test_missing_ingredients(self):
+        """Test recipes lacking up to `missing` ingredients come fewest missing first"""
+        resp = self.cookable(self.rice, missing=2, limit=2)
+
+        self.assertEqual(resp.data["count"], 3)
+        self.assertEqual(
+            [(r["title"], r["missing_ingredients"]) for r in resp.data["results"]],
+            [("Plain rice", []), ("Burrito", [self.beans.pk])],
+        )
+
+    def test_index_rebuilt_after_change(self):
+        """Test the index is reused until the user's recipes change"""
+        with patch.object(PantryIndex, 'build', wraps=PantryIndex.build) as build:
+            self.cookable(self.rice)
+            self.cookable(self.rice, self.beans)
+            self.burrito.ingredients.add(self.lime)
+            resp = self.cookable(self.rice, self.beans)
+
+        self.assertEqual(build.call_count, 2)
+        self.assertEqual([r["title"] for r in resp.data["results"]], ["Plain rice"])
+
+    def test_invalid_params(self):
+        """Test a missing pantry or out of range parameters are rejected"""
+        self.assertEqual(self.client.get(COOKABLE_URL).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.cookable(self.rice, missing=99).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.cookable(self.rice, limit=0).status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,15 +1,22 @@
 from core.models import Recipe, Tag, Ingredient
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache.backends.base import CacheKeyWarning
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from recipe.serializers import RecipeSerializer, RecipeDetailsSerializer
+from recipe.views import RecipeViewSet
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 import tempfile
 import os
+import warnings
+from unittest import skipUnless
 from PIL import Image
 
 RECIPES_URL = reverse("recipe:recipe-list")
+RECIPES_STATS_URL = reverse("recipe:recipe-stats")
 
 
 # api/recipe/recipes
@@ -185,6 +192,58 @@ class PrivateRecipeApiTest(TestCase):
         self.assertEqual(len(tags), 1)
         self.assertIn(new_tag, tags)
 
+    def test_create_recipe_related_queries_batched(self):
+        """Test tags and ingredients are resolved and linked in bulk"""
+        tags = [sample_tag(self.user, name=f'Tag {i}') for i in range(5)]
+        ingredients = [sample_ingredient(self.user, name=f'Ingredient {i}') for i in range(5)]
+        payload = {
+            'title': 'Bulk linked recipe',
+            'tags': [tag.id for tag in tags],
+            'ingredients': [ingredient.id for ingredient in ingredients],
+            'time_minutes': 20,
+            'price': 5.00
+        }
+
+        # Resolve tags, resolve ingredients, insert recipe, two bulk link inserts, two reads for the response.
+        with self.assertNumQueries(7):
+            resp = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=resp.data['id'])
+        self.assertEqual(set(recipe.tags.all()), set(tags))
+        self.assertEqual(set(recipe.ingredients.all()), set(ingredients))
+
+    def test_update_recipe_related_diff_batched(self):
+        """Test updating tags applies the diff with one delete and one insert"""
+        recipe = sample_recipe(user=self.user)
+        kept, removed = sample_tag(self.user, name='Kept'), sample_tag(self.user, name='Removed')
+        recipe.tags.add(kept, removed)
+        added = [sample_tag(self.user, name=f'Added {i}') for i in range(3)]
+        url = recipe_details_url(recipe_id=recipe.id)
+
+        # Load recipe, resolve tags, update row, read links, delete, insert, two reads for the response.
+        with self.assertNumQueries(8):
+            resp = self.client.patch(url, {'tags': [kept.id] + [tag.id for tag in added]})
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(recipe.tags.all()), {kept, *added})
+
+    def test_create_recipe_other_user_tag_rejected(self):
+        """Test tags of another user can not be linked to a recipe"""
+        user2 = get_user_model().objects.create(email='other@test.com', name='other')
+        payload = {
+            'title': 'Borrowed tag',
+            'tags': [sample_tag(user2).id],
+            'time_minutes': 20,
+            'price': 5.00
+        }
+
+        resp = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', resp.data)
+        self.assertFalse(Recipe.objects.filter(title='Borrowed tag').exists())
+
     def test_filter_recipe_by_tags(self):
         """Test returning  recipes by given tag"""
         recipe1 = sample_recipe(self.user, title="Thai vegetable curry")
@@ -225,6 +284,176 @@ class PrivateRecipeApiTest(TestCase):
         self.assertIn(serializer2.data, resp.data)
         self.assertNotIn(serializer3.data, resp.data)
 
+    def test_recipe_stats(self):
+        """Test totals and tag histogram in a single query"""
+        vegan = sample_tag(self.user, name="Vegan")
+        dessert = sample_tag(self.user, name="Dessert")
+        recipe1 = sample_recipe(self.user, price=4.00, time_minutes=10)
+        recipe2 = sample_recipe(self.user, price=8.00, time_minutes=30)
+        sample_recipe(self.user, price=12.00, time_minutes=50)
+        recipe1.tags.add(vegan, dessert)
+        recipe2.tags.add(vegan)
+        sample_recipe(get_user_model().objects.create(email='stats@test.com'), price=99.00)
+
+        with self.assertNumQueries(1):
+            resp = self.client.get(RECIPES_STATS_URL)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data['count'], 3)
+        self.assertEqual(resp.data['price'], {'avg': '8.00', 'min': '4.00', 'max': '12.00'})
+        self.assertEqual(resp.data['time_minutes'], {'avg': 30.0, 'min': 10, 'max': 50})
+        self.assertEqual(resp.data['tags'], [
+            {'id': vegan.id, 'name': 'Vegan', 'count': 2},
+            {'id': dessert.id, 'name': 'Dessert', 'count': 1},
+        ])
+
+    def test_recipe_stats_filtered_and_cached(self):
+        """Test stats honour filters and are cached until the data changes"""
+        vegan = sample_tag(self.user, name="Vegan")
+        recipe = sample_recipe(self.user, price=4.00)
+        recipe.tags.add(vegan)
+        sample_recipe(self.user, price=6.00)
+
+        resp = self.client.get(RECIPES_STATS_URL, {'tags': f'{vegan.id}'})
+        self.assertEqual(resp.data['count'], 1)
+        with self.assertNumQueries(0):
+            self.client.get(RECIPES_STATS_URL, {'tags': f'{vegan.id}'})
+
+        sample_recipe(self.user, price=2.00).tags.add(vegan)
+        resp = self.client.get(RECIPES_STATS_URL, {'tags': f'{vegan.id}'})
+        self.assertEqual(resp.data['count'], 2)
+
+    def test_recipe_stats_cache_key_normalized(self):
+        """Test the stats cache key is bounded and ignores parameters that do not filter"""
+        tags = [sample_tag(self.user, name=f"Tag {i}") for i in range(60)]
+        tag_ids = ','.join(str(tag.id) for tag in tags)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            self.client.get(RECIPES_STATS_URL, {'tags': tag_ids, 'max_time': 30})
+            with self.assertNumQueries(0):
+                resp = self.client.get(RECIPES_STATS_URL, {'max_time': 30, 'ordering': '-price', 'tags': tag_ids})
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_recipe_stats_empty(self):
+        """Test stats for a user without recipes"""
+        resp = self.client.get(RECIPES_STATS_URL)
+
+        self.assertEqual(resp.data['count'], 0)
+        self.assertEqual(resp.data['tags'], [])
+
+
+class RecipeQueryParamsTest(TestCase):
+    """Test range, prefix and ordering parameters of the recipe list"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create(
+            email="user.params@test.com",
+            name="Params test"
+        )
+        self.client.force_authenticate(self.user)
+        self.quick = sample_recipe(self.user, title="Quick salad", time_minutes=5, price=4.00)
+        self.cheap = sample_recipe(self.user, title="Quick noodles", time_minutes=15, price=2.50)
+        self.slow = sample_recipe(self.user, title="Slow roast", time_minutes=240, price=25.00)
+
+    def titles(self, params):
+        resp = self.client.get(RECIPES_URL, params)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return [recipe['title'] for recipe in resp.data]
+
+    def test_filter_max_time_and_price_range(self):
+        """Test time and price range parameters"""
+        self.assertEqual(
+            set(self.titles({'max_time': 20, 'max_price': '10'})),
+            {self.quick.title, self.cheap.title}
+        )
+        self.assertEqual(self.titles({'min_price': '3', 'max_price': '5'}), [self.quick.title])
+
+    def test_filter_title_prefix(self):
+        """Test title prefix parameter"""
+        self.assertEqual(set(self.titles({'title__startswith': 'Quick'})), {self.quick.title, self.cheap.title})
+
+    def test_ordering(self):
+        """Test ordering by supported fields, descending with a dash"""
+        self.assertEqual(self.titles({'ordering': 'price'}), [self.cheap.title, self.quick.title, self.slow.title])
+        self.assertEqual(self.titles({'ordering': '-time_minutes'}), [self.slow.title, self.cheap.title, self.quick.title])
+
+    def test_invalid_parameters_rejected(self):
+        """Test invalid parameters return 400 instead of failing"""
+        for params in ({'ordering': 'user'}, {'max_time': 'soon'}, {'max_time': '-1'},
+                       {'min_price': 'NaN'}, {'tags': '1,a'}):
+            resp = self.client.get(RECIPES_URL, params)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def explain(self, params):
+        """Return the query plan of the recipe list for the given parameters"""
+        request = Request(APIRequestFactory().get(RECIPES_URL, params))
+        request.user = self.user
+        view = RecipeViewSet(request=request, format_kwarg=None, action='list')
+        if connection.vendor == 'postgresql':
+            # Tiny test tables would otherwise always be scanned sequentially.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return view.get_queryset().explain()
+
+    def test_max_time_uses_index(self):
+        """Test the time range is answered from the (user, time_minutes) index"""
+        self.assertIn('recipe_user_time_idx', self.explain({'max_time': 20}))
+
+    def test_price_range_and_ordering_use_index(self):
+        """Test price range and ordering use the (user, price) index"""
+        self.assertIn('recipe_user_price_idx', self.explain({'min_price': '1', 'max_price': '10', 'ordering': 'price'}))
+
+    @skipUnless(connection.vendor == 'postgresql', 'LIKE prefix index is PostgreSQL specific')
+    def test_title_prefix_uses_index(self):
+        """Test the title prefix is answered from the pattern ops index"""
+        self.assertIn('recipe_user_title_like_idx', self.explain({'title__startswith': 'Quick'}))
+
+
+class RecipeMultiGetTest(TestCase):
+    """Test fetching the details of several recipes with ?ids="""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create(email="multi.get@test.com", name="Multi get")
+        self.client.force_authenticate(self.user)
+
+    def test_multi_get_preserves_order_and_reports_missing(self):
+        """Test recipes come back in the requested order with missing ids listed"""
+        first = sample_recipe(self.user, title="First")
+        second = sample_recipe(self.user, title="Second")
+        second.tags.add(sample_tag(self.user))
+        second.ingredients.add(sample_ingredient(self.user))
+        other = sample_recipe(get_user_model().objects.create(email="other@test.com"), title="Other")
+
+        resp = self.client.get(RECIPES_URL, {'ids': '%d,%d,%d,%d,999' % (second.id, first.id, other.id, second.id)})
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([recipe['title'] for recipe in resp.data['results']], ['Second', 'First'])
+        self.assertEqual(resp.data['results'][0], RecipeDetailsSerializer(second).data)
+        self.assertEqual(resp.data['missing'], [other.id, 999])
+
+    def test_multi_get_constant_queries(self):
+        """Test the number of queries does not grow with the batch"""
+        ids = []
+        for i in range(10):
+            recipe = sample_recipe(self.user, title="Recipe %d" % i)
+            recipe.tags.add(sample_tag(self.user, name="Tag %d" % i))
+            ids.append(str(recipe.id))
+
+        with self.assertNumQueries(3):
+            resp = self.client.get(RECIPES_URL, {'ids': ','.join(ids)})
+
+        self.assertEqual(len(resp.data['results']), 10)
+
+    @override_settings(RECIPE_MULTI_GET_MAX_IDS=2)
+    def test_multi_get_max_batch(self):
+        """Test batches above the limit and malformed ids are rejected"""
+        self.assertEqual(self.client.get(RECIPES_URL, {'ids': '1,2,3'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(RECIPES_URL, {'ids': '1,x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class RecipeImageUploadTest(TestCase):
     def setUp(self):
@@ -262,3 +491,55 @@ class RecipeImageUploadTest(TestCase):
         resp = self.client.post(url, {'image': 'testdata'}, format='multipart')
 
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=1024)
+    def test_upload_image_too_large(self):
+        """Test image larger than the upload limit is rejected while streaming"""
+        url = upload_image_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.png') as ntf:
+            ntf.write(b'\x89PNG\r\n\x1a\n' + os.urandom(4096))
+            ntf.seek(0)
+            resp = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(resp.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertIn('image', resp.data)
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_image_invalid_content(self):
+        """Test file that is not an image is rejected from its first bytes"""
+        url = upload_image_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            ntf.write(b'this is not an image at all' * 10)
+            ntf.seek(0)
+            resp = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_image_header_after_large_metadata(self):
+        """Test a photo whose EXIF segment pushes the header past the first probe is accepted"""
+        url = upload_image_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img = Image.new('RGB', (10, 10))
+            img.save(ntf, format='JPEG', exif=b'Exif\x00\x00' + b'\x00' * 65000)
+            self.assertGreater(ntf.tell(), 65536)
+            ntf.seek(0)
+            resp = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=50)
+    def test_upload_image_dimensions_too_large(self):
+        """Test image declaring too many pixels is rejected from its header"""
+        url = upload_image_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img = Image.new('RGB', (10, 10))
+            img.save(ntf, format='JPEG')
+            ntf.seek(0)
+            resp = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.recipe.image)
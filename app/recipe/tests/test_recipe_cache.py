@@ -0,0 +1,151 @@
+import gzip
+import json
+from unittest.mock import patch
+
+from core import compression
+from core.models import Recipe, Tag, Ingredient
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from recipe.cache import recipe_cache, LRUCache
+from rest_framework import status
+from rest_framework.test import APIClient
+
+METRICS_URL = reverse("metrics")
+
+
+def recipe_details_url(recipe_id):
+    """Retrieve recipe details"""
+    return reverse("recipe:recipe-detail", args=[recipe_id])
+
+
+def sample_recipe(user, **param):
+    """Create and return a sample recipe"""
+    default = {
+        "title": "SampleRecipe",
+        "time_minutes": 10,
+        "price": 10.00
+    }
+    default.update(param)
+    return Recipe.objects.create(user=user, **default)
+
+
+class LRUCacheTests(TestCase):
+    def test_evicts_least_recently_used(self):
+        """Test the oldest untouched entry is evicted and counted"""
+        lru = LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        stats = lru.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+
+
+class RecipeResponseCacheTests(TestCase):
+    """Test the cached recipe detail responses"""
+
+    def setUp(self):
+        recipe_cache.clear()
+        caches[recipe_cache.alias].clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create(
+            email="cache.user@test.com",
+            name="Cache user"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_retrieve_served_from_cache(self):
+        """Test a second retrieve does not hit the database"""
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        url = recipe_details_url(recipe.id)
+
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data, second.data)
+
+    def test_tag_rename_invalidates_only_dependent_recipes(self):
+        """Test editing a tag invalidates exactly the recipes showing it"""
+        renamed = Tag.objects.create(user=self.user, name='Vegan')
+        other = Tag.objects.create(user=self.user, name='Dessert')
+        recipe1 = sample_recipe(self.user, title='Curry')
+        recipe2 = sample_recipe(self.user, title='Cake')
+        recipe1.tags.add(renamed)
+        recipe2.tags.add(other)
+        self.client.get(recipe_details_url(recipe1.id))
+        self.client.get(recipe_details_url(recipe2.id))
+
+        renamed.name = 'Plant based'
+        renamed.save()
+
+        with self.assertNumQueries(0):
+            self.client.get(recipe_details_url(recipe2.id))
+        resp = self.client.get(recipe_details_url(recipe1.id))
+        self.assertEqual(resp.data['tags'][0]['name'], 'Plant based')
+
+    def test_link_change_invalidates_recipe(self):
+        """Test adding an ingredient to a recipe refreshes its payload"""
+        recipe = sample_recipe(self.user)
+        url = recipe_details_url(recipe.id)
+        self.client.get(url)
+
+        recipe.ingredients.add(Ingredient.objects.create(user=self.user, name='Salt'))
+        resp = self.client.get(url)
+
+        self.assertEqual([i['name'] for i in resp.data['ingredients']], ['Salt'])
+
+    def test_cached_recipe_not_served_to_other_user(self):
+        """Test a cached payload is never returned to another user"""
+        recipe = sample_recipe(self.user)
+        self.client.get(recipe_details_url(recipe.id))
+
+        user2 = get_user_model().objects.create(email="other.cache@test.com", name="Other")
+        self.client.force_authenticate(user2)
+        resp = self.client.get(recipe_details_url(recipe.id))
+
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(COMPRESSION_MIN_SIZE=10)
+    def test_cached_retrieve_stored_precompressed(self):
+        """Test a hit sends the stored compressed body without compressing again"""
+        recipe = sample_recipe(self.user, title="A" * 200)
+        url = recipe_details_url(recipe.id)
+
+        with patch('core.compression.compress', wraps=compression.compress) as compress:
+            first = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            second = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual(second['Content-Encoding'], 'gzip')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(json.loads(gzip.decompress(second.content))['title'], "A" * 200)
+        self.assertIn('Accept-Encoding', second['Vary'])
+
+
+class MetricsApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_metrics_staff_only(self):
+        """Test metrics are exposed to staff users only"""
+        user = get_user_model().objects.create(email="metrics.user@test.com", name="User")
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get(METRICS_URL).status_code, status.HTTP_403_FORBIDDEN)
+
+        user.is_staff = True
+        user.save()
+        resp = self.client.get(METRICS_URL)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIn('hit_ratio', resp.data['recipe_cache']['local'])
+        self.assertIn('evictions', resp.data['recipe_cache']['local'])
@@ -0,0 +1,139 @@
+import random
+from unittest.mock import patch
+
+from core.models import Recipe, Tag, Ingredient
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from recipe.cache import bump_user_data_version
+from recipe.similar import SimilarityIndex, similar_indexes
+from rest_framework import status
+from rest_framework.test import APIClient
+
+
+def similar_url(recipe_id):
+    return reverse("recipe:recipe-similar", args=[recipe_id])
+
+
+def sample_recipe(user, title, tags=(), ingredients=()):
+    recipe = Recipe.objects.create(user=user, title=title, time_minutes=10, price=5)
+    recipe.tags.add(*tags)
+    recipe.ingredients.add(*ingredients)
+    return recipe
+
+
+class SimilarityIndexTests(TestCase):
+    def test_top_k_matches_brute_force(self):
+        """Test pruned ranking returns the exact top Jaccard scores"""
+        rng = random.Random(7)
+        index = SimilarityIndex('v1')
+        sets = {}
+        for recipe_id in range(1, 300):
+            sets[recipe_id] = set(rng.sample(range(40), rng.randint(1, 8)))
+            for key in sets[recipe_id]:
+                index.link(recipe_id, key)
+
+        for recipe_id in (1, 50, 299):
+            expected = sorted(
+                ((len(sets[recipe_id] & other) / len(sets[recipe_id] | other), -pk)
+                 for pk, other in sets.items() if pk != recipe_id and sets[recipe_id] & other),
+                reverse=True,
+            )[:5]
+            self.assertEqual(index.similar(recipe_id, 5), [(-pk, score) for score, pk in expected])
+
+    def test_unknown_recipe(self):
+        """Test a recipe outside the index has no result"""
+        self.assertIsNone(SimilarityIndex('v1').similar(1, 5))
+
+
+class SimilarRecipesApiTests(TransactionTestCase):
+    """Test the similar recipes action"""
+    # Committed writes, so index updates queued with on_commit are applied.
+
+    def setUp(self):
+        similar_indexes.clear()
+        self.user = get_user_model().objects.create_user("similar@test.com", "testpass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.vegan = Tag.objects.create(user=self.user, name="Vegan")
+        self.dinner = Tag.objects.create(user=self.user, name="Dinner")
+        self.rice = Ingredient.objects.create(user=self.user, name="Rice")
+        self.curry = sample_recipe(self.user, "Curry", [self.vegan, self.dinner], [self.rice])
+        self.pilaf = sample_recipe(self.user, "Pilaf", [self.vegan, self.dinner], [self.rice])
+        self.salad = sample_recipe(self.user, "Salad", [self.vegan])
+        sample_recipe(self.user, "Toast")
+
+    def test_similar_ranked_by_shared_tags_and_ingredients(self):
+        """Test recipes are ranked by Jaccard similarity, unrelated ones left out"""
+        other = get_user_model().objects.create_user("other@test.com", "testpass")
+        sample_recipe(other, "Copy", [Tag.objects.create(user=other, name="Vegan")])
+
+        resp = self.client.get(similar_url(self.curry.pk))
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([(r["title"], r["similarity"]) for r in resp.data], [("Pilaf", 1.0), ("Salad", 0.3333)])
+
+    def test_index_follows_link_changes(self):
+        """Test tag changes update the loaded index instead of rebuilding it"""
+        with patch.object(SimilarityIndex, 'build', wraps=SimilarityIndex.build) as build:
+            self.client.get(similar_url(self.curry.pk))
+            self.salad.tags.add(self.dinner)
+            self.salad.ingredients.add(self.rice)
+            self.pilaf.tags.remove(self.vegan)
+            resp = self.client.get(similar_url(self.curry.pk))
+
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual([(r["title"], r["similarity"]) for r in resp.data], [("Salad", 1.0), ("Pilaf", 0.6667)])
+
+    def test_index_follows_deletes(self):
+        """Test deleted recipes and tags drop out of the results"""
+        self.client.get(similar_url(self.curry.pk))
+        self.pilaf.delete()
+        self.dinner.delete()
+
+        resp = self.client.get(similar_url(self.curry.pk))
+
+        self.assertEqual([(r["title"], r["similarity"]) for r in resp.data], [("Salad", 0.5)])
+
+    def test_rolled_back_changes_not_kept(self):
+        """Test a rolled back write leaves no trace in the index"""
+        self.client.get(similar_url(self.curry.pk))
+        with transaction.atomic():
+            self.salad.tags.add(self.dinner)
+            self.salad.ingredients.add(self.rice)
+            transaction.set_rollback(True)
+
+        resp = self.client.get(similar_url(self.curry.pk))
+
+        self.assertEqual([(r["title"], r["similarity"]) for r in resp.data], [("Pilaf", 1.0), ("Salad", 0.3333)])
+
+    def test_concurrent_bump_forces_rebuild(self):
+        """Test the index is rebuilt when another process changed the data during a write"""
+        self.client.get(similar_url(self.curry.pk))
+
+        # Another process writes, adding Dinner to Salad, between this write's signals.
+        def other_process(sender, action, **kwargs):
+            if action == 'pre_add':
+                Recipe.tags.through.objects.create(recipe=self.salad, tag=self.dinner)
+                bump_user_data_version(self.user.pk)
+
+        m2m_changed.connect(other_process, sender=Recipe.ingredients.through)
+        self.addCleanup(m2m_changed.disconnect, other_process, sender=Recipe.ingredients.through)
+        with patch.object(SimilarityIndex, 'build', wraps=SimilarityIndex.build) as build:
+            self.salad.ingredients.add(self.rice)
+            resp = self.client.get(similar_url(self.curry.pk))
+
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual([(r["title"], r["similarity"]) for r in resp.data], [("Pilaf", 1.0), ("Salad", 1.0)])
+
+    def test_other_users_recipe_not_found(self):
+        """Test another user's recipe is a 404"""
+        other = get_user_model().objects.create_user("other@test.com", "testpass")
+        recipe = sample_recipe(other, "Copy")
+
+        self.assertEqual(self.client.get(similar_url(recipe.pk)).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(
+            self.client.get(similar_url(self.curry.pk), {"limit": 0}).status_code, status.HTTP_400_BAD_REQUEST
+        )
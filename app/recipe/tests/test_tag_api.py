@@ -1,4 +1,4 @@
-from core.models import Tag
+from core.models import Tag, Recipe
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.urls import reverse
@@ -7,6 +7,7 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 TAGS_URL = reverse("recipe:tag-list")
+SUGGEST_URL = reverse("recipe:tag-suggest")
 
 
 class PublicTagsTests(TestCase):
@@ -70,3 +71,68 @@ class PrivateTagsTests(TestCase):
         exists = Tag.objects.filter(user=self.user, name=payload['name']).exists()
 
         self.assertTrue(exists)
+
+    def test_create_tag_existing_name(self):
+        """Test creating a tag twice returns the existing tag"""
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+
+        resp = self.client.post(TAGS_URL, {"name": "vegan"})
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data, {"id": tag.id, "name": "Vegan"})
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_create_tag_same_name_other_user(self):
+        """Test tag names are only unique per user"""
+        other = get_user_model().objects.create_user("other@test.com", "testpass")
+        Tag.objects.create(user=other, name="Vegan")
+
+        resp = self.client.post(TAGS_URL, {"name": "Vegan"})
+
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.get(id=resp.data['id']).user, self.user)
+
+    def test_suggest_tags_by_usage(self):
+        """Test suggestions match the prefix ignoring case, most used first"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        vegetarian = Tag.objects.create(user=self.user, name="vegetarian")
+        Tag.objects.create(user=self.user, name="Dinner")
+        other = get_user_model().objects.create_user("other@test.com", "testpass")
+        Tag.objects.create(user=other, name="Veggie")
+        for title in ("Curry", "Salad"):
+            recipe = Recipe.objects.create(user=self.user, title=title, time_minutes=5, price=1)
+            recipe.tags.add(vegetarian)
+
+        resp = self.client.get(SUGGEST_URL, {"q": "VEG"})
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data, [
+            {"id": vegetarian.id, "name": "vegetarian", "uses": 2},
+            {"id": vegan.id, "name": "Vegan", "uses": 0},
+        ])
+
+    def test_suggest_longer_prefix_from_cache(self):
+        """Test typing further reuses a complete cached result"""
+        Tag.objects.create(user=self.user, name="Vegan")
+        Tag.objects.create(user=self.user, name="Vegetarian")
+        self.client.get(SUGGEST_URL, {"q": "ve"})
+
+        with self.assertNumQueries(0):
+            resp = self.client.get(SUGGEST_URL, {"q": "vegan"})
+
+        self.assertEqual([tag["name"] for tag in resp.data], ["Vegan"])
+
+    def test_suggest_sees_new_tags(self):
+        """Test creating a tag invalidates cached suggestions"""
+        self.client.get(SUGGEST_URL, {"q": "ve"})
+        self.client.post(TAGS_URL, {"name": "Vegan"})
+
+        resp = self.client.get(SUGGEST_URL, {"q": "ve"})
+
+        self.assertEqual([tag["name"] for tag in resp.data], ["Vegan"])
+
+    def test_suggest_invalid_params(self):
+        """Test a prefix is required and limit is bounded"""
+        self.assertEqual(self.client.get(SUGGEST_URL).status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get(SUGGEST_URL, {"q": "ve", "limit": "1000"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,130 @@
+import io
+import warnings
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+# Leading bytes of the image formats accepted for recipes.
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+)
+# Room left for the multipart boundaries and headers around the file itself.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def sniff_image_type(head):
+    """Return the image format from the first bytes of a file, or None"""
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def read_dimensions(head):
+    """Parse only the image header and return (width, height), or None if
+    more data is needed. Pixel data is never decoded."""
+    # Pillow is imported on first upload rather than at worker start.
+    from PIL import Image
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+        try:
+            with Image.open(io.BytesIO(head)) as img:
+                return img.size
+        except Image.DecompressionBombError:
+            return float('inf'), 1
+        except Exception:
+            return None
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Validate a recipe image while it streams in.
+
+    Sits in front of Django's default handlers and passes chunks through,
+    but aborts the upload as soon as the file is too large, is not one of
+    the accepted image formats, or declares decompression-bomb dimensions.
+    The header is looked for in the first RECIPE_IMAGE_HEADER_PROBE_SIZE
+    bytes, and again in twice as many while metadata such as large EXIF or
+    ICC segments keeps it out of reach. The reason is kept on `error` /
+    `status_code` for the view to report.
+    """
+
+    def __init__(self, request=None, field_name='image'):
+        super().__init__(request)
+        self.field_name = field_name
+        self.max_size = settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE
+        self.max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        self.probe_size = settings.RECIPE_IMAGE_HEADER_PROBE_SIZE
+        self.error = None
+        self.status_code = None
+        self.active = False
+
+    def fail(self, message, status_code=400):
+        self.error = message
+        self.status_code = status_code
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > self.max_size + MULTIPART_OVERHEAD:
+            self.fail('Image exceeds the maximum upload size of %d bytes.' % self.max_size, 413)
+            # Returning a result skips parsing, the body is never read.
+            return QueryDict(), MultiValueDict()
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.active = field_name == self.field_name
+        self.received = 0
+        self.head = b''
+        self.next_probe = self.probe_size
+        self.validated = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.fail('Image exceeds the maximum upload size of %d bytes.' % self.max_size, 413)
+            raise StopUpload(connection_reset=True)
+
+        if not self.validated:
+            self.head += raw_data
+            if len(self.head) >= self.next_probe:
+                self.next_probe = 2 * len(self.head)
+                self.validate(complete=False)
+        return raw_data
+
+    def validate(self, complete):
+        """Check type and dimensions from the buffered bytes, the whole file when complete"""
+        if sniff_image_type(self.head) is None:
+            if len(self.head) >= 12 or complete:
+                self.fail('Upload a valid image. The file is not a JPEG, PNG, GIF or WEBP image.')
+                raise SkipFile()
+            return
+
+        dimensions = read_dimensions(self.head)
+        if dimensions is None:
+            if complete:
+                self.fail('Upload a valid image. The image header could not be read.')
+                raise SkipFile()
+            return
+
+        width, height = dimensions
+        if width * height > self.max_pixels:
+            self.fail('Image dimensions exceed the limit of %d pixels.' % self.max_pixels)
+            raise SkipFile()
+        self.validated = True
+
+    def file_complete(self, file_size):
+        if self.active and not self.validated and self.error is None:
+            try:
+                self.validate(complete=True)
+            except SkipFile:
+                pass
+        return None
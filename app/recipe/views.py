@@ -1,25 +1,139 @@
+import logging
+from decimal import Decimal
+
 from core import models
+from core.compression import PrecompressedResponse, encode_body, negotiate
+from core.views import UserShardMixin
+from django.core.cache import caches
+from django.conf import settings
+from recipe.cache import query_digest, read_flights, recipe_cache, user_data_version
+from recipe.pantry import cookable_recipes
+from recipe.similar import similar_recipes
+from recipe.stats import recipe_statistics
+from recipe.suggest import suggest
+from recipe.upload_handlers import ImageUploadHandler
 from recipe.serializers import TagSerializer, IngredientSerializer, RecipeSerializer, RecipeDetailsSerializer, \
     RecipeImageSerializer
 from rest_framework import mixins, viewsets, status
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 
+logger = logging.getLogger(__name__)
+
+
+class Coalesced(Exception):
+    """Ends a request with the response of the identical request it waited for"""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class CoalescedReadsMixin:
+    """Let concurrent identical reads share one response.
+
+    GETs of a coalesced action by the same user, for the same path, query,
+    format and content encoding, at the same user data version, wait for
+    the one already running instead of repeating its queries and
+    serialization. A waiter computes its own response when the running
+    one fails or takes longer than `RECIPE_COALESCE_TIMEOUT`.
+    """
+    coalesced_actions = ('list', 'retrieve')
+
+    def coalesce_key(self, request):
+        return (
+            request.user.pk,
+            request.path,
+            query_digest(request.query_params),
+            user_data_version(request.user.pk),
+            request.accepted_renderer.format,
+            request.META.get('HTTP_ACCEPT_ENCODING', ''),
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        self.flight = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Release the waiters when the response was never finalized.
+            self.__complete(None)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method != 'GET' or self.action not in self.coalesced_actions:
+            return
+        key = self.coalesce_key(request)
+        flight, leader = read_flights.join(key)
+        if leader:
+            self.flight = key, flight
+            return
+        response = read_flights.wait(flight, settings.RECIPE_COALESCE_TIMEOUT)
+        if response is not None:
+            raise Coalesced(response)
 
-class BaseRecipeViewSets(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.CreateModelMixin):
+    def handle_exception(self, exc):
+        if isinstance(exc, Coalesced):
+            response = exc.response
+            if isinstance(response, PrecompressedResponse):
+                return PrecompressedResponse(response.data, response.body, response.encoding, response.content_type)
+            return Response(response.data, status=response.status_code)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        self.__complete(response if response.status_code == status.HTTP_200_OK else None)
+        return response
+
+    def __complete(self, response):
+        if self.flight is not None:
+            key, flight = self.flight
+            self.flight = None
+            read_flights.complete(key, flight, response)
+
+
+class BaseRecipeViewSets(UserShardMixin, CoalescedReadsMixin, viewsets.GenericViewSet, mixins.ListModelMixin,
+                         mixins.CreateModelMixin):
     """Base ViewSet for user owned recipe attributes"""
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    coalesced_actions = ('list', 'suggest')
 
     def get_queryset(self):
         """Returns Objects  for the current authentication user only """
         return self.queryset.filter(user=self.request.user).order_by('-name')
 
+    def create(self, request, *args, **kwargs):
+        """Create an object, or return the existing one with the same name"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        created = self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+                        headers=headers)
+
     def perform_create(self, serializer):
         """Create new Objects"""
-        serializer.save(user=self.request.user)
+        serializer.instance, created = self.queryset.model.objects.upsert(
+            self.request.user, serializer.validated_data['name']
+        )
+        return created
+
+    @action(methods=['GET'], detail=False)
+    def suggest(self, request):
+        """Autocomplete names by case insensitive prefix, most used first"""
+        prefix = request.query_params.get('q', '').strip()
+        if not prefix or len(prefix) > 255:
+            raise ValidationError({'q': ['Expected a prefix of 1 to 255 characters.']})
+        try:
+            limit = int(request.query_params.get('limit', settings.RECIPE_SUGGEST_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': ['Expected an integer.']})
+        if not 1 <= limit <= settings.RECIPE_SUGGEST_MAX_LIMIT:
+            raise ValidationError({'limit': ['Expected 1 to %d.' % settings.RECIPE_SUGGEST_MAX_LIMIT]})
+        return Response(suggest(self.queryset, request.user, prefix, limit))
 
 
 class TagViewSets(BaseRecipeViewSets):
@@ -34,42 +148,231 @@ class IngredientViewSet(BaseRecipeViewSets):
     serializer_class = IngredientSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(UserShardMixin, CoalescedReadsMixin, viewsets.ModelViewSet):
     """Manage Recipes in Database"""
     queryset = models.Recipe.objects.all()
     serializer_class = RecipeSerializer
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
-    def __params_to_ints(self, qs):
+    ordering_fields = ('id', 'title', 'price', 'time_minutes')
+    filter_params = ('tags', 'ingredients', 'max_time', 'min_price', 'max_price', 'title__startswith')
+    coalesced_actions = ('list', 'retrieve', 'stats', 'similar', 'cookable')
+    precompressed_formats = ('json', 'msgpack')
+
+    def __params_to_ints(self, qs, name):
         """Convert a list of string IDs to a list of Integers"""
+        try:
+            return [int(str_id) for str_id in qs.split(',')]
+        except ValueError:
+            raise ValidationError({name: ['Expected a comma separated list of ids.']})
+
+    def __param_to_number(self, name, convert):
+        """Parse a numeric query parameter, None when it is absent"""
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        try:
+            number = convert(value)
+        except (ValueError, ArithmeticError):
+            raise ValidationError({name: ['Expected a number.']})
+        if (isinstance(number, Decimal) and not number.is_finite()) or number < 0:
+            raise ValidationError({name: ['Expected a finite, non negative number.']})
+        return number
 
-        return [int(str_id) for str_id in qs.split(',')]
+    def __ordering(self):
+        """Validated `ordering` parameter, e.g. `-price,title`"""
+        ordering = self.request.query_params.get('ordering')
+        if not ordering:
+            return []
+        fields = ordering.split(',')
+        for field in fields:
+            if field.lstrip('-') not in self.ordering_fields:
+                raise ValidationError({'ordering': [f'Ordering by "{field}" is not supported.']})
+        return fields
 
     def get_queryset(self):
-        """Retrieve the recipes for the authenticated user"""
-        tags = self.request.query_params.get("tags")
-        ingredients = self.request.query_params.get("ingredients")
-        queryset = self.queryset
+        """Retrieve the recipes for the authenticated user.
+
+        Range and prefix filters are kept as plain comparisons on
+        `time_minutes`, `price` and `title` next to the user equality so
+        they can be answered from the (user, column) indexes.
+        """
+        params = self.request.query_params
+        tags = params.get("tags")
+        ingredients = params.get("ingredients")
+        queryset = self.queryset.filter(user=self.request.user)
 
         if tags:
-            tag_ids = self.__params_to_ints(tags)
+            tag_ids = self.__params_to_ints(tags, 'tags')
             queryset = queryset.filter(tags__id__in=tag_ids)
         if ingredients:
-            ingredients_ids = self.__params_to_ints(ingredients)
+            ingredients_ids = self.__params_to_ints(ingredients, 'ingredients')
             queryset = queryset.filter(ingredients__id__in=ingredients_ids)
 
-        return queryset.filter(user=self.request.user)
+        max_time = self.__param_to_number('max_time', int)
+        if max_time is not None:
+            queryset = queryset.filter(time_minutes__lte=max_time)
+        min_price = self.__param_to_number('min_price', Decimal)
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        max_price = self.__param_to_number('max_price', Decimal)
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+        title_prefix = params.get('title__startswith')
+        if title_prefix:
+            queryset = queryset.filter(title__startswith=title_prefix)
+
+        ordering = self.__ordering()
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
 
     def get_serializer_class(self):
         """Return appropriate action class"""
-        print(f'Action of application {self.action}')
-        if self.action is 'retrieve':
+        logger.debug('Serializer for recipe action', extra={'action': self.action})
+        if self.action == 'retrieve':
             return RecipeDetailsSerializer
         elif self.action == 'upload_image':
             return RecipeImageSerializer
         return self.serializer_class
 
+    def list(self, request, *args, **kwargs):
+        """List recipes, or fetch the details of several recipes with `?ids=1,2,3`"""
+        if 'ids' in request.query_params:
+            return self.__multi_get(request.query_params['ids'])
+        return super().list(request, *args, **kwargs)
+
+    def __multi_get(self, ids):
+        """Recipe details in the requested order, in three queries whatever the batch size.
+
+        Ids that do not exist or belong to another user are reported as
+        missing. Other filters do not apply to a multi-get.
+        """
+        ids = list(dict.fromkeys(self.__params_to_ints(ids, 'ids')))
+        if len(ids) > settings.RECIPE_MULTI_GET_MAX_IDS:
+            raise ValidationError({'ids': [f'At most {settings.RECIPE_MULTI_GET_MAX_IDS} ids per request.']})
+        recipes = self.queryset.filter(user=self.request.user, pk__in=ids).prefetch_related('tags', 'ingredients')
+        found = {recipe.pk: recipe for recipe in recipes}
+        serializer = RecipeDetailsSerializer(
+            [found[pk] for pk in ids if pk in found], many=True, context=self.get_serializer_context()
+        )
+        return Response({
+            'results': serializer.data,
+            'missing': [pk for pk in ids if pk not in found],
+        })
+
+    def retrieve(self, request, *args, **kwargs):
+        """Return recipe details, served from the response cache when possible"""
+        try:
+            recipe_id = int(kwargs[self.lookup_field])
+        except ValueError:
+            recipe_id = None
+        if recipe_id is None or request.query_params:
+            return super().retrieve(request, *args, **kwargs)
+
+        version = recipe_cache.version(recipe_id)
+        entry = recipe_cache.get(recipe_id, version) if version else None
+        if entry is not None and entry['user'] == request.user.id:
+            return self.__encoded_response(recipe_id, version, entry)
+
+        instance = self.get_object()
+        data = self.get_serializer(instance).data
+        entry = {'user': instance.user_id, 'data': data, 'bodies': {}}
+        if version:
+            dependencies = [('tag', tag['id']) for tag in data['tags']]
+            dependencies += [('ingredient', ingredient['id']) for ingredient in data['ingredients']]
+            recipe_cache.set(recipe_id, version, entry, dependencies)
+        return self.__encoded_response(recipe_id, version, entry)
+
+    def __encoded_response(self, recipe_id, version, entry):
+        """Serve a cache entry as rendered, compressed bytes kept with the entry.
+
+        Each format and content encoding is rendered and compressed once per
+        recipe version; later hits send the stored bytes as they are.
+        """
+        renderer = self.request.accepted_renderer
+        if renderer.format not in self.precompressed_formats:
+            return Response(entry['data'])
+        encoding = negotiate(self.request)
+        key = '%s:%s' % (renderer.format, encoding or 'identity')
+        bodies = entry.setdefault('bodies', {})
+        if key not in bodies:
+            body = renderer.render(entry['data'], self.request.accepted_media_type, self.get_renderer_context())
+            bodies[key] = encode_body(body, encoding)
+            if version:
+                recipe_cache.update(recipe_id, version, entry)
+        body, encoding = bodies[key]
+        return PrecompressedResponse(entry['data'], body, encoding, renderer.media_type)
+
+    @action(methods=['GET'], detail=False)
+    def stats(self, request):
+        """Aggregated statistics for the (filtered) recipes of the user"""
+        cache = caches[settings.RECIPE_CACHE_ALIAS]
+        key = 'recipe:stats:%s:%s:%s' % (
+            request.user.id,
+            user_data_version(request.user.id),
+            query_digest(request.query_params, self.filter_params),
+        )
+        data = cache.get(key)
+        if data is None:
+            data = recipe_statistics(self.get_queryset())
+            cache.set(key, data, settings.RECIPE_CACHE_TIMEOUT)
+        return Response(data)
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """Recipes of the user sharing the most tags and ingredients with this one"""
+        try:
+            limit = int(request.query_params.get('limit', settings.RECIPE_SIMILAR_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': ['Expected an integer.']})
+        if not 1 <= limit <= settings.RECIPE_SIMILAR_MAX_LIMIT:
+            raise ValidationError({'limit': ['Expected 1 to %d.' % settings.RECIPE_SIMILAR_MAX_LIMIT]})
+        try:
+            ranked = similar_recipes(request.user, int(pk), limit)
+        except ValueError:
+            ranked = None
+        if ranked is None:
+            raise NotFound()
+
+        recipes = self.queryset.filter(user=request.user, pk__in=[recipe_id for recipe_id, score in ranked])
+        found = {recipe.pk: recipe for recipe in recipes.prefetch_related('tags', 'ingredients')}
+        results = []
+        for recipe_id, score in ranked:
+            if recipe_id in found:
+                data = RecipeSerializer(found[recipe_id], context=self.get_serializer_context()).data
+                data['similarity'] = round(score, 4)
+                results.append(data)
+        return Response(results)
+
+    @action(methods=['GET'], detail=False)
+    def cookable(self, request):
+        """Recipes of the user cookable from `?pantry=1,2,3`, missing at most `?missing=` ingredients"""
+        pantry = request.query_params.get('pantry')
+        if pantry is None:
+            raise ValidationError({'pantry': ['Expected a comma separated list of ingredient ids.']})
+        pantry = self.__params_to_ints(pantry, 'pantry') if pantry else []
+        max_missing = self.__param_to_number('missing', int) or 0
+        if not 0 <= max_missing <= settings.RECIPE_COOKABLE_MAX_MISSING:
+            raise ValidationError({'missing': ['Expected 0 to %d.' % settings.RECIPE_COOKABLE_MAX_MISSING]})
+        limit = self.__param_to_number('limit', int)
+        if limit is None:
+            limit = settings.RECIPE_COOKABLE_LIMIT
+        if not 1 <= limit <= settings.RECIPE_COOKABLE_MAX_LIMIT:
+            raise ValidationError({'limit': ['Expected 1 to %d.' % settings.RECIPE_COOKABLE_MAX_LIMIT]})
+
+        count, matches = cookable_recipes(request.user, pantry, max_missing, limit)
+        recipes = self.queryset.filter(user=request.user, pk__in=[recipe_id for recipe_id, missing in matches])
+        found = {recipe.pk: recipe for recipe in recipes.prefetch_related('tags', 'ingredients')}
+        results = []
+        for recipe_id, missing in matches:
+            if recipe_id in found:
+                data = RecipeSerializer(found[recipe_id], context=self.get_serializer_context()).data
+                data['missing_ingredients'] = missing
+                results.append(data)
+        return Response({'count': count, 'results': results})
+
     def perform_create(self, serializer):
         """Create a new recipe"""
         serializer.save(user=self.request.user)
@@ -77,10 +380,24 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         """Upload a image to recipe"""
+        # Saved inline rather than on the job queue: the body has to be
+        # received here anyway, validation only reads the image header, and
+        # the one remaining write would have to stage the same bytes where a
+        # worker can read them before it could do anything with them.
         recipe = self.get_object()
+        # Validate while the body streams in, before it is parsed into request.data
+        handler = ImageUploadHandler(request)
+        request.upload_handlers.insert(0, handler)
+        data = request.data
+        if handler.error:
+            return Response(
+                {'image': [handler.error]},
+                status=handler.status_code
+            )
+
         serializer = self.get_serializer(
             recipe,
-            data=request.data
+            data=data
         )
 
         if serializer.is_valid():
@@ -0,0 +1,98 @@
+import logging
+
+from core.models import Recipe, Tag, Ingredient
+from core.shards import using_user
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import router, transaction
+from recipe.cache import recipe_cache, bump_user_data_version
+
+logger = logging.getLogger(__name__)
+
+
+def raw_delete(queryset):
+    """Delete with a single DELETE statement, bypassing the Python side collector"""
+    return queryset._raw_delete(queryset.db)
+
+
+def purge_recipes(user_id, batch_size):
+    """Delete one batch of recipes with their links, return (recipes, files) deleted"""
+    db = router.db_for_write(Recipe)
+    rows = list(
+        Recipe.objects.using(db).filter(user_id=user_id).order_by('pk').values_list('pk', 'image')[:batch_size]
+    )
+    if not rows:
+        return 0, 0
+    ids = [pk for pk, image in rows]
+    with transaction.atomic(using=db):
+        raw_delete(Recipe.tags.through.objects.using(db).filter(recipe_id__in=ids))
+        raw_delete(Recipe.ingredients.through.objects.using(db).filter(recipe_id__in=ids))
+        raw_delete(Recipe.objects.using(db).filter(pk__in=ids))
+    recipe_cache.invalidate(ids)
+
+    # Files go only once the rows referencing them are committed away.
+    files = [image for pk, image in rows if image]
+    for name in files:
+        default_storage.delete(name)
+    return len(ids), len(files)
+
+
+def purge_named(model, field_name, user_id, batch_size):
+    """Delete one batch of the user's tags or ingredients with their links"""
+    db = router.db_for_write(model)
+    ids = list(model.objects.using(db).filter(user_id=user_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return 0
+    through = Recipe._meta.get_field(field_name).remote_field.through
+    target = Recipe._meta.get_field(field_name).m2m_reverse_field_name()
+    with transaction.atomic(using=db):
+        raw_delete(through.objects.using(db).filter(**{'%s__in' % target: ids}))
+        raw_delete(model.objects.using(db).filter(pk__in=ids))
+    return len(ids)
+
+
+def purge_user_rows(user_id, batch_size=None, progress=None):
+    """Remove all data of a user in bounded batches, return the totals.
+
+    Each batch is its own short transaction on the user's shard so locks
+    are held briefly and memory stays flat however many recipes the user
+    has. `progress` is called with the running totals after every batch.
+    """
+    batch_size = batch_size or settings.USER_PURGE_BATCH_SIZE
+    totals = {'recipes': 0, 'files': 0, 'tags': 0, 'ingredients': 0}
+
+    def report(phase):
+        if progress is not None:
+            progress(phase=phase, **totals)
+
+    with using_user(user_id):
+        while True:
+            recipes, files = purge_recipes(user_id, batch_size)
+            if not recipes:
+                break
+            totals['recipes'] += recipes
+            totals['files'] += files
+            report('recipes')
+
+        for model, field_name, key in ((Tag, 'tags', 'tags'), (Ingredient, 'ingredients', 'ingredients')):
+            while True:
+                deleted = purge_named(model, field_name, user_id, batch_size)
+                if not deleted:
+                    break
+                totals[key] += deleted
+                report(key)
+
+    bump_user_data_version(user_id)
+    return totals
+
+
+def purge_user_data(user_id, batch_size=None, progress=None):
+    """Remove a user and all their data, see purge_user_rows"""
+    totals = purge_user_rows(user_id, batch_size, progress)
+    # Only tokens and permission links are left for the collector.
+    get_user_model().objects.filter(pk=user_id).delete()
+    if progress is not None:
+        progress(phase='done', **totals)
+    logger.info('User data purged', extra={'user_id': user_id, **totals})
+    return totals
@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .purge import purge_user_rows
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def purge_deleted_user(sender, instance, **kwargs):
+    """Delete the user's data first: the collector only looks at the user's database, not their shard"""
+    purge_user_rows(instance.pk)
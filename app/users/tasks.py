@@ -0,0 +1,9 @@
+from jobs.queue import task, report_progress
+
+from .purge import purge_user_data
+
+
+@task(name='users.purge_user_data')
+def purge_user_data_task(user_id):
+    """Background part of account deletion, see ManageUserView.destroy"""
+    purge_user_data(user_id, progress=report_progress)
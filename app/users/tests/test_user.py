@@ -1,7 +1,16 @@
+import json
+import tempfile
+
+from core.models import Recipe, Tag, Ingredient
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from jobs.models import Job
+from jobs.queue import run_pending
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 
 CREATE_USER_URL = reverse("users:create")
@@ -147,3 +156,58 @@ class PrivateUserApiTest(TestCase):
         self.assertEqual(resp.data['name'], payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+
+class DeleteUserApiTest(TestCase):
+    """Test account deletion"""
+
+    def setUp(self):
+        self.user = create_user(email="delete.me@test.com",
+                                name="Delete Me",
+                                password="passwordqwe")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_delete_disables_and_queues_purge(self):
+        """Test delete disables the account at once and defers the purge"""
+        Token.objects.create(user=self.user)
+
+        resp = self.client.delete(ME_URL)
+
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        job = Job.objects.get(pk=resp.data['job'])
+        self.assertEqual(job.name, 'users.purge_user_data')
+
+    @override_settings(USER_PURGE_BATCH_SIZE=2, MEDIA_ROOT=tempfile.mkdtemp())
+    def test_purge_deletes_data_in_batches(self):
+        """Test the purge job removes recipes, links, files and the user"""
+        other = create_user(email="keep.me@test.com", password="passwordqwe")
+        kept = Recipe.objects.create(user=other, title="Kept", time_minutes=5)
+        tags = [Tag.objects.create(user=self.user, name=f'Tag {i}') for i in range(3)]
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        image = default_storage.save('uploads/recipe/purge.jpg', ContentFile(b'data'))
+        for i in range(5):
+            recipe = Recipe.objects.create(user=self.user, title=f'Recipe {i}', time_minutes=5)
+            recipe.tags.add(*tags)
+            recipe.ingredients.add(ingredient)
+        Recipe.objects.filter(user=self.user).update(image=image)
+        kept.tags.add(tags[0])
+
+        self.client.delete(ME_URL)
+        run_pending('test-worker', 10)
+
+        self.assertFalse(get_user_model().objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Recipe.objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(Tag.objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(Ingredient.objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(default_storage.exists(image))
+        self.assertEqual(list(kept.tags.all()), [])
+        self.assertTrue(Recipe.objects.filter(pk=kept.pk).exists())
+        job = Job.objects.get(name='users.purge_user_data')
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(json.loads(job.progress), {
+            'phase': 'done', 'recipes': 5, 'files': 5, 'tags': 3, 'ingredients': 1,
+        })
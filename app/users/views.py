@@ -1,14 +1,20 @@
-from rest_framework import generics, authentication, permissions
+from django.db import transaction
+from jobs.queue import enqueue
+from rest_framework import generics, authentication, permissions, status
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
 from .serializers import UserSerializers, AuthTokenSerializer
+from .tasks import purge_user_data_task
 
 
 class CreateTokenViewSets(ObtainAuthToken):
     """Create a new token for user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
 
 
 class CreateUserViewSets(generics.CreateAPIView):
@@ -27,3 +33,14 @@ class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
         """Retrieve or return authentication user object"""
 
         return self.request.user
+
+    def destroy(self, request, *args, **kwargs):
+        """Disable the account now and purge its data in the background"""
+        user = self.get_object()
+        with transaction.atomic():
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+            Token.objects.filter(user=user).delete()
+            job = enqueue(purge_user_data_task, {'user_id': user.pk}, idempotency_key=f'purge-user-{user.pk}')
+
+        return Response({'job': job.pk, 'status': job.status}, status=status.HTTP_202_ACCEPTED)